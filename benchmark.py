@@ -0,0 +1,436 @@
+"""
+REDM 性能基准脚本。
+
+用法示例:
+    python benchmark.py aggregation --path data.csv
+    python benchmark.py ingest --path data.csv --workers 8
+    python benchmark.py snapshot --path data.csv
+    python benchmark.py resp --path data.csv
+    python benchmark.py layout --path data.csv
+    python benchmark.py records --path data.csv --buckets 64
+    python benchmark.py dictionary --path data.csv
+    python benchmark.py compression --path data.csv --methods zlib zstd
+    python benchmark.py rss --path data.csv
+    python benchmark.py pagination --path data.csv
+    python benchmark.py search --path data.csv --query united
+    python benchmark.py browse --path data.csv --max-price 5
+    python benchmark.py order-filters --path data.csv --query germany
+    python benchmark.py projection --path data.csv
+    python benchmark.py record-cache --path data.csv --products 1000 --near-cache tracking
+    python benchmark.py search-cache --path data.csv --query united
+    python benchmark.py generate --products 1000000 --orders 3333334
+"""
+import argparse
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import redis_core as rc
+
+
+def _timed(func, *args, **kwargs):
+    """运行 func 并返回 (结果, 耗时秒数)"""
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+# --- 发票聚合 ---
+
+def _legacy_extract_orders(df):
+    """旧版逐发票 Python 循环实现，仅作为基准对照保留"""
+    orders_data = []
+    for invoice_no, group in df.groupby('InvoiceNo'):
+        if 'C' in str(invoice_no):
+            continue
+        orders_data.append({
+            'order_id': str(invoice_no),
+            'user_id': group['CustomerID'].iloc[0],
+            'order_date': group['InvoiceDate'].iloc[0].isoformat(),
+            'total_amount': (group['Quantity'] * group['UnitPrice']).sum(),
+            'country': group['Country'].iloc[0],
+            'status': random.choice(rc.ONLINE_RETAIL_ORDER_STATUSES),
+            'items': group[['StockCode', 'Description', 'Quantity', 'UnitPrice']].to_dict(orient='records')
+        })
+    return pd.DataFrame(orders_data)
+
+
+def bench_aggregation(args):
+    """对比旧版循环与向量化 _aggregate_invoices 的发票聚合耗时"""
+    lines = rc._clean_online_retail_lines(pd.read_csv(args.path, **rc.ONLINE_RETAIL_READ_OPTIONS))
+    print(f"明细行数: {len(lines)}")
+
+    legacy_orders, legacy_time = _timed(_legacy_extract_orders, lines)
+    (orders_df, items_df), vector_time = _timed(rc._aggregate_invoices, lines)
+
+    print(f"旧版循环:   {legacy_time:8.3f} 秒 ({len(legacy_orders)} 个订单)")
+    print(f"向量化聚合: {vector_time:8.3f} 秒 ({len(orders_df)} 个订单, {len(items_df)} 条订单项)")
+    print(f"加速比: {legacy_time / vector_time:.1f}x")
+
+
+# --- 清洗结果快照 ---
+
+def bench_snapshot(args):
+    """对比完整解析清洗与从 Arrow IPC 快照重新加载的耗时"""
+    rc.clear_snapshot_cache()
+    _, cold_time = _timed(rc.load_and_clean_online_retail_data, seed=args.seed)
+    _, warm_time = _timed(rc.load_and_clean_online_retail_data, seed=args.seed)
+    print(f"首次加载 (解析+清洗+写快照): {cold_time:8.3f} 秒")
+    print(f"快照加载:                    {warm_time:8.3f} 秒")
+    print(f"加速比: {cold_time / warm_time:.1f}x")
+
+
+# --- 并行导入 ---
+
+def bench_ingest(args):
+    """对比单进程 store_data_in_redis 与多进程 store_data_in_redis_parallel 的写入耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+
+    message, _ = rc.store_data_in_redis(*frames, flush_db=True)
+    print(f"单进程: {message}")
+    message, _ = rc.store_data_in_redis_parallel(*frames, flush_db=True, workers=args.workers)
+    print(f"多进程: {message}")
+
+
+# --- RESP 批量导入 ---
+
+def bench_resp(args):
+    """对比 pipeline 写入、RESP socket 直写，以及 RESP 文件 + redis-cli --pipe 的导入耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+
+    message, _ = rc.store_data_in_redis(*frames, flush_db=True)
+    print(f"pipeline:    {message}")
+    message, _ = rc.store_data_via_resp(*frames, flush_db=True)
+    print(f"RESP socket: {message}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'mass_insert.resp')
+        message, _ = rc.write_resp_file(*frames, path=path)
+        print(f"RESP 文件:   {message}")
+        if shutil.which('redis-cli') is None:
+            print("未找到 redis-cli，跳过 --pipe 导入。")
+            return
+        rc.flush_redis_db()
+        with open(path, 'rb') as stream:
+            output, elapsed = _timed(subprocess.run, ['redis-cli', '-h', rc.REDIS_HOST, '-p', str(rc.REDIS_PORT), '--pipe'],
+                                     stdin=stream, capture_output=True, text=True)
+        print(f"redis-cli --pipe: {elapsed:.2f} 秒 ({output.stdout.strip().splitlines()[-1]})")
+
+
+# --- 订单项布局 ---
+
+def bench_layout(args):
+    """以 hash 布局导入后迁移为 packed 布局，对比两种订单项布局的内存占用和订单详情读取耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+    order_ids = frames[2]['order_id'].astype(str).tolist()[:2000]
+
+    rc.ORDER_ITEMS_LAYOUT = 'hash'
+    message, _ = rc.store_data_in_redis(*frames, flush_db=True)
+    print(f"hash 布局导入: {message}")
+    _, hash_read = _timed(lambda: [rc.get_order_details_with_items(oid) for oid in order_ids])
+
+    message, _ = rc.migrate_order_items_layout('packed')
+    print(message)
+    _, packed_read = _timed(lambda: [rc.get_order_details_with_items(oid) for oid in order_ids])
+    print(f"读取 {len(order_ids)} 个订单详情: hash {hash_read:.3f} 秒，packed {packed_read:.3f} 秒")
+
+
+# --- 商品/用户记录布局 ---
+
+def bench_records(args):
+    """以 hash 布局导入后迁移为 bucketed 布局，对比两种记录布局的 MEMORY USAGE 和全量商品/用户读取耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+
+    rc.RECORD_LAYOUT = 'hash'
+    message, _ = rc.store_data_in_redis(*frames, flush_db=True)
+    print(f"hash 布局导入: {message}")
+    read_all = lambda: (rc.get_all_products(page_size=20), rc.get_all_users(page_size=20))
+    _, hash_read = _timed(read_all)
+
+    message, _ = rc.migrate_record_layout('bucketed', args.buckets)
+    print(message)
+    _, bucketed_read = _timed(read_all)
+    print(f"读取全部商品和用户: hash {hash_read:.3f} 秒，bucketed {bucketed_read:.3f} 秒")
+
+
+# --- 字典编码 ---
+
+def bench_dictionary(args):
+    """分别以原值和字典编码导入，对比 used_memory 以及按状态/国家搜索订单的耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+    r_client = rc.get_redis_client()
+
+    for encoding in (False, True):
+        rc.DICT_ENCODING = encoding
+        rc.store_data_in_redis(*frames, flush_db=True)
+        memory = rc._used_memory(r_client)
+        (_, matched), elapsed = _timed(rc.get_all_orders, search_query=args.query)
+        label = "字典编码" if encoding else "原值    "
+        print(f"{label}: used_memory {memory / 1e6:8.2f} MB，搜索 {args.query!r} 命中 {matched} 个订单，耗时 {elapsed:.3f} 秒")
+
+
+# --- 大文本字段压缩 ---
+
+def bench_compression(args):
+    """分别不压缩和按各压缩方式导入，对比 used_memory、商品列表读取耗时和节省的字节数"""
+    frames = rc.load_and_clean_online_retail_data()
+    r_client = rc.get_redis_client()
+
+    for method in [None] + args.methods:
+        if method == 'zstd' and rc.zstandard is None:
+            print("未安装 zstandard，跳过 zstd。")
+            continue
+        rc.COMPRESSION = method
+        rc.store_data_in_redis(*frames, flush_db=True)
+        memory = rc._used_memory(r_client)
+        _, elapsed = _timed(rc.get_all_products, page_size=20)
+        print(f"{method or '不压缩'}: used_memory {memory / 1e6:8.2f} MB，商品列表读取 {elapsed:.3f} 秒")
+        if method:
+            print(rc.get_compression_report()[0])
+
+
+# --- 订单项表示与峰值内存 ---
+
+def _nested_items(orders_df, items_df):
+    """把列式订单项表转换回旧版每单一个字典列表的 items 列，作为峰值内存对照"""
+    orders_df = orders_df.copy()
+    orders_df['items'] = list(rc._order_item_rows(orders_df, items_df, chunk_orders=len(orders_df) or 1))
+    return orders_df
+
+
+def bench_rss(args):
+    """
+    分别在独立子进程中以列式订单项表和旧版嵌套 items 列导入，对比进程峰值 RSS。
+    ru_maxrss 是整个进程的峰值，因此每种表示各用一个新进程测量。
+    """
+    if args.items is None:
+        for items in ('columnar', 'nested'):
+            subprocess.run([sys.executable, __file__, 'rss', '--path', args.path, '--items', items], check=True)
+        return
+
+    frames = rc.load_and_clean_online_retail_data(fake_fill_missing=False)
+    products_df, users_df, orders_df, items_df = frames
+    if args.items == 'nested':
+        orders_df, items_df = _nested_items(orders_df, items_df), None
+    loaded_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    message, _ = rc.store_data_in_redis(products_df, users_df, orders_df, items_df, flush_db=True)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{args.items}: 加载后峰值 RSS {loaded_rss:.0f} MB，导入后峰值 RSS {peak_rss:.0f} MB；{message}")
+
+
+# --- 列表分页 ---
+
+def bench_pagination(args):
+    """对比按列表排序索引取一页与全量扫描后分页 (搜索时的路径) 的耗时，以及游标分页在各排序字段上的深分页耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+    rc.store_data_in_redis(*frames, flush_db=True)
+    r_client = rc.get_redis_client()
+    scanners = {
+        'product': (rc.get_all_products, lambda: rc._scan_products(r_client, 2, 20, '')),
+        'user': (rc.get_all_users, lambda: rc._scan_users(r_client, 2, 20, '')),
+        'order': (rc.get_all_orders, lambda: rc._scan_orders(r_client, 2, 20, '', rc._load_dictionaries(r_client, 'order'))),
+    }
+    for entity, (list_func, scan) in scanners.items():
+        (_, total), indexed_time = _timed(list_func, 2, 20)
+        _, scan_time = _timed(scan)
+        print(f"{entity}: 共 {total} 条，索引分页 {indexed_time * 1000:.1f} 毫秒，全量扫描 {scan_time * 1000:.1f} 毫秒")
+
+    # 游标分页：第一页、按页码跳到最后一页、以及沿游标翻到下一页的耗时应当相同
+    for entity, fields in rc.SORT_INDEXES.items():
+        for sort_by in fields:
+            (_, info), first_time = _timed(rc.get_sorted_page, entity, sort_by, True, 20)
+            (_, last_info), last_time = _timed(rc.get_sorted_page, entity, sort_by, True, 20, page=info['total_pages'])
+            _, cursor_time = _timed(rc.get_sorted_page, entity, sort_by, True, 20, last_info['prev_cursor'])
+            print(f"{entity}.{sort_by}: 第一页 {first_time * 1000:.1f} 毫秒，第 {info['total_pages']} 页 {last_time * 1000:.1f} 毫秒，"
+                  f"游标翻页 {cursor_time * 1000:.1f} 毫秒")
+
+
+# --- 全文搜索 ---
+
+def bench_search(args):
+    """对比倒排索引搜索与全量扫描子串匹配的耗时，以及搜索索引的 used_memory 开销"""
+    frames = rc.load_and_clean_online_retail_data()
+    r_client = rc.get_redis_client()
+    search_fields = rc.SEARCH_FIELDS
+
+    rc.SEARCH_FIELDS = {entity: {} for entity in search_fields}
+    _, plain_time = _timed(rc.store_data_in_redis, *frames, flush_db=True)
+    plain_memory = rc._used_memory(r_client)
+    rc.SEARCH_FIELDS = search_fields
+    _, indexed_time = _timed(rc.store_data_in_redis, *frames, flush_db=True)
+    indexed_memory = rc._used_memory(r_client)
+    print(f"导入: 无搜索索引 {plain_time:.2f} 秒 / {plain_memory / 1e6:.2f} MB，有搜索索引 {indexed_time:.2f} 秒 / {indexed_memory / 1e6:.2f} MB")
+
+    scanners = {
+        'product': lambda: rc._scan_products(r_client, 1, 20, args.query),
+        'user': lambda: rc._scan_users(r_client, 1, 20, args.query),
+        'order': lambda: rc._scan_orders(r_client, 1, 20, args.query, rc._load_dictionaries(r_client, 'order')),
+    }
+    for entity, scan in scanners.items():
+        (_, matched), indexed_time = _timed(rc._search_page, r_client, entity, args.query, 1, 20)
+        (_, scanned), scan_time = _timed(scan)
+        print(f"{entity}: 搜索 {args.query!r} 索引命中 {matched} 条 {indexed_time * 1000:.1f} 毫秒，"
+              f"全量扫描命中 {scanned} 条 {scan_time * 1000:.1f} 毫秒")
+
+
+# --- 分类 + 价格区间筛选 ---
+
+def bench_browse(args):
+    """对比 browse_products 在 Redis 端求交集与读取全部商品后在 Python 端筛选的耗时，每个分类各测一次"""
+    frames = rc.load_and_clean_online_retail_data()
+    rc.store_data_in_redis(*frames, flush_db=True)
+    r_client = rc.get_redis_client()
+    for category, _ in rc.get_category_facets():
+        (_, info), browse_time = _timed(rc.browse_products, category, None, args.max_price, True, 'price', False, 1, 20)
+
+        def scan():
+            products = rc._fetch_records(r_client, 'product', list(r_client.smembers("product:all_ids")))
+            return sorted((p for p in products if p and p.get('category') == category
+                           and float(p['price']) <= args.max_price and int(p['stock']) > 0),
+                          key=lambda p: float(p['price']))[:20]
+
+        _, scan_time = _timed(scan)
+        print(f"{category}: 命中 {info['total']} 条，筛选浏览 {browse_time * 1000:.1f} 毫秒 (含分类计数)，全量扫描 {scan_time * 1000:.1f} 毫秒")
+
+
+# --- 订单筛选索引 ---
+
+def bench_order_filters(args):
+    """对比按状态/国家筛选索引取一页订单与全量扫描子串匹配的耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+    rc.store_data_in_redis(*frames, flush_db=True)
+    r_client = rc.get_redis_client()
+    dictionaries = rc._load_dictionaries(r_client, 'order')
+    country = next((c for c in frames[2]['country'].unique() if c.lower() == args.query.lower()), frames[2]['country'].iloc[0])
+    for label, kwargs, query in [('status', {'status': rc.ONLINE_RETAIL_ORDER_STATUSES[0]}, rc.ONLINE_RETAIL_ORDER_STATUSES[0]),
+                                 ('country', {'country': country}, country)]:
+        (_, total), indexed_time = _timed(rc.get_orders_by, page=2, **kwargs)
+        (_, scanned), scan_time = _timed(rc._scan_orders, r_client, 2, 20, query, dictionaries)
+        print(f"{label}={query}: 索引命中 {total} 条 {indexed_time * 1000:.1f} 毫秒，全量扫描命中 {scanned} 条 {scan_time * 1000:.1f} 毫秒")
+    counts, count_time = _timed(rc.get_order_status_counts)
+    print(f"各状态订单数 {dict(counts)}，{count_time * 1000:.1f} 毫秒")
+
+
+# --- 列表字段投影 ---
+
+def bench_projection(args):
+    """对比列表页只读取显示列 (HMGET) 与读取全部字段 (HGETALL) 时 Redis 发出的字节数和耗时"""
+    frames = rc.load_and_clean_online_retail_data()
+    rc.store_data_in_redis(*frames, flush_db=True)
+    r_client = rc.get_redis_client()
+
+    def output_bytes():
+        return int(r_client.info('stats')['total_net_output_bytes'])
+
+    for entity, list_func in [('product', rc.get_all_products), ('user', rc.get_all_users), ('order', rc.get_all_orders)]:
+        results = {}
+        for label, fields in [('全部字段', None), ('显示列', rc.LIST_FIELDS[entity])]:
+            before = output_bytes()
+            _, elapsed = _timed(list_func, 2, 100, '', fields)
+            results[label] = (output_bytes() - before, elapsed)
+        print(f"{entity}: " + "，".join(f"{label} {sent / 1e3:.1f} KB / {elapsed * 1000:.1f} 毫秒" for label, (sent, elapsed) in results.items()))
+
+
+# --- 进程内记录缓存 ---
+
+def bench_record_cache(args):
+    """按热点分布反复读取商品详情，对比关闭与开启进程内记录缓存的耗时，并输出命中率"""
+    frames = rc.load_and_clean_online_retail_data()
+    rc.store_data_in_redis(*frames, flush_db=True)
+    product_ids = frames[0]['product_id'].astype(str).tolist()
+    rng = random.Random(args.seed)
+    hot_ids = rng.sample(product_ids, min(100, len(product_ids)))
+    reads = [rng.choice(hot_ids) if rng.random() < 0.8 else rng.choice(product_ids) for _ in range(args.products)]
+
+    def read_all():
+        for product_id in reads:
+            rc.get_product_details(product_id)
+
+    max_entries = rc.RECORD_CACHE.max_entries
+    rc.RECORD_CACHE.max_entries = 0 # 不保留任何条目，相当于关闭缓存
+    _, uncached_time = _timed(read_all)
+    rc.RECORD_CACHE = rc.RecordCache(max_entries=max_entries)
+    if args.near_cache:
+        print(rc.enable_near_cache(args.near_cache)[0])
+    _, cached_time = _timed(read_all)
+    print(f"读取 {len(reads)} 次商品详情：无缓存 {uncached_time:.2f} 秒，有缓存 {cached_time:.2f} 秒")
+    print(rc.get_record_cache_report()[0])
+
+
+# --- 搜索结果缓存 ---
+
+def bench_search_cache(args):
+    """对比同一搜索第 1 页 (计算并缓存结果) 与之后翻页 (只取缓存中的一段 ID) 的耗时，分别测量倒排索引和全量扫描"""
+    frames = rc.load_and_clean_online_retail_data()
+    rc.store_data_in_redis(*frames, flush_db=True)
+    r_client = rc.get_redis_client()
+    listers = {'product': rc.get_all_products, 'user': rc.get_all_users, 'order': rc.get_all_orders}
+    for source in ('index', 'scan'):
+        if source == 'scan':
+            r_client.delete(rc.SEARCH_INDEXED_KEY) # 使搜索退回全量扫描
+            rc._queue_cache_epoch(r_client) # 换 epoch，不再命中倒排索引阶段缓存的结果
+        for entity, lister in listers.items():
+            (_, total), first_time = _timed(lister, 1, 20, args.query)
+            pages = max(1, min(10, (total - 1) // 20 + 1))
+            _, turn_time = _timed(lambda: [lister(page, 20, args.query) for page in range(2, pages + 2)])
+            print(f"{source} {entity}: 搜索 {args.query!r} 命中 {total} 条，第 1 页 {first_time * 1000:.1f} 毫秒，"
+                  f"之后每页平均 {turn_time / pages * 1000:.1f} 毫秒")
+    rc._queue_search_declaration(r_client)
+
+
+# --- 模拟数据生成 ---
+
+def bench_generate(args):
+    """测量向量化模拟数据生成器在大规模下的耗时"""
+    frames, elapsed = _timed(rc.generate_synthetic_dataset, args.products, args.users, args.orders, seed=args.seed)
+    products_df, users_df, orders_df, items_df = frames
+    print(f"商品 {len(products_df)}，用户 {len(users_df)}，订单 {len(orders_df)}，订单项 {len(items_df)}")
+    print(f"生成耗时: {elapsed:.2f} 秒 ({len(items_df) / elapsed:,.0f} 订单项/秒)")
+
+
+BENCHMARKS = {
+    'aggregation': bench_aggregation,
+    'ingest': bench_ingest,
+    'snapshot': bench_snapshot,
+    'resp': bench_resp,
+    'layout': bench_layout,
+    'records': bench_records,
+    'dictionary': bench_dictionary,
+    'compression': bench_compression,
+    'rss': bench_rss,
+    'pagination': bench_pagination,
+    'search': bench_search,
+    'browse': bench_browse,
+    'order-filters': bench_order_filters,
+    'projection': bench_projection,
+    'record-cache': bench_record_cache,
+    'search-cache': bench_search_cache,
+    'generate': bench_generate,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="REDM 性能基准")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+    parser.add_argument('--path', default=rc.ONLINE_RETAIL_DATA_PATH, help="Online Retail CSV 路径")
+    parser.add_argument('--workers', type=int, default=None, help="并行导入的进程数 (默认 CPU 核心数)")
+    parser.add_argument('--products', type=int, default=1_000_000, help="生成的商品数量；record-cache 基准中为读取次数")
+    parser.add_argument('--users', type=int, default=100_000, help="生成的用户数量")
+    parser.add_argument('--orders', type=int, default=3_333_334, help="生成的订单数量 (平均每单 3 行)")
+    parser.add_argument('--buckets', type=int, default=rc.RECORD_BUCKET_COUNT, help="bucketed 记录布局的桶数量 (默认按记录数计算)")
+    parser.add_argument('--query', default='united', help="dictionary/search/search-cache 基准使用的搜索关键字，order-filters 基准中作为国家名")
+    parser.add_argument('--max-price', type=float, default=5.0, help="browse 基准的价格上限")
+    parser.add_argument('--methods', nargs='+', default=['zlib', 'zstd'], choices=['zlib', 'zstd'], help="compression 基准比较的压缩方式")
+    parser.add_argument('--items', choices=['columnar', 'nested'], default=None, help="rss 基准只测量一种订单项表示 (默认两种各起一个子进程)")
+    parser.add_argument('--near-cache', choices=['tracking', 'keyspace'], default=None, help="record-cache 基准启用的 near-cache 模式")
+    parser.add_argument('--seed', type=int, default=42, help="随机种子")
+    args = parser.parse_args()
+    rc.ONLINE_RETAIL_DATA_PATH = args.path
+    BENCHMARKS[args.benchmark](args)
@@ -24,9 +24,13 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.figure import Figure
 import matplotlib.pyplot as plt
 import numpy as np # 用于Matplotlib示例数据
+import pandas as pd
 
 import redis_core as rc # 导入核心逻辑模块
 
+# 列表 Tab 名称 -> rc 中的实体名称
+LIST_ENTITIES = {'products': 'product', 'users': 'user', 'orders': 'order'}
+
 # 设置matplotlib支持中文显示
 plt.rcParams['font.sans-serif'] = ['SimHei', 'Microsoft YaHei', 'DejaVu Sans']
 plt.rcParams['axes.unicode_minus'] = False
@@ -333,12 +337,21 @@ class REDMApp(QMainWindow):
         self.products_current_page = 1
         self.products_total_pages = 1
         self.products_search_query = "" # 新增搜索查询
+        self.products_browse = None # 分类/价格区间/有货筛选条件，None 表示不筛选
         self.users_current_page = 1
         self.users_total_pages = 1
         self.users_search_query = "" # 新增搜索查询
         self.orders_current_page = 1
         self.orders_total_pages = 1
         self.orders_search_query = "" # 新增搜索查询
+        # 排序与游标：{tab}_cursor 是下一次刷新使用的游标 (翻页时设置，读取后清空)，
+        # {tab}_next_cursor / {tab}_prev_cursor 是当前页返回的前后页游标
+        for item_type, entity in LIST_ENTITIES.items():
+            setattr(self, f"{item_type}_sort_by", rc.LIST_SORT_FIELDS[entity])
+            setattr(self, f"{item_type}_descending", True)
+            setattr(self, f"{item_type}_cursor", None)
+            setattr(self, f"{item_type}_next_cursor", None)
+            setattr(self, f"{item_type}_prev_cursor", None)
 
         self.selected_product_id = None
         self.selected_user_id = None
@@ -384,6 +397,7 @@ class REDMApp(QMainWindow):
             self.faker_button, self.online_retail_button, self.flush_db_button,
             self.refresh_products_button, self.add_product_button,
             self.products_prev_button, self.products_next_button, self.products_search_input, self.products_search_button, self.products_page_jump_input, self.products_page_jump_button,
+            self.products_filter_button, self.products_clear_filter_button,
             self.refresh_users_button, self.add_user_button,
             self.users_prev_button, self.users_next_button, self.users_search_input, self.users_search_button, self.users_page_jump_input, self.users_page_jump_button,
             self.refresh_orders_button,
@@ -395,6 +409,9 @@ class REDMApp(QMainWindow):
         
         # QCheckBox 的启用/禁用
         self.fake_fill_checkbox.setEnabled(enabled)
+        self.stream_import_checkbox.setEnabled(enabled)
+        self.incremental_import_checkbox.setEnabled(enabled)
+        self.staged_reload_checkbox.setEnabled(enabled)
 
         # CRUD 按钮的启用状态还需要根据是否有选中项来判断
         self.update_crud_button_states()
@@ -428,16 +445,18 @@ class REDMApp(QMainWindow):
         thread = threading.Thread(target=worker.run)
         self.current_workers.append(thread) # 跟踪线程
 
+        # 线程结束后，重新启用按钮 (先于结果回调连接，回调中再启动的后续线程可以重新禁用按钮)
+        worker.finished.connect(lambda: self.set_all_buttons_state(True))
+        worker.error.connect(lambda: self.set_all_buttons_state(True))
+
         if callback_finished:
             worker.finished.connect(callback_finished)
         if callback_error:
             worker.error.connect(callback_error)
         if callback_progress:
             worker.progress.connect(callback_progress)
-        
-        # 线程结束后，重新启用按钮
-        worker.finished.connect(lambda: self.set_all_buttons_state(True))
-        worker.error.connect(lambda: self.set_all_buttons_state(True))
+            # 导入函数通过 progress_callback(info) 报告进度，转为 progress 信号交给主线程显示
+            worker.kwargs['progress_callback'] = lambda info: worker.progress.emit(info['message'])
 
         thread.start()
         return thread # 返回线程对象，如果需要进一步管理
@@ -478,6 +497,18 @@ class REDMApp(QMainWindow):
         self.fake_fill_checkbox.setChecked(True)
         redis_layout.addRow(self.fake_fill_checkbox)
 
+        self.stream_import_checkbox = QCheckBox("流式导入 (分块读取，内存占用恒定，适合大文件)")
+        self.stream_import_checkbox.setChecked(False)
+        redis_layout.addRow(self.stream_import_checkbox)
+
+        self.incremental_import_checkbox = QCheckBox("增量导入 (不清空数据库，只写入变化的记录，流式导入时不适用)")
+        self.incremental_import_checkbox.setChecked(False)
+        redis_layout.addRow(self.incremental_import_checkbox)
+
+        self.staged_reload_checkbox = QCheckBox("零停机重载 (先写入暂存库，校验后 SWAPDB 切换，需要约两倍内存)")
+        self.staged_reload_checkbox.setChecked(False)
+        redis_layout.addRow(self.staged_reload_checkbox)
+
         self.online_retail_button = QPushButton("加载并存储 Online Retail 数据")
         self.online_retail_button.clicked.connect(self.load_online_retail_data)
         redis_layout.addRow(self.online_retail_button)
@@ -504,15 +535,26 @@ class REDMApp(QMainWindow):
             QMessageBox.critical(self, "错误", "Redis 未连接。请先连接。")
             return
         self.update_log(self.data_mgmt_output, "正在生成并存储 Faker 数据...", clear_first=True)
-        self.run_in_thread(rc.collect_and_clean_faker_data, self._handle_data_storage_result, self._handle_thread_error, is_faker=True)
+        staging = self.staged_reload_checkbox.isChecked()
+        self.run_in_thread(rc.collect_and_clean_faker_data,
+                           lambda result: self._handle_data_storage_result(result, staging=staging),
+                           self._handle_thread_error)
+
+    def _handle_data_storage_result(self, data_tuple, incremental=False, staging=False):
+        if isinstance(data_tuple, tuple) and len(data_tuple) in (3, 4) and all(isinstance(df, pd.DataFrame) for df in data_tuple):
+            # (products_df, users_df, orders_df[, items_df])
+            # 写入 Redis 同样放到子线程中执行，结果 (消息, 是否成功) 再次回到本方法处理
+            if incremental:
+                self.update_log(self.data_mgmt_output, "数据清洗完成，正在增量同步到 Redis...")
+                self.run_in_thread(rc.sync_data_in_redis, self._handle_data_storage_result, self._handle_thread_error,
+                                   None, *data_tuple)
+            else:
+                self.update_log(self.data_mgmt_output, "数据清洗完成，正在存储到 Redis...")
+                self.run_in_thread(rc.store_data_in_redis, self._handle_data_storage_result, self._handle_thread_error,
+                                   self._handle_ingest_progress, *data_tuple, flush_db=True, staging=staging)
+            return
 
-    def _handle_data_storage_result(self, data_tuple, is_faker=False):
-        if isinstance(data_tuple, tuple) and len(data_tuple) == 3 and all(isinstance(df, pd.DataFrame) for df in data_tuple):
-            products_df, users_df, orders_df = data_tuple
-            self.update_log(self.data_mgmt_output, "数据清洗完成，正在存储到 Redis...")
-            msg, success = rc.store_data_in_redis(products_df, users_df, orders_df, flush_db=True)
-        else:
-            msg, success = data_tuple # 可能是错误信息
+        msg, success = data_tuple # 可能是错误信息
         
         self.update_log(self.data_mgmt_output, f"{msg} (成功: {success})")
         if success:
@@ -527,13 +569,25 @@ class REDMApp(QMainWindow):
         else:
             QMessageBox.critical(self, "数据管理", f"数据操作失败: {msg}")
 
+    def _handle_ingest_progress(self, message):
+        self.update_log(self.data_mgmt_output, message)
+
     def load_online_retail_data(self):
         if not self.redis_client:
             QMessageBox.critical(self, "错误", "Redis 未连接。请先连接。")
             return
         self.update_log(self.data_mgmt_output, "正在加载并存储 Online Retail 数据...", clear_first=True)
         fake_fill = self.fake_fill_checkbox.isChecked() # QCheckBox 的状态用 isChecked()
-        self.run_in_thread(rc.load_and_clean_online_retail_data, self._handle_data_storage_result, self._handle_thread_error, fake_fill_missing=fake_fill)
+        staging = self.staged_reload_checkbox.isChecked()
+        if self.stream_import_checkbox.isChecked():
+            # 流式导入直接写入 Redis，返回 (消息, 是否成功)
+            self.run_in_thread(rc.stream_online_retail_to_redis, self._handle_data_storage_result, self._handle_thread_error,
+                               self._handle_ingest_progress, fake_fill_missing=fake_fill, staging=staging)
+        else:
+            incremental = self.incremental_import_checkbox.isChecked()
+            self.run_in_thread(rc.load_and_clean_online_retail_data,
+                               lambda result: self._handle_data_storage_result(result, incremental=incremental, staging=staging),
+                               self._handle_thread_error, fake_fill_missing=fake_fill)
 
     def flush_redis_db(self):
         if not self.redis_client:
@@ -604,6 +658,7 @@ class REDMApp(QMainWindow):
         self.products_search_button = QPushButton("搜索")
         self.products_search_button.clicked.connect(lambda: self.search_items('products'))
         top_bar_layout.addWidget(self.products_search_button)
+        self._add_sort_controls('products', top_bar_layout)
 
         # 分页控件
         pagination_layout = QHBoxLayout()
@@ -630,6 +685,32 @@ class REDMApp(QMainWindow):
 
         layout.addLayout(top_bar_layout)
 
+        # 分类 + 价格区间筛选栏 (与搜索互斥)，分类后的数量为当前价格和有货条件下的商品数
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("分类:"))
+        self.products_category_combobox = QComboBox()
+        self.products_category_combobox.addItem("全部分类", None)
+        filter_layout.addWidget(self.products_category_combobox)
+        self.products_min_price_input = QLineEdit()
+        self.products_min_price_input.setPlaceholderText("最低价")
+        self.products_min_price_input.setFixedWidth(80)
+        filter_layout.addWidget(self.products_min_price_input)
+        filter_layout.addWidget(QLabel("-"))
+        self.products_max_price_input = QLineEdit()
+        self.products_max_price_input.setPlaceholderText("最高价")
+        self.products_max_price_input.setFixedWidth(80)
+        filter_layout.addWidget(self.products_max_price_input)
+        self.products_in_stock_checkbox = QCheckBox("仅看有货")
+        filter_layout.addWidget(self.products_in_stock_checkbox)
+        self.products_filter_button = QPushButton("筛选")
+        self.products_filter_button.clicked.connect(self.apply_product_filter)
+        filter_layout.addWidget(self.products_filter_button)
+        self.products_clear_filter_button = QPushButton("清除筛选")
+        self.products_clear_filter_button.clicked.connect(self.clear_product_filter)
+        filter_layout.addWidget(self.products_clear_filter_button)
+        filter_layout.addStretch()
+        layout.addLayout(filter_layout)
+
         # 商品列表 (使用 QTableWidget)
         self.products_table = QTableWidget()
         self.products_table.setSelectionBehavior(QTableWidget.SelectRows) # 整行选中
@@ -660,15 +741,19 @@ class REDMApp(QMainWindow):
         self.update_crud_button_states()
 
         self.run_in_thread(
-            lambda: rc.get_all_products(self.products_current_page, self.page_size, self.products_search_query),
+            lambda: self._fetch_list_page('products', rc.get_all_products),
             self._display_products,
             self._handle_thread_error
         )
 
     def _display_products(self, result):
-        products, total_items = result
-        self.products_total_pages = math.ceil(total_items / self.page_size) if total_items > 0 else 1
+        products, page_info = result
+        self.products_current_page = page_info['page']
+        self.products_total_pages = page_info['total_pages']
+        self.products_next_cursor = page_info['next_cursor']
+        self.products_prev_cursor = page_info['prev_cursor']
         self.products_page_label.setText(f"页码: {self.products_current_page}/{self.products_total_pages}")
+        self._update_category_facets(page_info.get('facets', []))
 
         headers = ['ID', '名称', '分类', '价格', '库存']
         self.products_table.setColumnCount(len(headers))
@@ -694,6 +779,44 @@ class REDMApp(QMainWindow):
         self.products_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch) # 自动拉伸列宽
         self.products_table.resizeRowsToContents() # 调整行高以适应内容
 
+    def _update_category_facets(self, facets):
+        """用分类计数 [(分类, 数量)] 重建分类下拉框 (数量为 None 时只显示分类名)，保留当前选中的分类"""
+        selected = self.products_category_combobox.currentData()
+        self.products_category_combobox.blockSignals(True)
+        self.products_category_combobox.clear()
+        self.products_category_combobox.addItem("全部分类", None)
+        for category, count in facets:
+            self.products_category_combobox.addItem(category if count is None else f"{category} ({count})", category)
+        index = self.products_category_combobox.findData(selected)
+        self.products_category_combobox.setCurrentIndex(max(index, 0))
+        self.products_category_combobox.blockSignals(False)
+
+    def apply_product_filter(self):
+        try:
+            min_price = float(self.products_min_price_input.text()) if self.products_min_price_input.text().strip() else None
+            max_price = float(self.products_max_price_input.text()) if self.products_max_price_input.text().strip() else None
+        except ValueError:
+            QMessageBox.warning(self, "筛选商品", "价格必须是数字。")
+            return
+        browse = {
+            'category': self.products_category_combobox.currentData(),
+            'min_price': min_price,
+            'max_price': max_price,
+            'in_stock_only': self.products_in_stock_checkbox.isChecked(),
+        }
+        self.products_browse = browse if any(value not in (None, False) for value in browse.values()) else None
+        self.products_current_page = 1 # 筛选时重置到第一页
+        self.refresh_products(auto_select_tab=False)
+
+    def clear_product_filter(self):
+        self.products_category_combobox.setCurrentIndex(0)
+        self.products_min_price_input.clear()
+        self.products_max_price_input.clear()
+        self.products_in_stock_checkbox.setChecked(False)
+        self.products_browse = None
+        self.products_current_page = 1
+        self.refresh_products(auto_select_tab=False)
+
     def add_product_dialog(self):
         if not self.redis_client:
             QMessageBox.critical(self, "错误", "Redis 未连接。请先连接。")
@@ -795,6 +918,7 @@ class REDMApp(QMainWindow):
         self.users_search_button = QPushButton("搜索")
         self.users_search_button.clicked.connect(lambda: self.search_items('users'))
         top_bar_layout.addWidget(self.users_search_button)
+        self._add_sort_controls('users', top_bar_layout)
 
         # 分页控件
         pagination_layout = QHBoxLayout()
@@ -850,14 +974,17 @@ class REDMApp(QMainWindow):
         self.update_crud_button_states()
 
         self.run_in_thread(
-            lambda: rc.get_all_users(self.users_current_page, self.page_size, self.users_search_query),
+            lambda: self._fetch_list_page('users', rc.get_all_users),
             self._display_users,
             self._handle_thread_error
         )
 
     def _display_users(self, result):
-        users, total_items = result
-        self.users_total_pages = math.ceil(total_items / self.page_size) if total_items > 0 else 1
+        users, page_info = result
+        self.users_current_page = page_info['page']
+        self.users_total_pages = page_info['total_pages']
+        self.users_next_cursor = page_info['next_cursor']
+        self.users_prev_cursor = page_info['prev_cursor']
         self.users_page_label.setText(f"页码: {self.users_current_page}/{self.users_total_pages}")
 
         headers = ['ID', '用户名', '邮箱', '注册日期', '最后登录']
@@ -981,6 +1108,7 @@ class REDMApp(QMainWindow):
         self.orders_search_button = QPushButton("搜索")
         self.orders_search_button.clicked.connect(lambda: self.search_items('orders'))
         top_bar_layout.addWidget(self.orders_search_button)
+        self._add_sort_controls('orders', top_bar_layout)
 
         # 分页控件
         pagination_layout = QHBoxLayout()
@@ -1036,14 +1164,17 @@ class REDMApp(QMainWindow):
         self.update_crud_button_states()
 
         self.run_in_thread(
-            lambda: rc.get_all_orders(self.orders_current_page, self.page_size, self.orders_search_query),
+            lambda: self._fetch_list_page('orders', rc.get_all_orders),
             self._display_orders,
             self._handle_thread_error
         )
 
     def _display_orders(self, result):
-        orders, total_items = result
-        self.orders_total_pages = math.ceil(total_items / self.page_size) if total_items > 0 else 1
+        orders, page_info = result
+        self.orders_current_page = page_info['page']
+        self.orders_total_pages = page_info['total_pages']
+        self.orders_next_cursor = page_info['next_cursor']
+        self.orders_prev_cursor = page_info['prev_cursor']
         self.orders_page_label.setText(f"页码: {self.orders_current_page}/{self.orders_total_pages}")
 
         headers = ['订单ID', '用户ID', '总金额', '国家', '订单日期', '状态']
@@ -1293,7 +1424,62 @@ class REDMApp(QMainWindow):
         self.monthly_sales_canvas.draw()
 
 
+    def _add_sort_controls(self, item_type, layout):
+        """在列表 Tab 的顶部栏加入排序字段和排序方向下拉框，切换后回到第一页"""
+        sort_combobox = QComboBox()
+        for field in rc.SORT_INDEXES[LIST_ENTITIES[item_type]]:
+            sort_combobox.addItem(rc.SORT_FIELD_LABELS.get(field, field), field)
+        order_combobox = QComboBox()
+        order_combobox.addItem("降序", True)
+        order_combobox.addItem("升序", False)
+
+        def on_sort_changed():
+            setattr(self, f"{item_type}_sort_by", sort_combobox.currentData())
+            setattr(self, f"{item_type}_descending", order_combobox.currentData())
+            setattr(self, f"{item_type}_current_page", 1)
+            getattr(self, f"refresh_{item_type}")(auto_select_tab=False)
+
+        sort_combobox.currentIndexChanged.connect(on_sort_changed)
+        order_combobox.currentIndexChanged.connect(on_sort_changed)
+        layout.addWidget(QLabel("排序:"))
+        layout.addWidget(sort_combobox)
+        layout.addWidget(order_combobox)
+
+    def _fetch_list_page(self, item_type, search_func):
+        """
+        在后台线程中读取列表 Tab 的当前页，返回 (当前页记录, 分页信息)。
+        无搜索条件时用 rc.get_sorted_page 按排序索引分页 (有游标时按游标翻页，否则按页码定位)，
+        深分页与第一页开销相同；有搜索条件或排序索引尚未覆盖全部记录时交给 search_func，由它按搜索索引或全量扫描分页。
+        商品 Tab 设置了筛选条件 (且没有搜索条件) 时改用 rc.browse_products 按页码分页；商品的分页信息附带 facets (筛选时为分类计数，否则只有分类名)。
+        """
+        entity = LIST_ENTITIES[item_type]
+        page = getattr(self, f"{item_type}_current_page")
+        search_query = getattr(self, f"{item_type}_search_query")
+        cursor = getattr(self, f"{item_type}_cursor")
+        setattr(self, f"{item_type}_cursor", None) # 游标只使用一次，之后的刷新按页码定位
+        sort_by, descending = getattr(self, f"{item_type}_sort_by"), getattr(self, f"{item_type}_descending")
+        if item_type == 'products' and self.products_browse and not search_query:
+            records, page_info = rc.browse_products(**self.products_browse, sort_by=sort_by, descending=descending,
+                                                    page=page, page_size=self.page_size)
+            return records, {**page_info, 'next_cursor': None, 'prev_cursor': None}
+        records = None
+        if not search_query:
+            records, page_info = rc.get_sorted_page(entity, sort_by, descending, self.page_size, cursor, page)
+            if not page_info['indexed']:
+                records = None
+        if records is None:
+            records, total_items = search_func(page, self.page_size, search_query)
+            total_pages = math.ceil(total_items / self.page_size) if total_items > 0 else 1
+            page_info = {'page': page, 'total_pages': total_pages, 'next_cursor': None, 'prev_cursor': None}
+        if item_type == 'products':
+            # 没有筛选条件时分类下拉框只需要分类名，不统计各分类的数量
+            page_info['facets'] = [(category, None) for category in rc.get_product_categories()]
+        return records, page_info
+
     def change_page(self, item_type, direction):
+        # 有前后页游标时按游标翻页，游标定位不依赖页码，翻页期间有增删也不会重复或遗漏
+        cursor = getattr(self, f"{item_type}_next_cursor" if direction > 0 else f"{item_type}_prev_cursor")
+        setattr(self, f"{item_type}_cursor", cursor)
         if item_type == 'products':
             new_page = self.products_current_page + direction
             if 1 <= new_page <= self.products_total_pages:
@@ -1,287 +1,2620 @@
 import redis
 import pandas as pd
+import numpy as np
 import json
+import base64
+import re
+import functools
 import time
-import random
 from faker import Faker
 import uuid
 import os
+import sys
 import math # 用于分页
+import hashlib
+import itertools
+import socket
+import threading
+from collections import OrderedDict
+import shutil
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime # 用于用户添加时的日期格式
 
+try:
+    import pyarrow.feather # 可选依赖：清洗结果快照使用 Arrow IPC (Feather) 格式
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard # 可选依赖：COMPRESSION = 'zstd' 时使用
+except ImportError:
+    zstandard = None
+
+try:
+    from hiredis import pack_command as _hiredis_pack_command # 可选依赖：C 实现的 RESP 命令编码
+except ImportError:
+    _hiredis_pack_command = None
+
 # --- 配置 ---
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
+REDIS_STAGING_DB = 1 # 零停机重载时先写入的暂存库，校验通过后与 REDIS_DB 执行 SWAPDB
 FAKE_PRODUCT_COUNT = 1000
 FAKE_USER_COUNT = 100
 FAKE_ORDER_COUNT = 500
+FAKE_ORDER_MAX_ITEMS = 5 # 模拟订单的最大商品行数
+FAKER_POOL_SIZE = 2000 # Faker 词汇池大小
 ONLINE_RETAIL_DATA_PATH = 'data.csv'
+STORE_BATCH_SIZE = 1000 # 批量写入时每个 pipeline 批次包含的实体数量
+ONLINE_RETAIL_CHUNK_SIZE = 50000 # 流式导入时每次从 CSV 读取的行数
+ONLINE_RETAIL_ORDER_STATUSES = ['已付款', '已发货', '已完成'] # Online Retail 订单随机分配的状态
+# 订单项存储布局：'hash' 每个订单项一个 order_item:{order_id}:{idx} Hash 加 order:{id}:items 列表；
+# 'packed' 每个订单一个 order:{id}:items_packed 字符串 (按列组织的紧凑 JSON)。读取和删除两种布局都支持
+ORDER_ITEMS_LAYOUT = 'hash'
+ORDER_ITEMS_LAYOUTS = ('hash', 'packed')
+# 商品/用户记录布局：'hash' 每条记录一个 product:{id} / user:{id} Hash；
+# 'bucketed' 按 ID 的 CRC32 分入若干 {entity}:bucket:{n} Hash，字段为 ID，值为按 RECORD_FIELDS 排列的 JSON 数组。
+# 数据实际使用的布局和桶数量记录在 RECORD_LAYOUT_KEY 中，查询和 CRUD 以它为准，全量导入时按这里的配置重写
+RECORD_LAYOUT = 'hash'
+RECORD_LAYOUTS = ('hash', 'bucketed')
+# 桶数量：None 表示全量导入时按记录数 / RECORD_BUCKET_SIZE 计算 (记录数未知的流式导入使用 RECORD_BUCKET_DEFAULT_COUNT)，
+# 整数表示固定的桶数量。每个桶的字段数须不超过服务器的 hash-max-listpack-entries (Redis 7 默认 128)，
+# 最长的记录须不超过 hash-max-listpack-value (默认 64 字节)，否则桶转为 hashtable 编码；导入时会检查并在消息中提示
+RECORD_BUCKET_COUNT = None
+RECORD_BUCKET_SIZE = 64
+RECORD_BUCKET_DEFAULT_COUNT = 1024
+# 字典编码：启用后商品分类、订单状态和国家在记录中存为整数编码，码表保存在 dict:{entity}:{field} 中，
+# 读取时按码表还原；码表中没有的值原样返回，因此编码前写入的数据仍可正常读取
+DICT_ENCODING = False
+DICT_ENCODED_FIELDS = {'product': ('category',), 'order': ('status', 'country')}
+# 大文本字段透明压缩：None 不压缩，'zlib' 或 'zstd' (需要 zstandard)。只压缩 COMPRESSED_FIELDS 中
+# UTF-8 长度不小于 COMPRESSION_MIN_BYTES 且压缩后确实更短的值，存为 "前缀 + base85" 文本；
+# 读取时按前缀识别，与当前配置无关，因此随时可以开关
+COMPRESSION = None
+COMPRESSED_FIELDS = {'product': ('description',)}
+COMPRESSION_MIN_BYTES = 128
+COMPRESSION_LEVEL = 6
+# 全文搜索：SEARCH_FIELDS 中的字段在写入时分词 (英文/数字按单词，中文按相邻二字)，每个词一个倒排索引
+# search:{entity}:{词}，分数为该词所在字段的权重之和，搜索结果按分数排序。
+# 搜索条件的最后一个英文/数字词按前缀匹配，最多展开为 SEARCH_PREFIX_EXPANSIONS 个词
+SEARCH_FIELDS = {
+    'product': {'name': 3, 'category': 2, 'description': 1},
+    'user': {'username': 2, 'email': 1},
+    'order': {'order_id': 3, 'user_id': 2, 'country': 1, 'status': 1},
+}
+SEARCH_PREFIX_EXPANSIONS = 100
+# 搜索结果缓存：每个 (实体, 规范化的搜索条件) 的完整命中 ID 列表在 Redis 中保留 SEARCH_CACHE_TTL 秒，翻页只取其中一段。
+# 缓存 key 中包含实体的写入版本号，任何增删改都会使该实体之前缓存的结果不再被使用
+SEARCH_CACHE_TTL = 60
+# 进程内记录缓存：商品、用户和订单详情在本进程中按 LRU 最多缓存 RECORD_CACHE_MAX_ENTRIES 条，
+# RECORD_CACHE_TTL 秒内直接返回；过期后只向 Redis 核对版本号，未变化则续期，不重新读取记录
+RECORD_CACHE_MAX_ENTRIES = 10000
+RECORD_CACHE_TTL = 30
+# near-cache (可选)：None 关闭；'tracking' 使用 CLIENT TRACKING (Redis 6+) 广播模式，'keyspace' 使用 keyspace 通知
+# (会修改服务器的 notify-keyspace-events)。启用后任何客户端写入商品、用户或订单时，各进程立即移除对应缓存条目
+NEAR_CACHE = None
+SNAPSHOT_CACHE_DIR = '.redm_cache' # 清洗结果快照目录
+SNAPSHOT_FORMAT_VERSION = 2 # 清洗逻辑或快照结构变化时递增，使旧快照失效
 
 # --- Redis 客户端管理 ---
 _redis_client_instance = None
+_staging_client_instance = None
 
-def get_redis_client():
+def get_redis_client(staging=False):
     """
     获取 Redis 客户端实例。如果尚未创建，则尝试创建并连接。
+    默认连接活动库 REDIS_DB；staging=True 时返回连接暂存库 REDIS_STAGING_DB 的客户端。
+    SWAPDB 交换的是库中的数据，活动库客户端无需重连即可看到切换后的数据。
     """
-    global _redis_client_instance
+    global _redis_client_instance, _staging_client_instance
+    if staging:
+        if REDIS_STAGING_DB == REDIS_DB:
+            print("REDIS_STAGING_DB 不能与 REDIS_DB 相同。")
+            return None
+        if _staging_client_instance is None:
+            try:
+                _staging_client_instance = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_STAGING_DB, decode_responses=True)
+                _staging_client_instance.ping()
+            except redis.exceptions.ConnectionError as e:
+                print(f"Failed to connect to Redis server: {e}")
+                _staging_client_instance = None
+        return _staging_client_instance
+
     if _redis_client_instance is None:
         try:
             _redis_client_instance = redis.StrictRedis(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_DB, decode_responses=True)
             _redis_client_instance.ping()
             print("Redis client connected successfully.")
+            if NEAR_CACHE:
+                print(enable_near_cache(NEAR_CACHE)[0])
         except redis.exceptions.ConnectionError as e:
             print(f"Failed to connect to Redis server: {e}")
             _redis_client_instance = None # 连接失败，重置为 None
     return _redis_client_instance
 
-# --- Faker 初始化 ---
-fake = Faker('zh_CN')
+def _staging_conflict(staging_client):
+    """
+    暂存库清空前的检查：暂存库非空且没有任何 REDM 标记 key 时 (可能是其他程序的数据)，返回拒绝导入的原因，否则返回 None。
+    标记包括每次清空后立即写入的 SEARCH_INDEXED_KEY 和 CACHE_EPOCH_KEY，因此中途失败的各种导入 (流水线、并行、RESP)
+    留下的暂存库都能被识别；导入检查点和记录布局声明同样视为标记。
+    """
+    markers = (INGEST_CHECKPOINT_KEY, RECORD_LAYOUT_KEY, SEARCH_INDEXED_KEY, CACHE_EPOCH_KEY)
+    if staging_client.dbsize() and not staging_client.exists(*markers):
+        return (f"暂存库 DB {REDIS_STAGING_DB} 中有不属于 REDM 的数据，为避免误删已取消导入。"
+                f"请修改 REDIS_STAGING_DB 或手动清空该库后重试。")
+    return None
+
+def _target_client(staging, flush_db, record_counts=None):
+    """
+    返回 (全量导入的目标客户端, 错误消息)。暂存模式下总是清空暂存库后写入，活动库保持可读；
+    否则按 flush_db 清空活动库后直接写入。同时按 _prepare_record_layout 声明或校验记录布局，
+    record_counts ({实体: 记录数}) 用于确定桶数量。
+    连接失败或暂存库中有其他数据 (见 _staging_conflict) 时客户端为 None。
+    """
+    r_client = get_redis_client(staging=staging)
+    if not r_client:
+        return None, "Redis 连接失败，无法存储数据。"
+    if staging:
+        conflict = _staging_conflict(r_client)
+        if conflict:
+            return None, conflict
+    if staging or flush_db:
+        r_client.flushdb()
+        _queue_search_declaration(r_client)
+    _queue_cache_epoch(r_client) # 全量导入会覆盖大量记录，不逐条递增版本号
+    _prepare_record_layout(r_client, staging or flush_db, record_counts)
+    return r_client, None
+
+def _promote_staging(expected_counts):
+    """
+    校验暂存库中各 ID 集合的元素数与 expected_counts ({key: 数量}) 一致后，
+    用 SWAPDB 原子地把暂存库换为活动库，再异步清空换出的旧数据。
+    校验失败时清空暂存库，活动库保持不变。返回 (消息, 是否成功)。
+    """
+    staging_client = get_redis_client(staging=True)
+    try:
+        mismatched = []
+        for key, expected in expected_counts.items():
+            actual = staging_client.scard(key)
+            if actual != expected:
+                mismatched.append(f"{key} 期望 {expected} 条，实际 {actual} 条")
+        if mismatched:
+            staging_client.flushdb(asynchronous=True)
+            return "暂存库校验失败，活动数据未改变：" + "；".join(mismatched), False
+        staging_client.swapdb(REDIS_DB, REDIS_STAGING_DB)
+        staging_client.flushdb(asynchronous=True) # 此时暂存库中是换出的旧数据
+        # 在活动库中换一个新的 epoch：本进程立即清空缓存，其他进程由 near-cache 推送或 TTL 到期核对版本时发现
+        _queue_cache_epoch(get_redis_client())
+        return f"校验通过，已通过 SWAPDB 将 DB {REDIS_STAGING_DB} 切换为活动库 DB {REDIS_DB}。", True
+    except redis.exceptions.RedisError as e:
+        return f"切换暂存库失败，活动数据未改变: {e}", False
+
+def _expected_counts(products_df, users_df, orders_df):
+    """根据导入的数据计算暂存库校验时各 ID 集合应有的元素数"""
+    return {
+        "product:all_ids": products_df['product_id'].nunique(),
+        "user:all_ids": users_df['user_id'].nunique(),
+        "order:all_ids": orders_df['order_id'].nunique(),
+    }
 
 # --- 数据生成与清洗 (Faker) ---
 
-def generate_synthetic_product_data(count):
-    products = []
-    categories = ['电子产品', '服装鞋帽', '家居百货', '图书音像', '美妆个护', '食品饮料']
-    for _ in range(count):
-        product_id = str(uuid.uuid4())
-        name = f"{fake.word()} {fake.color_name()} {fake.catch_phrase()}"
-        description = fake.text(max_nb_chars=200)
-        category = random.choice(categories)
-        price = round(random.uniform(10.0, 10000.0), 2)
-        stock = random.randint(0, 500)
-        created_at = fake.date_time_this_year().isoformat()
-        products.append({
-            'product_id': product_id,
-            'name': name,
-            'description': description,
-            'category': category,
-            'price': price,
-            'stock': stock,
-            'created_at': created_at
-        })
-    return products
-
-def generate_synthetic_user_data(count):
-    users = []
-    for _ in range(count):
-        user_id = str(uuid.uuid4())
-        username = fake.user_name()
-        email = fake.email()
-        registration_date = fake.date_time_this_decade().isoformat()
-        last_login = fake.date_time_this_year().isoformat()
-        users.append({
-            'user_id': user_id,
-            'username': username,
-            'email': email,
-            'registration_date': registration_date,
-            'last_login': last_login
-        })
-    return users
-
-def generate_synthetic_order_data(product_ids, user_ids, count):
-    orders = []
-    statuses = ['待付款', '已付款', '已发货', '已完成', '已取消']
-
-    if not product_ids:
+PRODUCT_CATEGORIES = ['电子产品', '服装鞋帽', '家居百货', '图书音像', '美妆个护', '食品饮料']
+ORDER_STATUSES = ['待付款', '已付款', '已发货', '已完成', '已取消']
+
+def build_faker_pool(seed=None, size=FAKER_POOL_SIZE):
+    """
+    预先生成 Faker 词汇池。批量生成数据时只需用 NumPy 随机下标从池中抽样，
+    避免每行每个字段调用一次 Faker。
+    """
+    pool_faker = Faker('zh_CN')
+    pool_faker.seed_instance(seed)
+    return {
+        'word': np.array([pool_faker.word() for _ in range(size)], dtype=object),
+        'color_name': np.array([pool_faker.color_name() for _ in range(size)], dtype=object),
+        'catch_phrase': np.array([pool_faker.catch_phrase() for _ in range(size)], dtype=object),
+        'text': np.array([pool_faker.text(max_nb_chars=200) for _ in range(size)], dtype=object),
+        'short_text': np.array([pool_faker.text(max_nb_chars=100) for _ in range(size)], dtype=object),
+        'user_name': np.array([pool_faker.user_name() for _ in range(size)], dtype=object),
+        'email_domain': np.array([pool_faker.free_email_domain() for _ in range(size)], dtype=object),
+        'country': np.array([pool_faker.country() for _ in range(size)], dtype=object),
+    }
+
+def _text_column(values):
+    """以 object dtype 包装字符串数组，避免 DataFrame 构造时逐元素转换为字符串扩展类型"""
+    return pd.Series(values, dtype=object, copy=False)
+
+def _sample_pool(rng, pool, field, count):
+    """从词汇池中有放回地抽取 count 个值"""
+    values = pool[field]
+    return values[rng.integers(0, len(values), count)]
+
+def _random_ids(rng, count):
+    """生成 count 个 32 位十六进制随机 ID (与 uuid4().hex 格式相同)"""
+    hex_digits = rng.bytes(16 * count).hex()
+    return np.array([hex_digits[i:i + 32] for i in range(0, 32 * count, 32)], dtype=object)
+
+def _random_timestamps(rng, start, end, count):
+    """在 [start, end) 内均匀抽取 count 个时间，返回 ISO 8601 字符串数组 (精确到秒)"""
+    start_s, end_s = int(pd.Timestamp(start).timestamp()), int(pd.Timestamp(end).timestamp())
+    seconds = rng.integers(start_s, max(end_s, start_s + 1), count).astype('datetime64[s]')
+    return np.datetime_as_string(seconds).astype(object)
+
+def _this_year_range():
+    """今年年初到今天零点 (按天取整，同一天内相同种子生成相同日期)"""
+    today = pd.Timestamp.now().normalize()
+    return today.replace(month=1, day=1), today
+
+def _this_decade_range():
+    """本年代年初到今天零点"""
+    today = pd.Timestamp.now().normalize()
+    return pd.Timestamp(year=today.year - today.year % 10, month=1, day=1), today
+
+def generate_synthetic_product_data(count, rng=None, pool=None):
+    """向量化生成 count 个模拟商品，返回 DataFrame"""
+    rng = rng if rng is not None else np.random.default_rng()
+    pool = pool if pool is not None else build_faker_pool()
+    names = (_sample_pool(rng, pool, 'word', count) + ' ' + _sample_pool(rng, pool, 'color_name', count)
+             + ' ' + _sample_pool(rng, pool, 'catch_phrase', count))
+    return pd.DataFrame({
+        'product_id': _text_column(_random_ids(rng, count)),
+        'name': _text_column(names),
+        'description': _text_column(_sample_pool(rng, pool, 'text', count)),
+        'category': _text_column(np.array(PRODUCT_CATEGORIES, dtype=object)[rng.integers(0, len(PRODUCT_CATEGORIES), count)]),
+        'price': np.round(rng.uniform(10.0, 10000.0, count), 2),
+        'stock': rng.integers(0, 501, count),
+        'created_at': _text_column(_random_timestamps(rng, *_this_year_range(), count)),
+    })
+
+def generate_synthetic_user_data(count, rng=None, pool=None):
+    """向量化生成 count 个模拟用户，返回 DataFrame。邮箱拼接序号以保证唯一"""
+    rng = rng if rng is not None else np.random.default_rng()
+    pool = pool if pool is not None else build_faker_pool()
+    usernames = _sample_pool(rng, pool, 'user_name', count)
+    emails = usernames + np.arange(count).astype(str).astype(object) + '@' + _sample_pool(rng, pool, 'email_domain', count)
+    return pd.DataFrame({
+        'user_id': _text_column(_random_ids(rng, count)),
+        'username': _text_column(usernames),
+        'email': _text_column(emails),
+        'registration_date': _text_column(_random_timestamps(rng, *_this_decade_range(), count)),
+        'last_login': _text_column(_random_timestamps(rng, *_this_year_range(), count)),
+    })
+
+def generate_synthetic_order_data(products_df, users_df, count, max_items_per_order=FAKE_ORDER_MAX_ITEMS, rng=None, pool=None):
+    """
+    向量化生成 count 个多商品模拟订单。
+    返回 (orders_df, items_df)，结构与 Online Retail 清洗结果一致，可直接交给 store_data_in_redis。
+    """
+    if products_df.empty:
         print("警告：没有可用的商品ID来生成订单。")
-        return []
-    if not user_ids:
+        return pd.DataFrame(), pd.DataFrame()
+    if users_df.empty:
         print("警告：没有可用的用户ID来生成订单。")
-        return []
-
-    for _ in range(count):
-        order_id = str(uuid.uuid4())
-        user_id = random.choice(user_ids)
-        product_id = random.choice(product_ids)
-        quantity = random.randint(1, 5)
-        unit_price = round(random.uniform(10.0, 500.0), 2)
-        order_date = fake.date_time_this_year().isoformat()
-        status = random.choice(statuses)
-        orders.append({
-            'order_id': order_id,
-            'user_id': user_id,
-            'product_id': product_id, # 注意：这里是单个商品ID，与Online Retail的多商品订单有差异
-            'quantity': quantity,
-            'unit_price': unit_price,
-            'order_date': order_date,
-            'status': status
-        })
-    return orders
-
-def collect_and_clean_faker_data():
+        return pd.DataFrame(), pd.DataFrame()
+
+    rng = rng if rng is not None else np.random.default_rng()
+    pool = pool if pool is not None else build_faker_pool()
+
+    order_ids = _random_ids(rng, count)
+    basket_sizes = rng.integers(1, max_items_per_order + 1, count)
+    line_orders = np.repeat(np.arange(count), basket_sizes)
+    line_products = rng.integers(0, len(products_df), len(line_orders))
+    quantities = rng.integers(1, 6, len(line_orders))
+    unit_prices = products_df['price'].to_numpy()[line_products]
+
+    items_df = _typed_items_frame(pd.DataFrame({
+        'order_id': order_ids[line_orders],
+        'StockCode': products_df['product_id'].to_numpy()[line_products],
+        'Description': products_df['name'].to_numpy()[line_products],
+        'Quantity': quantities,
+        'UnitPrice': unit_prices,
+    }), order_ids)
+    orders_df = pd.DataFrame({
+        'order_id': _text_column(order_ids),
+        'user_id': _text_column(users_df['user_id'].to_numpy()[rng.integers(0, len(users_df), count)]),
+        'order_date': _text_column(_random_timestamps(rng, *_this_year_range(), count)),
+        'total_amount': np.round(np.bincount(line_orders, weights=quantities * unit_prices, minlength=count), 2),
+        'country': _text_column(_sample_pool(rng, pool, 'country', count)),
+        'status': _text_column(np.array(ORDER_STATUSES, dtype=object)[rng.integers(0, len(ORDER_STATUSES), count)]),
+    })
+    return orders_df, items_df
+
+def generate_synthetic_dataset(product_count=FAKE_PRODUCT_COUNT, user_count=FAKE_USER_COUNT, order_count=FAKE_ORDER_COUNT,
+                               max_items_per_order=FAKE_ORDER_MAX_ITEMS, seed=None):
+    """
+    使用同一个随机种子生成完整的模拟数据集，返回 (products_df, users_df, orders_df, items_df)。
+    相同的 seed 生成相同的数据。
+    """
+    rng = np.random.default_rng(seed)
+    pool = build_faker_pool(seed)
+    products_df = generate_synthetic_product_data(product_count, rng, pool)
+    users_df = generate_synthetic_user_data(user_count, rng, pool)
+    orders_df, items_df = generate_synthetic_order_data(products_df, users_df, order_count, max_items_per_order, rng, pool)
+    return products_df, users_df, orders_df, items_df
+
+def collect_and_clean_faker_data(seed=None):
     """
     模拟数据收集和清洗过程（使用 Faker 生成数据）。
     """
-    products_df = pd.DataFrame(generate_synthetic_product_data(FAKE_PRODUCT_COUNT))
-    users_df = pd.DataFrame(generate_synthetic_user_data(FAKE_USER_COUNT))
-
-    product_ids_list = products_df['product_id'].tolist()
-    user_ids_list = users_df['user_id'].tolist()
-    orders_df = pd.DataFrame(generate_synthetic_order_data(product_ids_list, user_ids_list, FAKE_ORDER_COUNT))
+    products_df, users_df, orders_df, items_df = generate_synthetic_dataset(seed=seed)
 
     # 数据清洗示例
-    products_df.loc[:, 'description'] = products_df['description'].fillna('暂无描述')
-    products_df.loc[:, 'price'] = pd.to_numeric(products_df['price'], errors='coerce')
+    products_df['description'] = products_df['description'].fillna('暂无描述')
+    products_df['price'] = pd.to_numeric(products_df['price'], errors='coerce')
     products_df.dropna(subset=['price', 'stock'], inplace=True)
-    products_df.loc[:, 'category'] = products_df['category'].str.strip().str.lower()
+    products_df['category'] = products_df['category'].str.strip().str.lower()
 
-    users_df.loc[:, 'registration_date'] = pd.to_datetime(users_df['registration_date'], errors='coerce')
-    users_df.loc[:, 'last_login'] = pd.to_datetime(users_df['last_login'], errors='coerce')
     users_df.dropna(subset=['registration_date', 'last_login'], inplace=True)
 
-    orders_df.loc[:, 'quantity'] = pd.to_numeric(orders_df['quantity'], errors='coerce')
-    orders_df.loc[:, 'unit_price'] = pd.to_numeric(orders_df['unit_price'], errors='coerce')
-    orders_df.loc[:, 'order_date'] = pd.to_datetime(orders_df['order_date'], errors='coerce')
-    orders_df.dropna(subset=['quantity', 'unit_price', 'order_date'], inplace=True)
-    orders_df.loc[:, 'status'] = orders_df['status'].str.strip().str.lower()
+    items_df['Quantity'] = pd.to_numeric(items_df['Quantity'], errors='coerce')
+    items_df['UnitPrice'] = pd.to_numeric(items_df['UnitPrice'], errors='coerce')
+    items_df.dropna(subset=['Quantity', 'UnitPrice'], inplace=True)
+    items_df = items_df.astype(ORDER_ITEM_DTYPES)
+    orders_df.dropna(subset=['order_date'], inplace=True)
+    orders_df['status'] = orders_df['status'].str.strip().str.lower()
 
-    return products_df, users_df, orders_df
+    return products_df, users_df, orders_df, items_df
 
-# --- 数据生成与清洗 (Online Retail) ---
+# --- 订单项列式表示 ---
+
+# 订单项表的列类型：order_id 为以订单 ID 为类别的 Categorical，StockCode/Description 重复度高也用 Categorical
+ORDER_ITEM_DTYPES = {'StockCode': 'category', 'Description': 'category', 'Quantity': 'int32', 'UnitPrice': 'float32'}
 
-def load_and_clean_online_retail_data(fake_fill_missing=True):
+def _typed_items_frame(items_df, order_ids):
     """
-    从 Online Retail 数据集 (data.csv) 加载、清洗并转换为 products_df, users_df, orders_df。
+    把扁平订单项表转换为按列存储的紧凑格式 (ORDER_ITEM_DTYPES)，相比每单一个字典列表的 items 列
+    省去了每行数百字节的 Python 对象开销。行按订单在 order_ids 中的顺序稳定排序，
+    每单的明细连续存放，_order_item_offsets 可直接由 order_id 编码得到每单的偏移量。
     """
-    if not os.path.exists(ONLINE_RETAIL_DATA_PATH):
-        raise FileNotFoundError(f"未找到 {ONLINE_RETAIL_DATA_PATH} 文件。请确保已下载并放置在项目根目录。")
+    order_column = pd.Categorical(items_df['order_id'], categories=order_ids)
+    typed = items_df.drop(columns='order_id').astype(ORDER_ITEM_DTYPES)
+    typed.insert(0, 'order_id', order_column)
+    return typed.iloc[np.argsort(order_column.codes, kind='stable')].reset_index(drop=True)
 
-    df = pd.read_csv(ONLINE_RETAIL_DATA_PATH, encoding='ISO-8859-1')
+def _order_item_offsets(orders_df, items_df):
+    """
+    返回 (按 orders_df 订单顺序排列的 items_df, offsets)，第 i 个订单的明细为 items_df.iloc[offsets[i]:offsets[i + 1]]。
+    items_df 已是 _typed_items_frame 格式且类别与 orders_df 一致时直接使用 order_id 编码，不复制数据；
+    否则 (如并行导入的分区、增量同步的子集) 重新编码并稳定排序。
+    """
+    column = items_df['order_id']
+    if isinstance(column.dtype, pd.CategoricalDtype) and column.cat.categories.equals(pd.Index(orders_df['order_id'])):
+        codes = column.cat.codes.to_numpy()
+    else:
+        codes = pd.Categorical(column, categories=orders_df['order_id']).codes
+    keep = codes >= 0
+    if not keep.all():
+        items_df, codes = items_df[keep], codes[keep]
+    if len(codes) > 1 and (np.diff(codes) < 0).any():
+        order = np.argsort(codes, kind='stable')
+        items_df, codes = items_df.iloc[order], codes[order]
+    offsets = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(orders_df)))))
+    return items_df, offsets
 
-    # --- 数据清洗 ---
-    df.dropna(subset=['CustomerID'], inplace=True)
-    df['CustomerID'] = df['CustomerID'].astype(int).astype(str)
+# --- 数据生成与清洗 (Online Retail) ---
 
-    df.dropna(subset=['Description'], inplace=True)
+# InvoiceNo/StockCode 同时包含纯数字和字母编码，统一按字符串读取，避免分块读取时类型不一致
+ONLINE_RETAIL_READ_OPTIONS = {'encoding': 'ISO-8859-1', 'dtype': {'InvoiceNo': str, 'StockCode': str}}
 
-    df = df[df['Quantity'] > 0]
-    df = df[df['UnitPrice'] > 0]
+# 最近一次整表加载各阶段的耗时 (秒)：snapshot / read_csv / clean / enrich / aggregate / save_snapshot
+last_load_timings = {}
 
+def _clean_online_retail_lines(df):
+    """清洗 Online Retail 原始明细行（整表加载和流式导入共用）"""
+    df = df.dropna(subset=['CustomerID', 'Description'])
+    df = df[(df['Quantity'] > 0) & (df['UnitPrice'] > 0)].copy()
+    df['CustomerID'] = df['CustomerID'].astype(int).astype(str)
     df['InvoiceDate'] = pd.to_datetime(df['InvoiceDate'])
+    return df
 
-    # --- 提取 Products DataFrame ---
-    products_df = df[['StockCode', 'Description', 'UnitPrice']].copy()
-    products_df.rename(columns={'StockCode': 'product_id', 'Description': 'name'}, inplace=True)
-    products_df = products_df.groupby(['product_id', 'name'])['UnitPrice'].mean().reset_index()
-    products_df.rename(columns={'UnitPrice': 'price'}, inplace=True)
-    
-    # 补充缺失字段
+def _fill_product_fields(products_df, fake_fill_missing, rng=None, pool=None):
+    """
+    为 Online Retail 商品补充缺失字段。
+    补全时整列向量化抽样：分类、库存、日期由 NumPy 生成，描述从 Faker 词汇池中抽取。
+    """
+    count = len(products_df)
     if fake_fill_missing:
-        products_df['description'] = products_df['name'].apply(lambda x: fake.text(max_nb_chars=100))
-        categories = ['电子产品', '服装鞋帽', '家居百货', '图书音像', '美妆个护', '食品饮料']
-        products_df['category'] = products_df['product_id'].apply(lambda x: random.choice(categories))
-        products_df['stock'] = products_df['product_id'].apply(lambda x: random.randint(50, 500))
-        products_df['created_at'] = products_df['product_id'].apply(lambda x: fake.date_time_this_year().isoformat())
+        rng = rng if rng is not None else np.random.default_rng()
+        pool = pool if pool is not None else build_faker_pool()
+        products_df['description'] = _sample_pool(rng, pool, 'short_text', count)
+        products_df['category'] = np.array(PRODUCT_CATEGORIES, dtype=object)[rng.integers(0, len(PRODUCT_CATEGORIES), count)]
+        products_df['stock'] = rng.integers(50, 501, count)
+        products_df['created_at'] = _random_timestamps(rng, *_this_year_range(), count)
     else:
         products_df['description'] = ""
         products_df['category'] = "未知"
         products_df['stock'] = 0
         products_df['created_at'] = pd.Timestamp.now().isoformat()
+    return products_df
 
-
-    # --- 提取 Users DataFrame ---
-    users_df = df[['CustomerID']].copy().drop_duplicates()
-    users_df.rename(columns={'CustomerID': 'user_id'}, inplace=True)
-    # 补充缺失字段
+def _fill_user_fields(users_df, fake_fill_missing, rng=None, pool=None):
+    """
+    为 Online Retail 用户补充缺失字段。
+    用户名和邮箱域名从 Faker 词汇池中抽取，邮箱拼接 user_id 以保证唯一。
+    """
+    count = len(users_df)
     if fake_fill_missing:
-        users_df['username'] = users_df['user_id'].apply(lambda x: fake.user_name())
-        users_df['email'] = users_df['user_id'].apply(lambda x: fake.email())
-        users_df['registration_date'] = users_df['user_id'].apply(lambda x: fake.date_time_this_decade().isoformat())
-        users_df['last_login'] = users_df['user_id'].apply(lambda x: fake.date_time_this_year().isoformat())
+        rng = rng if rng is not None else np.random.default_rng()
+        pool = pool if pool is not None else build_faker_pool()
+        usernames = _sample_pool(rng, pool, 'user_name', count)
+        users_df['username'] = usernames
+        users_df['email'] = usernames + users_df['user_id'].to_numpy(dtype=object) + '@' + _sample_pool(rng, pool, 'email_domain', count)
+        users_df['registration_date'] = _random_timestamps(rng, *_this_decade_range(), count)
+        users_df['last_login'] = _random_timestamps(rng, *_this_year_range(), count)
     else:
         users_df['username'] = "匿名用户"
         users_df['email'] = ""
         users_df['registration_date'] = pd.Timestamp.now().isoformat()
         users_df['last_login'] = pd.Timestamp.now().isoformat()
+    return users_df
 
+def _aggregate_invoices(df, rng=None):
+    """
+    按 InvoiceNo 把清洗后的明细行聚合为订单 (多商品订单处理)，全部使用向量化操作。
+    返回 (orders_df, items_df)：orders_df 每张发票一行 (首行的用户/日期/国家、总金额、随机状态)；
+    items_df 是 _typed_items_frame 格式的扁平明细表，同一订单的明细保持原文件中的顺序。
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+
+    lines = df[~df['InvoiceNo'].astype(str).str.contains('C', regex=False)] # 排除退货订单
+    order_ids = lines['InvoiceNo'].astype(str)
+
+    headers = lines.drop_duplicates('InvoiceNo') # 每张发票的首行
+    orders_df = pd.DataFrame({
+        'order_id': order_ids.loc[headers.index].values,
+        'user_id': headers['CustomerID'].values,
+        'order_date': headers['InvoiceDate'].dt.strftime('%Y-%m-%dT%H:%M:%S').values,
+        'country': headers['Country'].values,
+    })
+    total_amount = (lines['Quantity'] * lines['UnitPrice']).groupby(order_ids, sort=False).sum()
+    orders_df.insert(3, 'total_amount', total_amount.reindex(orders_df['order_id']).values)
+    orders_df['status'] = rng.choice(ONLINE_RETAIL_ORDER_STATUSES, size=len(orders_df))
+    orders_df = orders_df.sort_values('order_id', kind='stable', ignore_index=True)
+
+    items_df = lines[['StockCode', 'Description', 'Quantity', 'UnitPrice']].copy()
+    items_df.insert(0, 'order_id', order_ids.values)
+    return orders_df, _typed_items_frame(items_df, orders_df['order_id'])
+
+# --- 清洗结果快照缓存 ---
+
+SNAPSHOT_FRAMES = ('products', 'users', 'orders', 'items')
+
+def _file_content_hash(path, block_size=1 << 20):
+    """按块计算文件内容的 BLAKE2b 摘要"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _snapshot_dir(path, options):
+    """
+    根据源文件的大小、修改时间、内容摘要以及清洗选项计算快照目录 "{文件名}-{选项摘要}-{源文件摘要}"。
+    任意一项变化都会得到新的目录，旧快照自然失效；选项摘要单独成段，供 _save_snapshot 只清理同一组选项的旧快照。
+    """
+    stat = os.stat(path)
+    options_source = json.dumps({'version': SNAPSHOT_FORMAT_VERSION, 'options': options}, sort_keys=True)
+    source_source = json.dumps({
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+        'content': _file_content_hash(path),
+    }, sort_keys=True)
+    options_key = hashlib.sha1(options_source.encode('utf-8')).hexdigest()[:12]
+    source_key = hashlib.sha1(source_source.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(SNAPSHOT_CACHE_DIR, f"{os.path.basename(path)}-{options_key}-{source_key}")
+
+def _load_snapshot(snapshot_dir):
+    """读取快照，使用内存映射避免整列复制；快照不存在或不完整时返回 None"""
+    if pyarrow is None or not os.path.isdir(snapshot_dir):
+        return None
+    try:
+        return tuple(pyarrow.feather.read_table(os.path.join(snapshot_dir, f"{name}.feather"), memory_map=True).to_pandas()
+                     for name in SNAPSHOT_FRAMES)
+    except Exception as e:
+        print(f"读取快照失败，将重新清洗数据: {e}")
+        return None
 
-    # --- 提取 Orders DataFrame (多商品订单处理) ---
-    orders_grouped = df.groupby('InvoiceNo')
+def _save_snapshot(snapshot_dir, frames):
+    """
+    把清洗结果写入快照目录。先写临时目录再整体改名，避免留下半成品；
+    同一源文件、同一组清洗选项的旧快照 (源文件的大小、修改时间或内容不同) 随后被删除，
+    其他选项组合的快照保留。写入失败只打印警告，不影响加载。
+    """
+    if pyarrow is None:
+        return
+    tmp_dir = f"{snapshot_dir}.tmp-{os.getpid()}"
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        for name, frame in zip(SNAPSHOT_FRAMES, frames):
+            frame.reset_index(drop=True).to_feather(os.path.join(tmp_dir, f"{name}.feather"))
+        if os.path.isdir(snapshot_dir):
+            shutil.rmtree(snapshot_dir)
+        os.replace(tmp_dir, snapshot_dir)
+    except Exception as e:
+        print(f"写入快照失败: {e}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return
+
+    prefix = os.path.basename(snapshot_dir).rsplit('-', 1)[0] + '-'
+    for entry in os.listdir(SNAPSHOT_CACHE_DIR):
+        entry_path = os.path.join(SNAPSHOT_CACHE_DIR, entry)
+        if entry.startswith(prefix) and entry_path != snapshot_dir and '.tmp-' not in entry:
+            shutil.rmtree(entry_path, ignore_errors=True)
+
+def clear_snapshot_cache():
+    """删除所有清洗结果快照"""
+    if not os.path.isdir(SNAPSHOT_CACHE_DIR):
+        return "没有快照缓存。", True
+    try:
+        shutil.rmtree(SNAPSHOT_CACHE_DIR)
+        return "快照缓存已清除。", True
+    except Exception as e:
+        return f"清除快照缓存失败: {e}", False
 
-    orders_data = []
-    for invoice_no, group in orders_grouped:
-        if 'C' in str(invoice_no): # 排除退货订单
-            continue
+def load_and_clean_online_retail_data(fake_fill_missing=True, seed=None, use_cache=True):
+    """
+    从 Online Retail 数据集 (data.csv) 加载、清洗并转换为 products_df, users_df, orders_df, items_df。
+    seed 控制补全字段和订单状态的随机抽样，相同 seed 得到相同结果。
+    use_cache 为 True 且安装了 pyarrow 时，清洗结果会缓存为 SNAPSHOT_CACHE_DIR 下的 Arrow IPC 快照，
+    源文件与清洗选项不变时直接内存映射读取快照，跳过解析和清洗。
+    注意 seed=None 也会缓存：之后的加载都返回首次随机补全的结果，需要重新随机时传 use_cache=False 或先 clear_snapshot_cache。
+    各阶段耗时记录在 last_load_timings 中。
+    """
+    if not os.path.exists(ONLINE_RETAIL_DATA_PATH):
+        raise FileNotFoundError(f"未找到 {ONLINE_RETAIL_DATA_PATH} 文件。请确保已下载并放置在项目根目录。")
 
-        order_id = str(invoice_no)
-        user_id = group['CustomerID'].iloc[0]
-        order_date = group['InvoiceDate'].iloc[0].isoformat()
-        total_amount = (group['Quantity'] * group['UnitPrice']).sum()
-        country = group['Country'].iloc[0]
+    timings = {}
+    snapshot_dir = None
+    if use_cache and pyarrow is not None:
+        stage_start = time.perf_counter()
+        snapshot_dir = _snapshot_dir(ONLINE_RETAIL_DATA_PATH, {'fake_fill_missing': fake_fill_missing, 'seed': seed})
+        frames = _load_snapshot(snapshot_dir)
+        timings['snapshot'] = time.perf_counter() - stage_start
+        if frames is not None:
+            last_load_timings.clear()
+            last_load_timings.update(timings)
+            print(f"Online Retail 从快照加载: {snapshot_dir} ({timings['snapshot']:.2f}s)")
+            return frames
+
+    stage_start = time.perf_counter()
+    df = pd.read_csv(ONLINE_RETAIL_DATA_PATH, **ONLINE_RETAIL_READ_OPTIONS)
+    timings['read_csv'] = time.perf_counter() - stage_start
 
-        status = random.choice(['已付款', '已发货', '已完成'])
+    # --- 数据清洗 ---
+    stage_start = time.perf_counter()
+    df = _clean_online_retail_lines(df)
 
-        orders_data.append({
-            'order_id': order_id,
-            'user_id': user_id,
-            'order_date': order_date,
-            'total_amount': total_amount,
-            'country': country,
-            'status': status,
-            'items': group[['StockCode', 'Description', 'Quantity', 'UnitPrice']].to_dict(orient='records')
-        })
-    orders_df = pd.DataFrame(orders_data)
+    # --- 提取 Products DataFrame ---
+    products_df = df[['StockCode', 'Description', 'UnitPrice']].copy()
+    products_df.rename(columns={'StockCode': 'product_id', 'Description': 'name'}, inplace=True)
+    products_df = products_df.groupby(['product_id', 'name'])['UnitPrice'].mean().reset_index()
+    products_df.rename(columns={'UnitPrice': 'price'}, inplace=True)
 
-    return products_df, users_df, orders_df
+    # --- 提取 Users DataFrame ---
+    users_df = df[['CustomerID']].copy().drop_duplicates()
+    users_df.rename(columns={'CustomerID': 'user_id'}, inplace=True)
+    timings['clean'] = time.perf_counter() - stage_start
+
+    # --- 补充缺失字段 ---
+    stage_start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    pool = build_faker_pool(seed) if fake_fill_missing else None
+    products_df = _fill_product_fields(products_df, fake_fill_missing, rng, pool)
+    users_df = _fill_user_fields(users_df, fake_fill_missing, rng, pool)
+    timings['enrich'] = time.perf_counter() - stage_start
+
+    # --- 提取 Orders / Items DataFrame (多商品订单处理) ---
+    stage_start = time.perf_counter()
+    orders_df, items_df = _aggregate_invoices(df, rng)
+    timings['aggregate'] = time.perf_counter() - stage_start
+
+    frames = (products_df, users_df, orders_df, items_df)
+    if snapshot_dir:
+        stage_start = time.perf_counter()
+        os.makedirs(SNAPSHOT_CACHE_DIR, exist_ok=True)
+        _save_snapshot(snapshot_dir, frames)
+        timings['save_snapshot'] = time.perf_counter() - stage_start
+
+    last_load_timings.clear()
+    last_load_timings.update(timings)
+    print("Online Retail 加载耗时: " + ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in timings.items()))
+
+    return frames
+
+def stream_online_retail_to_redis(fake_fill_missing=True, chunksize=ONLINE_RETAIL_CHUNK_SIZE, flush_db=True, batch_size=STORE_BATCH_SIZE, seed=None,
+                                  staging=False, progress_callback=None):
+    """
+    分块流式读取 Online Retail 数据集并直接写入 Redis，内存占用不随文件大小增长。
+    每块清洗后立即写入新用户和已结束的订单；块末尾尚未结束的发票（可能跨越块边界）
+    暂存到下一块再处理。商品平均价格按 (StockCode, Description) 累加，读完后统一写入。
+    要求同一 InvoiceNo 的明细在文件中连续出现（原始导出即如此）。
+    每块处理后调用 progress_callback(info) 并把进度写入 INGEST_CHECKPOINT_KEY (总行数按已读字节比例估算)。
+    跨块的商品价格累计等状态只在内存中，流式导入不支持断点续传；中断后重新导入即可，
+    配合 staging=True 时活动库不受中断影响。
+    """
+    if not os.path.exists(ONLINE_RETAIL_DATA_PATH):
+        raise FileNotFoundError(f"未找到 {ONLINE_RETAIL_DATA_PATH} 文件。请确保已下载并放置在项目根目录。")
+
+    r_client, error = _target_client(staging, flush_db)
+    if not r_client:
+        return error, False
+
+    start_time = time.perf_counter()
+    price_totals = None # 以 (product_id, name) 为索引的 UnitPrice 累计和与行数，规模只与商品数相关
+    seen_user_ids = set()
+    open_lines = None # 跨块未结束发票的明细行
+    line_count = user_count = order_count = 0
+    rng = np.random.default_rng(seed)
+    enrich_start = time.perf_counter()
+    pool = build_faker_pool(seed) if fake_fill_missing else None
+    enrich_seconds = time.perf_counter() - enrich_start
+
+    def store_lines(lines):
+        nonlocal price_totals, user_count, order_count, enrich_seconds
+        stats = lines.groupby(['StockCode', 'Description'])['UnitPrice'].agg(['sum', 'count'])
+        price_totals = stats if price_totals is None else price_totals.add(stats, fill_value=0)
+
+        new_user_ids = [uid for uid in lines['CustomerID'].unique() if uid not in seen_user_ids]
+        if new_user_ids:
+            seen_user_ids.update(new_user_ids)
+            enrich_start = time.perf_counter()
+            users_df = _fill_user_fields(pd.DataFrame({'user_id': new_user_ids}), fake_fill_missing, rng, pool)
+            enrich_seconds += time.perf_counter() - enrich_start
+            user_count += _store_users(r_client, users_df, batch_size, buckets=_record_buckets(r_client, 'user'))
+
+        orders_df, items_df = _aggregate_invoices(lines, rng)
+        order_count += _store_orders(r_client, orders_df, items_df, batch_size)
+
+    file_size = os.path.getsize(ONLINE_RETAIL_DATA_PATH)
+    with open(ONLINE_RETAIL_DATA_PATH, 'rb') as handle:
+        for chunk in pd.read_csv(handle, chunksize=chunksize, **ONLINE_RETAIL_READ_OPTIONS):
+            line_count += len(chunk)
+            last_invoice = chunk['InvoiceNo'].iloc[-1]
+            lines = _clean_online_retail_lines(chunk)
+            if open_lines is not None:
+                lines = pd.concat([open_lines, lines])
+            is_open = lines['InvoiceNo'] == last_invoice
+            open_lines = lines[is_open]
+            if (~is_open).any():
+                store_lines(lines[~is_open])
+
+            # 总行数未知，按已读取的字节比例估算，用于计算 ETA
+            read_fraction = min(handle.tell() / file_size, 1.0) if file_size else 1.0
+            info = _progress_info('stream', line_count, int(line_count / read_fraction) if read_fraction else None, start_time)
+            r_client.hset(INGEST_CHECKPOINT_KEY, mapping={key: ('' if value is None else value) for key, value in info.items()})
+            if progress_callback:
+                progress_callback(info)
+
+    if open_lines is not None and not open_lines.empty:
+        store_lines(open_lines)
+
+    product_count = unique_product_count = 0
+    if price_totals is not None:
+        products_df = (price_totals['sum'] / price_totals['count']).rename('price').reset_index()
+        products_df.rename(columns={'StockCode': 'product_id', 'Description': 'name'}, inplace=True)
+        enrich_start = time.perf_counter()
+        products_df = _fill_product_fields(products_df, fake_fill_missing, rng, pool)
+        enrich_seconds += time.perf_counter() - enrich_start
+        product_count = _store_products(r_client, products_df, batch_size, buckets=_record_buckets(r_client, 'product'))
+        unique_product_count = products_df['product_id'].nunique()
+
+    r_client.delete(INGEST_CHECKPOINT_KEY)
+    elapsed = time.perf_counter() - start_time
+    rows_per_sec = line_count / elapsed if elapsed > 0 else float(line_count)
+    message = (f"流式导入完成：读取明细 {line_count} 行，写入商品 {product_count} 条，用户 {user_count} 条，订单 {order_count} 条，"
+               f"耗时 {elapsed:.2f} 秒 ({rows_per_sec:,.0f} 行/秒)，其中补全字段 {enrich_seconds:.2f} 秒。")
+    if not staging:
+        return message, True
+    swap_message, success = _promote_staging({"product:all_ids": unique_product_count,
+                                              "user:all_ids": user_count, "order:all_ids": order_count})
+    return f"{message}\n{swap_message}", success
 
 # --- 数据存储与管理 (Redis) ---
 
-def store_data_in_redis(products_df, users_df, orders_df, flush_db=True):
+def _frame_to_records(df, exclude=()):
+    """
+    按列把 DataFrame 转换为 {字段: 字符串} 映射列表。
+    每列只做一次 astype(str)，避免 iterrows() 逐行构造 Series 的开销。
+    """
+    columns = [col for col in df.columns if col not in exclude]
+    if not columns or df.empty:
+        return []
+    str_columns = [df[col].astype(str).tolist() for col in columns]
+    return [dict(zip(columns, values)) for values in zip(*str_columns)]
+
+# --- 商品/用户记录访问 (隐藏 hash / bucketed 布局) ---
+
+RECORD_LAYOUT_KEY = "layout:records" # Hash：实体 -> 桶数量；没有该字段表示每条记录一个 Hash
+RECORD_ENTITIES = ('product', 'user')
+# bucketed 布局中记录值的字段顺序 (ID 即桶内字段名，不重复存放)；不在其中的字段放在数组末尾的对象里
+RECORD_FIELDS = {
+    'product': ('name', 'category', 'price', 'stock', 'created_at', 'description'),
+    'user': ('username', 'email', 'registration_date', 'last_login'),
+}
+
+def _configured_buckets(record_count=None):
+    """按 RECORD_LAYOUT 配置写入 record_count 条记录时使用的桶数量，hash 布局返回 None"""
+    if RECORD_LAYOUT != 'bucketed':
+        return None
+    if RECORD_BUCKET_COUNT:
+        return RECORD_BUCKET_COUNT
+    if record_count is None:
+        return RECORD_BUCKET_DEFAULT_COUNT
+    return _bucket_count_for(record_count)
+
+def _bucket_count_for(record_count):
+    """按每个桶 RECORD_BUCKET_SIZE 条记录计算桶数量"""
+    return max(1, math.ceil(record_count / RECORD_BUCKET_SIZE))
+
+def _record_buckets(r_client, entity):
+    """读取库中 entity 记录实际使用的桶数量，hash 布局返回 None"""
+    value = r_client.hget(RECORD_LAYOUT_KEY, entity)
+    return int(value) if value else None
+
+def _bucket_key(entity, record_id, bucket_count):
+    """记录所在的桶 key，按 ID 的 CRC32 取模，与进程和 Python 版本无关"""
+    return f"{entity}:bucket:{zlib.crc32(str(record_id).encode('utf-8')) % bucket_count}"
+
+def _record_storage_keys(entity, record_ids, buckets):
+    """存放这些记录的 key 列表 (去重)"""
+    if buckets is None:
+        return [f"{entity}:{record_id}" for record_id in record_ids]
+    return list(dict.fromkeys(_bucket_key(entity, record_id, buckets) for record_id in record_ids))
+
+def _pack_record(entity, record):
+    """
+    把记录编码为 bucketed 布局的值：按 RECORD_FIELDS 排列的 JSON 数组，缺失的字段为 null，末尾的 null 省略；
+    ID 和 RECORD_FIELDS 之外的字段分别由桶内字段名和数组末尾的对象保存
+    """
+    fields = RECORD_FIELDS[entity]
+    values = [None if record.get(field) is None else str(record[field]) for field in fields]
+    while values and values[-1] is None:
+        values.pop()
+    extra = {key: str(value) for key, value in record.items() if key not in fields and key != f"{entity}_id"}
+    if extra:
+        values += [None] * (len(fields) - len(values)) + [extra]
+    return json.dumps(values, ensure_ascii=False, separators=(',', ':'))
+
+def _unpack_record(entity, record_id, value):
+    """_pack_record 的逆操作；也接受早期以字段名为键的 JSON 对象"""
+    packed = json.loads(value)
+    if isinstance(packed, dict):
+        return packed
+    extra = packed.pop() if len(packed) > len(RECORD_FIELDS[entity]) else {}
+    record = {f"{entity}_id": str(record_id)}
+    record.update((field, item) for field, item in zip(RECORD_FIELDS[entity], packed) if item is not None)
+    record.update(extra)
+    return record
+
+def _queue_record(pipe, entity, record, buckets):
+    """把一条完整记录 ({字段: 值}) 的写入命令加入 pipeline，覆盖已有记录的同名字段"""
+    record_id = record[f"{entity}_id"]
+    if buckets is None:
+        pipe.hset(f"{entity}:{record_id}", mapping=record)
+    else:
+        pipe.hset(_bucket_key(entity, record_id, buckets), record_id, _pack_record(entity, record))
+
+def _queue_record_delete(pipe, entity, record_id, buckets):
+    """把删除一条记录的命令加入 pipeline"""
+    if buckets is None:
+        pipe.delete(f"{entity}:{record_id}")
+    else:
+        pipe.hdel(_bucket_key(entity, record_id, buckets), record_id)
+
+def _read_records(r_client, entity, record_ids, buckets, fields=None):
+    """
+    按指定布局批量读取记录；bucketed 布局下同一个桶的 ID 合并为一条 HMGET。
+    fields 为要读取的字段 (None 表示全部)：hash 布局用 HMGET 只传输这些字段，
+    bucketed 布局的记录是一个 JSON 值，只能读出后再按 fields 裁剪。
+    """
+    if buckets is None:
+        pipe = r_client.pipeline(transaction=False)
+        for record_id in record_ids:
+            if fields is None:
+                pipe.hgetall(f"{entity}:{record_id}")
+            else:
+                pipe.hmget(f"{entity}:{record_id}", fields)
+        if fields is None:
+            return pipe.execute()
+        return [{field: value for field, value in zip(fields, values) if value is not None} for values in pipe.execute()]
+
+    positions_by_bucket = {}
+    for position, record_id in enumerate(record_ids):
+        positions_by_bucket.setdefault(_bucket_key(entity, record_id, buckets), []).append(position)
+    pipe = r_client.pipeline(transaction=False)
+    for key, positions in positions_by_bucket.items():
+        pipe.hmget(key, [record_ids[position] for position in positions])
+    records = [{} for _ in record_ids]
+    for positions, values in zip(positions_by_bucket.values(), pipe.execute()):
+        for position, value in zip(positions, values):
+            if value:
+                record = _unpack_record(entity, record_ids[position], value)
+                records[position] = record if fields is None else {field: record[field] for field in fields if field in record}
+    return records
+
+def _fetch_records(r_client, entity, record_ids, decompress=True, fields=None):
+    """
+    按 ID 批量读取商品或用户记录，返回与 record_ids 对齐的 {字段: 字符串} 列表，不存在的记录为 {}。
+    字典编码的字段已还原为原值；decompress=False 时压缩字段保持压缩，由调用方按需调用 _decompress_records。
+    fields 为只读取的字段 (None 表示全部)，含义同 _read_records。
+    """
+    records = _read_records(r_client, entity, list(record_ids), _record_buckets(r_client, entity), fields)
+    records = _decode_records(records, _load_dictionaries(r_client, entity))
+    return _decompress_records(records, entity) if decompress else records
+
+def _save_record(r_client, entity, record_id, fields):
+    """
+    把 fields 合并进一条记录 (不存在则新建)。hash 布局直接 HSET；
+    bucketed 布局在 WATCH 桶 key 的事务中读出、合并后写回，避免并发修改同一桶时丢失更新。
+    """
+    fields = {key: str(value) for key, value in fields.items()}
+    buckets = _record_buckets(r_client, entity)
+    if buckets is None:
+        r_client.hset(f"{entity}:{record_id}", mapping=fields)
+        return
+    key = _bucket_key(entity, record_id, buckets)
+
+    def merge(pipe):
+        current = pipe.hget(key, record_id)
+        record = _unpack_record(entity, record_id, current) if current else {f"{entity}_id": str(record_id)}
+        record.update(fields)
+        pipe.multi()
+        _queue_record(pipe, entity, record, buckets)
+
+    r_client.transaction(merge, key)
+
+def _queue_record_layout(pipe, record_counts=None):
+    """
+    写入 RECORD_LAYOUT_KEY，声明之后的商品和用户记录按 RECORD_LAYOUT 存放；
+    record_counts ({实体: 记录数}) 用于按 _configured_buckets 确定各实体的桶数量
+    """
+    pipe.delete(RECORD_LAYOUT_KEY)
+    if RECORD_LAYOUT == 'bucketed':
+        pipe.hset(RECORD_LAYOUT_KEY, mapping={entity: _configured_buckets((record_counts or {}).get(entity))
+                                              for entity in RECORD_ENTITIES})
+
+def _prepare_record_layout(r_client, flushed, record_counts=None):
     """
-    将清洗后的数据存储到 Redis。
+    全量写入前调用。刚清空的库直接声明 RECORD_LAYOUT (桶数量见 _queue_record_layout)；
+    未清空时要求已有数据的布局种类与配置一致 (之后按库中声明的桶数量写入)，
+    否则抛出 ValueError (请先 migrate_record_layout)，库中还没有商品和用户时同样直接声明。
     """
+    bucketed = RECORD_LAYOUT == 'bucketed'
+    if not flushed and all((_record_buckets(r_client, entity) is not None) == bucketed for entity in RECORD_ENTITIES):
+        return
+    if not flushed and r_client.exists("product:all_ids", "user:all_ids"):
+        raise ValueError(f"库中商品/用户记录的布局与 RECORD_LAYOUT={RECORD_LAYOUT!r} 不一致，请先调用 migrate_record_layout 迁移。")
+    pipe = r_client.pipeline()
+    _queue_record_layout(pipe, record_counts)
+    pipe.execute()
+
+def _listpack_limits(r_client):
+    """服务器的 (hash-max-listpack-entries, hash-max-listpack-value)，Redis 7 之前为 ziplist 名称；CONFIG 不可用时返回 None"""
+    try:
+        config = r_client.config_get('hash-max-*')
+    except redis.exceptions.RedisError:
+        return None
+    entries = config.get('hash-max-listpack-entries', config.get('hash-max-ziplist-entries'))
+    value = config.get('hash-max-listpack-value', config.get('hash-max-ziplist-value'))
+    return (int(entries), int(value)) if entries and value else None
+
+def _bucket_encoding_warning(r_client, frames):
+    """
+    bucketed 布局全量导入后的检查：frames 为 {实体: DataFrame}。按库中声明的桶数量计算最满的桶的记录数，
+    并按各字段的 UTF-8 长度估算最长的打包记录，与服务器的 listpack 上限比较。超出时桶会转为 hashtable 编码，
+    bucketed 布局失去节省内存的作用，返回提示 (没有问题或无法检查时返回空字符串)。
+    """
+    bucket_counts = {entity: _record_buckets(r_client, entity) for entity in frames}
+    if all(buckets is None for buckets in bucket_counts.values()):
+        return ""
+    limits = _listpack_limits(r_client)
+    if limits is None:
+        return ""
+    max_entries, max_value = limits
+    problems = []
+    for entity, df in frames.items():
+        buckets = bucket_counts[entity]
+        if buckets is None or df.empty:
+            continue
+        ids = df[f"{entity}_id"].astype(str).unique()
+        fullest = int(np.bincount([zlib.crc32(record_id.encode('utf-8')) % buckets for record_id in ids]).max())
+        columns = [column for column in df.columns if column != f"{entity}_id"]
+        longest = int(sum(df[column].astype(str).str.encode('utf-8').str.len() for column in columns).max()) + 3 * len(columns) + 2
+        if fullest > max_entries:
+            problems.append(f"{entity} 最满的桶有 {fullest} 条记录，超过 hash-max-listpack-entries={max_entries} (可增大桶数量)")
+        if longest > max_value:
+            problems.append(f"{entity} 最长的记录约 {longest} 字节，超过 hash-max-listpack-value={max_value}")
+    if not problems:
+        return ""
+    return "\n注意：部分记录桶将使用 hashtable 编码，bucketed 布局无法节省内存：" + "；".join(problems) + "。"
+
+# --- 低基数字段的字典编码 ---
+
+DICT_VALUES_KEY = "dict:{entity}:{field}" # Hash：编码 -> 原值，读取时解码用
+DICT_CODES_KEY = "dict:{entity}:{field}:codes" # Hash：原值 -> 编码，写入时编码用
+DICT_NEXT_KEY = "dict:next" # Hash：{entity}:{field} -> 下一个可分配的编码
+
+def _allocate_code(r_client, entity, field, value):
+    """为一个新值分配编码；HSETNX 保证并发写入者对同一个值得到相同编码"""
+    codes_key = DICT_CODES_KEY.format(entity=entity, field=field)
+    code = r_client.hincrby(DICT_NEXT_KEY, f"{entity}:{field}", 1) - 1
+    if r_client.hsetnx(codes_key, value, code):
+        r_client.hset(DICT_VALUES_KEY.format(entity=entity, field=field), code, value)
+        return str(code)
+    return r_client.hget(codes_key, value)
+
+def _assign_codes(r_client, entity, df, fresh=False):
+    """
+    为 df 中 DICT_ENCODED_FIELDS 列的取值分配编码，返回 {字段: {原值: 编码}}；未启用 DICT_ENCODING 时返回 None。
+    码表中已有的值沿用原编码。fresh=True 表示目标库刚清空且 r_client 无法读取回复 (_RespWriter)，
+    此时从 0 开始顺序分配，并把码表的写入命令直接加入 r_client。
+    """
+    if not DICT_ENCODING:
+        return None
+    codes = {}
+    for field in DICT_ENCODED_FIELDS.get(entity, ()):
+        if field not in df.columns:
+            continue
+        values = pd.unique(df[field].astype(str))
+        if fresh:
+            table = {value: str(code) for code, value in enumerate(values)}
+            if table:
+                r_client.hset(DICT_CODES_KEY.format(entity=entity, field=field), mapping=table)
+                r_client.hset(DICT_VALUES_KEY.format(entity=entity, field=field), mapping={code: value for value, code in table.items()})
+                r_client.hset(DICT_NEXT_KEY, f"{entity}:{field}", len(table))
+        else:
+            table = r_client.hgetall(DICT_CODES_KEY.format(entity=entity, field=field))
+            for value in values:
+                if value not in table:
+                    table[value] = _allocate_code(r_client, entity, field, value)
+        codes[field] = table
+    return codes
+
+def _encode_value(r_client, entity, field, value):
+    """CRUD 写入单个字段时使用：需要编码的字段返回其编码 (必要时分配)，其他字段原样返回"""
+    value = str(value)
+    if not DICT_ENCODING or field not in DICT_ENCODED_FIELDS.get(entity, ()):
+        return value
+    code = r_client.hget(DICT_CODES_KEY.format(entity=entity, field=field), value)
+    return code if code is not None else _allocate_code(r_client, entity, field, value)
+
+def _encode_fields(r_client, entity, fields):
+    """对 {字段: 值} 中需要编码的字段逐一编码"""
+    return {key: _encode_value(r_client, entity, key, value) for key, value in fields.items()}
+
+def _load_dictionaries(r_client, entity):
+    """读取 entity 的解码表 {字段: {编码: 原值}}，没有码表的字段不出现在结果中"""
+    fields = DICT_ENCODED_FIELDS.get(entity, ())
+    if not fields:
+        return {}
+    pipe = r_client.pipeline(transaction=False)
+    for field in fields:
+        pipe.hgetall(DICT_VALUES_KEY.format(entity=entity, field=field))
+    return {field: table for field, table in zip(fields, pipe.execute()) if table}
+
+def _decode_records(records, dictionaries):
+    """按解码表原地还原记录中的编码字段，码表中没有的值 (未编码的旧数据) 保持不变"""
+    if not dictionaries:
+        return records
+    for record in records:
+        for field, table in dictionaries.items():
+            value = record.get(field)
+            if value is not None:
+                record[field] = table.get(value, value)
+    return records
+
+# --- 大文本字段压缩 ---
+
+COMPRESSION_PREFIXES = {'zlib': '\x00z:', 'zstd': '\x00s:'} # 压缩值的前缀，普通文本不会以 NUL 开头
+
+def _compress_text(text):
+    """按 COMPRESSION 压缩一个字段值；未启用、低于阈值或压缩后不更短时返回原文本"""
+    raw = text.encode('utf-8')
+    if COMPRESSION is None or len(raw) < COMPRESSION_MIN_BYTES:
+        return text
+    if COMPRESSION == 'zstd':
+        if zstandard is None:
+            raise ValueError("COMPRESSION='zstd' 需要安装 zstandard。")
+        packed = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(raw)
+    else:
+        packed = zlib.compress(raw, COMPRESSION_LEVEL)
+    stored = COMPRESSION_PREFIXES[COMPRESSION] + base64.b85encode(packed).decode('ascii')
+    return stored if len(stored) < len(raw) else text
+
+def _decompress_text(value):
+    """_compress_text 的逆操作，未压缩的值原样返回"""
+    if not value or not value.startswith('\x00'):
+        return value
+    for method, prefix in COMPRESSION_PREFIXES.items():
+        if value.startswith(prefix):
+            packed = base64.b85decode(value[len(prefix):])
+            if method == 'zstd':
+                if zstandard is None:
+                    raise ValueError("读取 zstd 压缩的字段需要安装 zstandard。")
+                return zstandard.ZstdDecompressor().decompress(packed).decode('utf-8')
+            return zlib.decompress(packed).decode('utf-8')
+    return value
+
+def _compress_frame(df, entity):
+    """写入前压缩 df 中 entity 的 COMPRESSED_FIELDS 列"""
+    columns = [field for field in COMPRESSED_FIELDS.get(entity, ()) if field in df.columns]
+    if COMPRESSION is None or not columns or df.empty:
+        return df
+    return df.assign(**{field: [_compress_text(str(value)) for value in df[field].tolist()] for field in columns})
+
+def _compress_fields(entity, fields):
+    """CRUD 写入时压缩 {字段: 值} 中的 COMPRESSED_FIELDS 字段"""
+    compressed = COMPRESSED_FIELDS.get(entity, ())
+    return {key: _compress_text(str(value)) if key in compressed else value for key, value in fields.items()}
+
+def _decompress_records(records, entity):
+    """原地解压记录中的压缩字段"""
+    fields = COMPRESSED_FIELDS.get(entity, ())
+    for record in records:
+        for field in fields:
+            if field in record:
+                record[field] = _decompress_text(record[field])
+    return records
+
+def get_compression_report():
+    """统计库中 COMPRESSED_FIELDS 各字段的压缩数量与节省的字节数，返回 (报告消息, 成功标志)"""
     r_client = get_redis_client()
     if not r_client:
-        return "Redis 连接失败，无法存储数据。", False
+        return "Redis 连接失败。", False
 
-    if flush_db:
-        r_client.flushdb()
+    lines = []
+    try:
+        for entity, fields in COMPRESSED_FIELDS.items():
+            records = _fetch_records(r_client, entity, r_client.smembers(f"{entity}:all_ids"), decompress=False)
+            for field in fields:
+                stored_bytes = original_bytes = compressed_count = value_count = 0
+                for record in records:
+                    value = record.get(field)
+                    if not value:
+                        continue
+                    original = _decompress_text(value)
+                    value_count += 1
+                    compressed_count += original is not value
+                    stored_bytes += len(value.encode('utf-8'))
+                    original_bytes += len(original.encode('utf-8'))
+                saved = original_bytes - stored_bytes
+                ratio = saved / original_bytes if original_bytes else 0.0
+                lines.append(f"{entity}.{field}: {compressed_count}/{value_count} 个值已压缩，原始 {original_bytes / 1e3:.1f} KB，"
+                             f"存储 {stored_bytes / 1e3:.1f} KB，节省 {saved / 1e3:.1f} KB ({ratio:.1%})")
+    except Exception as e:
+        return f"统计压缩情况失败: {e}", False
+    return "字段压缩统计：\n" + "\n".join(f"  {line}" for line in lines), True
 
-    pipe = r_client.pipeline()
+# --- 列表排序索引 ---
 
-    # 1. 存储商品数据
-    for index, row in products_df.iterrows():
-        product_id = row['product_id']
-        category = row['category']
-        for key, value in row.to_dict().items():
-            pipe.hset(f"product:{product_id}", key, str(value))
-        pipe.sadd(f"category:{category}:products", product_id)
-        pipe.sadd("product:all_ids", product_id)
-        pipe.zadd("product:prices", {product_id: float(row['price'])})
-    pipe.execute()
+def _date_score(value):
+    """把 ISO 日期字符串转换为 Unix 时间戳作为有序集合分数，缺失或无法解析时为 0"""
+    try:
+        return datetime.fromisoformat(str(value)).timestamp()
+    except (TypeError, ValueError):
+        return 0.0
 
-    # 2. 存储用户数据
+def _number_score(value):
+    """把数值字段转换为有序集合分数，缺失或无法解析时为 0"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+# 实体 -> {排序字段: (有序集合 key, 分数函数)}；每个有序集合覆盖该实体的全部记录，
+# 分数相同时 Redis 按成员 (ID) 字典序排列，因此排序是稳定的，可用作游标分页
+SORT_INDEXES = {
+    'product': {
+        'created_at': ("product:by_created", _date_score),
+        'price': ("product:prices", _number_score),
+        'stock': ("product:by_stock", _number_score),
+    },
+    'user': {
+        'registration_date': ("user:by_registered", _date_score),
+    },
+    'order': {
+        'order_date': ("order:by_date", _date_score),
+        'total_amount': ("order:by_total", _number_score),
+    },
+}
+
+# 排序字段 -> 网页和桌面端下拉框中的显示名称；新增 SORT_INDEXES 字段时在此补上名称
+SORT_FIELD_LABELS = {
+    'created_at': '创建时间',
+    'price': '价格',
+    'stock': '库存',
+    'registration_date': '注册日期',
+    'order_date': '订单日期',
+    'total_amount': '订单金额',
+}
+
+# 实体 -> 默认列表排序字段；无搜索条件的列表按该字段从新到旧分页
+LIST_SORT_FIELDS = {'product': 'created_at', 'user': 'registration_date', 'order': 'order_date'}
+
+# 实体 -> 列表页默认读取的字段 (与网页和桌面列表的列一致)；列表 API 的 fields 参数为 None 时读取全部字段
+LIST_FIELDS = {
+    'product': ('product_id', 'name', 'category', 'price', 'stock'),
+    'user': ('user_id', 'username', 'email', 'registration_date', 'last_login'),
+    'order': ('order_id', 'user_id', 'total_amount', 'country', 'order_date', 'status'),
+}
+
+def _sort_index_key(entity, sort_by=None):
+    """返回 entity 按 sort_by (默认 LIST_SORT_FIELDS) 排序的有序集合 key，未知的排序字段抛出 ValueError"""
+    sort_by = sort_by or LIST_SORT_FIELDS[entity]
+    if sort_by not in SORT_INDEXES[entity]:
+        raise ValueError(f"{entity} 不支持按 {sort_by!r} 排序，可选: {', '.join(SORT_INDEXES[entity])}")
+    return SORT_INDEXES[entity][sort_by][0]
+
+def _queue_list_index(pipe, entity, record_id, record):
+    """把记录加入 entity 的排序索引；只更新 record 中出现的排序字段，因此也可传入部分更新的字段"""
+    for field, (key, score) in SORT_INDEXES[entity].items():
+        if field in record:
+            pipe.zadd(key, {record_id: score(record[field])})
+
+def _queue_list_index_delete(pipe, entity, record_id):
+    """把记录从 entity 的全部排序索引中移除"""
+    for key, _ in SORT_INDEXES[entity].values():
+        pipe.zrem(key, record_id)
+
+# 订单筛选字段 -> 按 order_date 计分的有序集合 key 模板；key 中使用原值 (未编码)
+ORDER_FILTER_INDEXES = {
+    'status': "order:by_status:{value}",
+    'country': "order:by_country:{value}",
+    'user_id': "user:{value}:orders_by_date",
+}
+
+def _queue_order_filter_index(pipe, order_id, order, pending_pushes=None):
+    """
+    把订单加入 ORDER_FILTER_INDEXES 中的有序集合；order 中需要有 order_date 和筛选字段的原值。
+    传入 pending_pushes 时先缓存在其中，由 _flush_pending_pushes 按 key 合并成一条多成员 ZADD。
+    索引与订单 Hash 是否原子可见取决于调用方的 pipeline：只有单条记录的 CRUD (update_order_status) 在 MULTI 中更新；
+    全量导入和增量同步经 _write_batched 使用非事务 pipeline，批次执行期间读取方可能看到已写入 Hash 但尚未进入索引的订单。
+    """
+    score = _date_score(order.get('order_date'))
+    for field, key in ORDER_FILTER_INDEXES.items():
+        value = order.get(field)
+        if value in (None, ''):
+            continue
+        if pending_pushes is None:
+            pipe.zadd(key.format(value=value), {order_id: score})
+        else:
+            pending_pushes.setdefault(key.format(value=value), {})[order_id] = score
+
+def _queue_order_filter_index_delete(pipe, order_id, record):
+    """按旧记录 record 把订单从 ORDER_FILTER_INDEXES 中移除；record 为 None (订单不存在) 时不做任何事"""
+    if not record:
+        return
+    for field, key in ORDER_FILTER_INDEXES.items():
+        if record.get(field) not in (None, ''):
+            pipe.zrem(key.format(value=record[field]), order_id)
+
+def _index_page(r_client, entity, page, page_size):
+    """
+    用默认列表排序索引取一页 ID，返回 (ID 列表, 总数)。索引的元素数与 {entity}:all_ids 不一致
+    (例如数据在引入索引之前写入，尚未 rebuild_list_indexes) 时返回 None，由调用方退回全量扫描。
+    """
+    key = _sort_index_key(entity)
+    pipe = r_client.pipeline(transaction=False)
+    pipe.zcard(key)
+    pipe.scard(f"{entity}:all_ids")
+    total, id_count = pipe.execute()
+    if total != id_count:
+        return None
+    start = max(page - 1, 0) * page_size
+    return r_client.zrevrange(key, start, start + page_size - 1), total
+
+def rebuild_list_indexes(batch_size=STORE_BATCH_SIZE):
+    """
+    按现有记录重建 SORT_INDEXES 中的全部排序索引、订单的 ORDER_FILTER_INDEXES 和 PRODUCT_CATEGORIES_KEY，
+    用于索引引入之前写入的数据
+    """
+    r_client = get_redis_client()
+    if not r_client:
+        return "Redis 连接失败。", False
+
+    counts = {}
+    try:
+        for entity, indexes in SORT_INDEXES.items():
+            fields = list(indexes)
+            record_ids = list(r_client.smembers(f"{entity}:all_ids"))
+            r_client.delete(*(key for key, _ in indexes.values()))
+            if entity == 'order':
+                dictionaries = _load_dictionaries(r_client, 'order')
+                filter_fields = [field for field in ['order_date', *ORDER_FILTER_INDEXES] if field not in fields]
+                for key in ORDER_FILTER_INDEXES.values():
+                    stale_keys = list(r_client.scan_iter(key.format(value='*'), count=10000))
+                    for start in range(0, len(stale_keys), batch_size):
+                        r_client.delete(*stale_keys[start:start + batch_size])
+            for start in range(0, len(record_ids), batch_size):
+                batch = record_ids[start:start + batch_size]
+                if entity == 'order':
+                    pipe = r_client.pipeline(transaction=False)
+                    for order_id in batch:
+                        pipe.hmget(f"order:{order_id}", fields + filter_fields)
+                    records = [dict(zip(fields + filter_fields, values)) for values in pipe.execute()]
+                    pipe = r_client.pipeline(transaction=False)
+                    for order_id, record in zip(batch, _decode_records([dict(record) for record in records], dictionaries)):
+                        _queue_order_filter_index(pipe, order_id, record)
+                    pipe.execute()
+                else:
+                    records = _fetch_records(r_client, entity, batch, decompress=False)
+                pipe = r_client.pipeline(transaction=False)
+                for record_id, record in zip(batch, records):
+                    # 缺失的字段也按 0 分写入，保证每个索引覆盖全部记录
+                    _queue_list_index(pipe, entity, record_id, {field: (record or {}).get(field) for field in fields})
+                pipe.execute()
+            counts[entity] = len(record_ids)
+        # 分类名集合按现有的非空分类集合重建，去掉商品已全部删除的分类
+        category_keys = [key for key in r_client.scan_iter("category:*:products", count=10000) if r_client.scard(key)]
+        r_client.delete(PRODUCT_CATEGORIES_KEY)
+        if category_keys:
+            r_client.sadd(PRODUCT_CATEGORIES_KEY, *(key.split(':')[1] for key in category_keys))
+    except Exception as e:
+        return f"重建列表索引失败: {e}", False
+    return f"列表索引已重建：商品 {counts['product']} 条，用户 {counts['user']} 条，订单 {counts['order']} 条。", True
+
+# --- 游标分页 ---
+
+def _encode_cursor(direction, score, member):
+    """把翻页方向和边界元素 (分数, 成员) 编码为不透明的 URL 安全字符串"""
+    return base64.urlsafe_b64encode(json.dumps([direction, score, member]).encode('utf-8')).decode('ascii')
+
+def _decode_cursor(cursor):
+    """解析 _encode_cursor 生成的游标，返回 (方向, 分数, 成员)，格式不正确时抛出 ValueError"""
+    try:
+        direction, score, member = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"无效的分页游标: {cursor!r}") from e
+    if direction not in ('next', 'prev'):
+        raise ValueError(f"无效的分页游标: {cursor!r}")
+    return direction, float(score), str(member)
+
+def _cursor_range(r_client, key, descending, page_size, cursor=None, page=1):
+    """
+    在有序集合 key 上定位一页，返回 (起始排名, 结束排名, 有序集合元素数)，排名按 descending 方向计算。
+    有游标时用 ZRANK/ZREVRANK 找到边界元素的排名，是 O(log N)，深分页与第一页开销相同；
+    边界元素已被删除或分数已变化时，用 ZCOUNT 统计分数排在游标之前的元素，再加上与游标同分且
+    成员排在游标之前的元素 (同分元素按成员字节序排列)，得到游标所在位置。
+    没有游标时按页码换算排名，同样不需要逐条跳过前面的元素。
+    """
+    if not cursor:
+        total = r_client.zcard(key)
+        start = max(page - 1, 0) * page_size
+        return start, start + page_size - 1, total
+
+    direction, score, member = _decode_cursor(cursor)
+    pipe = r_client.pipeline(transaction=False)
+    pipe.zcard(key)
+    (pipe.zrevrank if descending else pipe.zrank)(key, member)
+    pipe.zscore(key, member)
+    total, rank, current_score = pipe.execute()
+    if rank is None or current_score != score:
+        # 排在游标之前的元素个数，就是游标之后第一个元素的排名
+        pipe = r_client.pipeline(transaction=False)
+        if descending:
+            pipe.zcount(key, f"({score}", "+inf")
+        else:
+            pipe.zcount(key, "-inf", f"({score}")
+        pipe.zrangebyscore(key, score, score)
+        before, ties = pipe.execute()
+        member_bytes = member.encode('utf-8')
+        before += sum((tie.encode('utf-8') > member_bytes) if descending else (tie.encode('utf-8') < member_bytes) for tie in ties)
+        next_start, prev_end = before, before - 1
+    else:
+        next_start, prev_end = rank + 1, rank - 1
+    if direction == 'next':
+        return next_start, next_start + page_size - 1, total
+    # 向前翻到开头时补足为完整的第一页
+    prev_start = prev_end - page_size + 1
+    return (prev_start, prev_end, total) if prev_start >= 0 else (0, page_size - 1, total)
+
+def _sorted_page_ids(r_client, entity, sort_by, descending, page_size, cursor=None, page=1):
+    """
+    按排序索引取一页 ID，返回 (ID 列表, 分页信息)。分页信息包含 page、total、total_pages，
+    next_cursor / prev_cursor (没有下一页或上一页时为 None)，以及 indexed：
+    索引元素数与 {entity}:all_ids 一致时为 True，否则索引尚未覆盖全部记录，应先 rebuild_list_indexes。
+    """
+    key = _sort_index_key(entity, sort_by)
+    start, end, total = _cursor_range(r_client, key, descending, page_size, cursor, page)
+    indexed = total == r_client.scard(f"{entity}:all_ids")
+    entries = []
+    if end >= start:
+        entries = (r_client.zrevrange if descending else r_client.zrange)(key, start, end, withscores=True)
+    page_info = {
+        'page': start // page_size + 1,
+        'total': total,
+        'total_pages': math.ceil(total / page_size) if total > 0 else 1,
+        'next_cursor': _encode_cursor('next', entries[-1][1], entries[-1][0]) if entries and start + len(entries) < total else None,
+        'prev_cursor': _encode_cursor('prev', entries[0][1], entries[0][0]) if entries and start > 0 else None,
+        'indexed': indexed,
+    }
+    return [member for member, _ in entries], page_info
+
+# --- 全文搜索索引 ---
+
+SEARCH_INDEX_KEY = "search:{entity}:{token}" # Sorted Set：记录 ID -> 搜索词所在字段的权重之和
+SEARCH_TERMS_KEY = "search:terms:{entity}" # Sorted Set (分数均为 0)：英文/数字搜索词，按字典序做前缀展开
+SEARCH_INDEXED_KEY = "search:indexed" # 存在时表示库中全部记录都已写入搜索索引
+_SEARCH_WORD_RE = re.compile(r'[0-9a-z]+|[\u4e00-\u9fff]+')
+
+def _is_cjk(word):
+    """判断搜索词是否为中文"""
+    return '\u4e00' <= word[0] <= '\u9fff'
+
+@functools.lru_cache(maxsize=65536)
+def _search_tokens(text):
+    """
+    把文本切分为搜索词：英文和数字按单词 (转小写)，中文按相邻二字 (不含单字，单字查询退回全量扫描)。
+    重复出现的值 (国家、状态等) 只切分一次
+    """
+    tokens = set()
+    for word in _SEARCH_WORD_RE.findall(text.lower()):
+        if _is_cjk(word):
+            tokens.update(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.add(word)
+    return frozenset(tokens)
+
+def _query_tokens(search_query):
+    """
+    把搜索条件切分为查询词，返回 (必须全部命中的词, 前缀词)。中文词按相邻二字匹配；
+    最后一个词是英文/数字时作为前缀词单独返回，由 _search_page 展开为所有以它开头的搜索词，否则前缀词为 None。
+    没有可索引的词 (例如只有标点) 或包含单个汉字的词时无法用索引匹配，此时返回 None，由调用方退回全量扫描。
+    """
+    words = _SEARCH_WORD_RE.findall(search_query.lower())
+    if not words:
+        return None
+    tokens = []
+    for word in words:
+        if not _is_cjk(word):
+            tokens.append(word)
+        elif len(word) == 1:
+            return None
+        else:
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    prefix = tokens.pop() if words and not _is_cjk(words[-1]) else None
+    return list(dict.fromkeys(tokens)), prefix
+
+def _record_search_scores(entity, record):
+    """返回记录的 {搜索词: 分数}，分数为包含该词的 SEARCH_FIELDS 字段的权重之和；record 中的字段为原值 (未编码)"""
+    scores = {}
+    for field, weight in SEARCH_FIELDS[entity].items():
+        value = record.get(field)
+        if value is None:
+            continue
+        for token in _search_tokens(_decompress_text(str(value))):
+            scores[token] = scores.get(token, 0) + weight
+    return scores
+
+def _queue_search_index(pipe, entity, record_id, record, pending_pushes=None):
+    """
+    把记录的搜索词写入倒排索引，英文/数字词同时加入 SEARCH_TERMS_KEY。
+    传入 pending_pushes 时先缓存在其中，由 _flush_pending_pushes 在批次结束时按词合并成一条多成员 ZADD。
+    """
+    scores = _record_search_scores(entity, record)
+    if not scores:
+        return
+    flush_now = pending_pushes is None
+    if flush_now:
+        pending_pushes = {}
+    key_prefix = SEARCH_INDEX_KEY.format(entity=entity, token='')
+    for token, score in scores.items():
+        pending_pushes.setdefault(key_prefix + token, {})[record_id] = score
+    terms = pending_pushes.setdefault(SEARCH_TERMS_KEY.format(entity=entity), {})
+    for token in scores:
+        if not _is_cjk(token):
+            terms[token] = 0
+    if flush_now:
+        _flush_pending_pushes(pipe, pending_pushes)
+
+def _queue_search_index_delete(pipe, entity, record_id, record):
+    """按旧记录 record 把记录从倒排索引中移除；record 为 None (记录不存在) 时不做任何事"""
+    if not record:
+        return
+    for token in _record_search_scores(entity, record):
+        pipe.zrem(SEARCH_INDEX_KEY.format(entity=entity, token=token), record_id)
+
+def _queue_search_declaration(pipe):
+    """声明搜索索引覆盖库中全部记录。只在清空数据库后或重建索引后调用，之后的每次写入都会维护索引"""
+    pipe.set(SEARCH_INDEXED_KEY, 1)
+
+# --- 搜索结果缓存 ---
+
+SEARCH_CACHE_KEY = "cache:search:{entity}:{digest}" # Sorted Set：一次搜索的全部命中 ID，ZREVRANGE 即为结果顺序
+WRITE_VERSION_KEY = "cache:write_version:{entity}" # 实体的写入版本号，每次增删改该实体的记录时 INCR
+
+def _queue_write_version(pipe, entity):
+    """把 entity 写入版本号加一的命令加入写入记录的 pipeline，使该实体已缓存的搜索结果失效"""
+    pipe.incr(WRITE_VERSION_KEY.format(entity=entity))
+
+def _search_cache_key(r_client, entity, search_query, source):
+    """
+    返回搜索结果的缓存 key：由 CACHE_EPOCH_KEY、实体写入版本号、结果来源 (source: 'index' 或 'scan')
+    和规范化的搜索条件 (小写、合并空白) 共同决定，写入或全量导入之后自然换成新的 key，旧 key 按 TTL 过期。
+    """
+    pipe = r_client.pipeline(transaction=False)
+    pipe.get(CACHE_EPOCH_KEY)
+    pipe.get(WRITE_VERSION_KEY.format(entity=entity))
+    epoch, version = pipe.execute()
+    normalized = ' '.join(search_query.lower().split())
+    digest = hashlib.sha1(f"{epoch}\x00{version or 0}\x00{source}\x00{normalized}".encode('utf-8')).hexdigest()
+    return SEARCH_CACHE_KEY.format(entity=entity, digest=digest)
+
+def _cached_search_page(r_client, cache_key, page, page_size):
+    """从缓存的搜索结果中取一页，返回 (当前页 ID 列表, 命中总数)；缓存不存在时返回 None (没有命中的搜索不缓存)"""
+    start = max(page - 1, 0) * page_size
+    pipe = r_client.pipeline(transaction=False)
+    pipe.zcard(cache_key)
+    pipe.zrevrange(cache_key, start, start + page_size - 1)
+    total, page_ids = pipe.execute()
+    return (page_ids, total) if total else None
+
+def _store_search_ids(r_client, cache_key, record_ids):
+    """按顺序缓存全量扫描得到的命中 ID (分数为负的序号，ZREVRANGE 得到原顺序)"""
+    if not record_ids:
+        return
     pipe = r_client.pipeline()
-    for index, row in users_df.iterrows():
-        user_id = row['user_id']
-        for key, value in row.to_dict().items():
-            pipe.hset(f"user:{user_id}", key, str(value))
-        pipe.sadd("user:all_ids", user_id)
+    pipe.delete(cache_key)
+    for start in range(0, len(record_ids), STORE_BATCH_SIZE):
+        pipe.zadd(cache_key, {record_id: -(start + idx) for idx, record_id in enumerate(record_ids[start:start + STORE_BATCH_SIZE])})
+    pipe.expire(cache_key, SEARCH_CACHE_TTL)
     pipe.execute()
 
-    # 3. 存储订单数据
+def _scan_search_page(r_client, entity, search_query, page, page_size, scan):
+    """
+    没有搜索索引时的搜索：先查全量扫描结果的缓存，命中时返回 (当前页 ID 列表, 总数, None)；
+    否则调用 scan(matched_ids) 全量扫描，缓存全部命中的 ID，返回 (None, 总数, 当前页记录)。
+    """
+    cache_key = _search_cache_key(r_client, entity, search_query, 'scan')
+    cached = _cached_search_page(r_client, cache_key, page, page_size)
+    if cached is not None:
+        return cached[0], cached[1], None
+    matched_ids = []
+    records, total_items = scan(matched_ids)
+    _store_search_ids(r_client, cache_key, matched_ids)
+    return None, total_items, records
+
+def _search_page(r_client, entity, search_query, page, page_size):
+    """
+    用倒排索引搜索 entity，返回 (当前页 ID 列表, 命中总数)，按分数 (命中字段的权重) 从高到低排列。
+    各查询词的倒排列表用 ZINTERSTORE 求交集，前缀词先用 ZUNIONSTORE 合并最多 SEARCH_PREFIX_EXPANSIONS 个展开词；
+    开销取决于最短倒排列表和展开词的命中数，与记录总数无关。合并/求交集的结果写入 _search_cache_key 并保留
+    SEARCH_CACHE_TTL 秒，同一搜索翻页时直接取其中一段；只有一个倒排列表时直接在其上分页。
+    库中没有 SEARCH_INDEXED_KEY (数据在引入搜索索引之前写入，尚未 rebuild_search_index) 或 _query_tokens 无法切分搜索条件时
+    返回 None，由调用方退回全量扫描。
+    与全量扫描的子串匹配不同，这里按词匹配：英文/数字词须完整匹配，只有最后一个词可以只写开头。
+    """
+    query = _query_tokens(search_query)
+    if query is None:
+        return None
+    cache_key = _search_cache_key(r_client, entity, search_query, 'index')
+    cached = _cached_search_page(r_client, cache_key, page, page_size)
+    if cached is not None:
+        return cached
+    if not r_client.exists(SEARCH_INDEXED_KEY):
+        return None
+    tokens, prefix = query
+    keys = [SEARCH_INDEX_KEY.format(entity=entity, token=token) for token in tokens]
     pipe = r_client.pipeline()
-    for index, row in orders_df.iterrows():
-        order_id = row['order_id']
-        user_id = row['user_id']
-        
-        order_details = row.drop('items').to_dict()
-        for key, value in order_details.items():
-            pipe.hset(f"order:{order_id}", key, str(value))
-        
-        for item_idx, item in enumerate(row['items']):
-            item_id = f"{order_id}:{item_idx}"
-            for key, value in item.items():
-                pipe.hset(f"order_item:{item_id}", key, str(value))
-            pipe.rpush(f"order:{order_id}:items", item_id)
-            pipe.lpush(f"product:{item['StockCode']}:sales", item_id)
-
-        pipe.lpush(f"user:{user_id}:orders", order_id)
-        pipe.sadd("order:all_ids", order_id)
+    temp_keys = []
+    term_keys = None
+    if prefix is not None:
+        terms = r_client.zrangebylex(SEARCH_TERMS_KEY.format(entity=entity), f"[{prefix}", f"({prefix}\x7f",
+                                     start=0, num=SEARCH_PREFIX_EXPANSIONS)
+        if not terms:
+            return [], 0
+        term_keys = [SEARCH_INDEX_KEY.format(entity=entity, token=term) for term in terms]
+        if len(term_keys) == 1:
+            keys.extend(term_keys)
+            term_keys = None
+    if not keys and term_keys is None:
+        return [], 0
+    if len(keys) == 1 and term_keys is None:
+        result_key = keys[0]
+    else:
+        # 合并/求交集的结果直接写入缓存 key；结果为空时 Redis 不会创建该 key，空结果因此不缓存
+        result_key = cache_key
+        if term_keys is None:
+            pipe.zinterstore(cache_key, keys, aggregate='SUM')
+        elif not keys:
+            pipe.zunionstore(cache_key, term_keys, aggregate='MAX')
+        else:
+            temp_keys.append(f"search:tmp:{uuid.uuid4().hex}")
+            pipe.zunionstore(temp_keys[-1], term_keys, aggregate='MAX')
+            pipe.zinterstore(cache_key, keys + temp_keys, aggregate='SUM')
+        pipe.expire(cache_key, SEARCH_CACHE_TTL)
+    start = max(page - 1, 0) * page_size
+    pipe.zcard(result_key)
+    pipe.zrevrange(result_key, start, start + page_size - 1)
+    if temp_keys:
+        pipe.delete(*temp_keys)
+    results = pipe.execute()
+    offset = -3 if temp_keys else -2
+    total, page_ids = results[offset], results[offset + 1]
+    return page_ids, total
+
+def rebuild_search_index(batch_size=STORE_BATCH_SIZE):
+    """按现有记录重建全部搜索索引，用于搜索索引引入之前写入的数据；完成后搜索改用索引"""
+    r_client = get_redis_client()
+    if not r_client:
+        return "Redis 连接失败。", False
+
+    counts = {}
+    try:
+        r_client.delete(SEARCH_INDEXED_KEY)
+        stale_keys = list(r_client.scan_iter("search:*", count=10000))
+        for start in range(0, len(stale_keys), batch_size):
+            r_client.delete(*stale_keys[start:start + batch_size])
+        for entity, fields in SEARCH_FIELDS.items():
+            record_ids = list(r_client.smembers(f"{entity}:all_ids"))
+            dictionaries = _load_dictionaries(r_client, entity) if entity == 'order' else None
+            for start in range(0, len(record_ids), batch_size):
+                batch = record_ids[start:start + batch_size]
+                if entity == 'order':
+                    pipe = r_client.pipeline(transaction=False)
+                    for order_id in batch:
+                        pipe.hmget(f"order:{order_id}", list(fields))
+                    records = _decode_records([dict(zip(fields, values)) for values in pipe.execute()], dictionaries)
+                else:
+                    records = _fetch_records(r_client, entity, batch)
+                pipe = r_client.pipeline(transaction=False)
+                for record_id, record in zip(batch, records):
+                    if record:
+                        _queue_search_index(pipe, entity, record_id, record)
+                pipe.execute()
+            counts[entity] = len(record_ids)
+        r_client.set(SEARCH_INDEXED_KEY, 1)
+    except Exception as e:
+        return f"重建搜索索引失败: {e}", False
+    return f"搜索索引已重建：商品 {counts['product']} 条，用户 {counts['user']} 条，订单 {counts['order']} 条。", True
+
+def _queue_product(pipe, product, codes=None, pending_pushes=None, buckets=None):
+    """
+    把单个商品及其索引写入命令加入 pipeline；codes 为 _assign_codes 的结果，分类集合仍使用原值。
+    pending_pushes 含义同 _queue_order，用于合并搜索索引的写入；buckets 为库中声明的记录桶数量 (hash 布局为 None)
+    """
+    product_id = product['product_id']
+    record = product
+    if codes:
+        record = dict(product)
+        for field, table in codes.items():
+            record[field] = table[str(product[field])]
+    _queue_record(pipe, 'product', record, buckets)
+    pipe.sadd(f"category:{product['category']}:products", product_id)
+    pipe.sadd(PRODUCT_CATEGORIES_KEY, product['category'])
+    pipe.sadd("product:all_ids", product_id)
+    _queue_list_index(pipe, 'product', product_id, product) # 价格、库存、创建时间排序索引
+    _queue_search_index(pipe, 'product', product_id, product, pending_pushes)
+
+def _queue_user(pipe, user, pending_pushes=None, buckets=None):
+    """把单个用户及其索引写入命令加入 pipeline，pending_pushes 和 buckets 含义同 _queue_product"""
+    user_id = user['user_id']
+    _queue_record(pipe, 'user', user, buckets)
+    pipe.sadd("user:all_ids", user_id)
+    _queue_list_index(pipe, 'user', user_id, user)
+    _queue_search_index(pipe, 'user', user_id, user, pending_pushes)
+
+def _queue_order(pipe, order, items, pending_pushes=None, codes=None):
+    """
+    把单个订单、订单项及相关索引写入命令加入 pipeline；codes 含义同 _queue_product，搜索索引使用原值。
+    传入 pending_pushes 时，商品销售记录与用户订单列表的 LPUSH 以及筛选索引、搜索索引的 ZADD 会先缓存在其中，
+    由 _flush_pending_pushes 在批次结束时按 key 合并成一条多值 LPUSH / ZADD。
+    """
+    if pending_pushes is None:
+        pending_pushes = {}
+        flush_now = True
+    else:
+        flush_now = False
+
+    order_id = order['order_id']
+    record = order
+    if codes:
+        record = dict(order)
+        for field, table in codes.items():
+            record[field] = table[str(order[field])]
+    pipe.hset(f"order:{order_id}", mapping=record)
+
+    item_ids = []
+    for item_idx, item in enumerate(items):
+        item_id = f"{order_id}:{item_idx}"
+        if ORDER_ITEMS_LAYOUT != 'packed':
+            pipe.hset(f"order_item:{item_id}", mapping={key: str(value) for key, value in item.items()})
+        pending_pushes.setdefault(f"product:{item['StockCode']}:sales", []).append(item_id)
+        item_ids.append(item_id)
+    if item_ids:
+        if ORDER_ITEMS_LAYOUT == 'packed':
+            pipe.set(f"order:{order_id}:items_packed", _pack_order_items(items))
+        else:
+            pipe.rpush(f"order:{order_id}:items", *item_ids)
+
+    pending_pushes.setdefault(f"user:{order['user_id']}:orders", []).append(order_id)
+    pipe.sadd("order:all_ids", order_id)
+    _queue_list_index(pipe, 'order', order_id, order)
+    _queue_order_filter_index(pipe, order_id, order, pending_pushes)
+    _queue_search_index(pipe, 'order', order_id, order, pending_pushes)
+
+    if flush_now:
+        _flush_pending_pushes(pipe, pending_pushes)
+
+def _queue_product_delete(pipe, product_id, category, buckets=None, record=None):
+    """
+    把删除单个商品及其索引的命令加入 pipeline，buckets 为 _record_buckets 读出的商品记录布局，
+    record 为删除前的商品记录 (用于从搜索索引中移除)
+    """
+    _queue_record_delete(pipe, 'product', product_id, buckets) # 删除商品详情记录
+    _queue_search_index_delete(pipe, 'product', product_id, record)
+    pipe.srem("product:all_ids", product_id) # 从所有商品ID集合中移除
+    _queue_list_index_delete(pipe, 'product', product_id) # 从价格等排序Sorted Set中移除
+    if category:
+        pipe.srem(f"category:{category}:products", product_id) # 从分类Set中移除
+    pipe.delete(f"product:{product_id}:sales") # 删除该商品的销售记录列表
+    _queue_cache_invalidate(pipe, 'product', product_id)
+
+def _queue_user_delete(pipe, user_id, buckets=None, record=None):
+    """把删除单个用户及其索引的命令加入 pipeline (不级联删除该用户的订单)，buckets 和 record 含义同 _queue_product_delete"""
+    _queue_record_delete(pipe, 'user', user_id, buckets) # 删除用户详情记录
+    _queue_search_index_delete(pipe, 'user', user_id, record)
+    pipe.srem("user:all_ids", user_id) # 从所有用户ID集合中移除
+    _queue_list_index_delete(pipe, 'user', user_id)
+    pipe.delete(f"user:{user_id}:orders", f"user:{user_id}:orders_by_date") # 删除用户订单历史List及按日期的订单索引
+    _queue_cache_invalidate(pipe, 'user', user_id)
+
+def _queue_order_delete(pipe, order_id, user_id, item_ids, stock_codes, record=None):
+    """
+    把删除单个订单、订单项及相关索引的命令加入 pipeline。
+    user_id、item_ids、stock_codes 和 record 由 _fetch_order_refs 读取，用于从用户订单列表、商品销售列表、筛选索引和搜索索引中移除引用。
+    """
+    pipe.delete(f"order:{order_id}") # 删除订单详情Hash
+    _queue_cache_invalidate(pipe, 'order', order_id)
+    _queue_order_filter_index_delete(pipe, order_id, record)
+    _queue_search_index_delete(pipe, 'order', order_id, record)
+    pipe.srem("order:all_ids", order_id) # 从所有订单ID集合中移除
+    _queue_list_index_delete(pipe, 'order', order_id)
+    if user_id:
+        pipe.lrem(f"user:{user_id}:orders", 0, order_id) # 从用户订单历史中移除
+    for item_id, stock_code in zip(item_ids, stock_codes):
+        pipe.delete(f"order_item:{item_id}")
+        if stock_code:
+            pipe.lrem(f"product:{stock_code}:sales", 0, item_id)
+    pipe.delete(f"order:{order_id}:items", f"order:{order_id}:items_packed") # 删除订单项列表 (两种布局)
+
+def _pack_order_items(items):
+    """把一个订单的订单项编码为按列组织的紧凑 JSON，每个字段名只出现一次，值与 Hash 布局一样存为字符串"""
+    return json.dumps({field: [str(item[field]) for item in items] for field in items[0]},
+                      ensure_ascii=False, separators=(',', ':'))
+
+def _unpack_order_items(packed):
+    """_pack_order_items 的逆操作，返回订单项映射列表"""
+    columns = json.loads(packed)
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
+
+def _fetch_order_items(r_client, order_ids):
+    """
+    读取一批订单的订单项，自动识别存储布局。
+    返回与 order_ids 对齐的 [(布局, item_ids, items)]，订单没有订单项时布局为 None。
+    """
+    pipe = r_client.pipeline(transaction=False)
+    for order_id in order_ids:
+        pipe.get(f"order:{order_id}:items_packed")
+        pipe.lrange(f"order:{order_id}:items", 0, -1)
+    results = pipe.execute()
+    packed_values, item_lists = results[0::2], results[1::2]
+    for item_ids in item_lists:
+        for item_id in item_ids:
+            pipe.hgetall(f"order_item:{item_id}")
+    item_hashes = iter(pipe.execute())
+
+    fetched = []
+    for order_id, packed, item_ids in zip(order_ids, packed_values, item_lists):
+        hash_items = [next(item_hashes) for _ in item_ids]
+        if packed:
+            items = _unpack_order_items(packed)
+            fetched.append(('packed', [f"{order_id}:{idx}" for idx in range(len(items))], items))
+        elif item_ids:
+            fetched.append(('hash', item_ids, hash_items))
+        else:
+            fetched.append((None, [], []))
+    return fetched
+
+def _fetch_order_refs(r_client, order_ids, batch_size=STORE_BATCH_SIZE):
+    """
+    分批读取订单当前的 user_id、订单项 ID、各订单项的 StockCode (两种订单项布局均可)，以及 order_date、
+    ORDER_FILTER_INDEXES 和 SEARCH_FIELDS 中的字段 (已解码)，返回 [(order_id, user_id, item_ids, stock_codes, record)]。
+    订单不存在时 user_id 和 record 为 None、列表为空。
+    """
+    fields = list(dict.fromkeys(['user_id', 'order_date', *ORDER_FILTER_INDEXES, *SEARCH_FIELDS['order']]))
+    dictionaries = _load_dictionaries(r_client, 'order')
+    refs = []
+    for start in range(0, len(order_ids), batch_size):
+        batch = order_ids[start:start + batch_size]
+        pipe = r_client.pipeline(transaction=False)
+        for order_id in batch:
+            pipe.hmget(f"order:{order_id}", fields)
+        records = [dict(zip(fields, values)) if values[0] is not None else None for values in pipe.execute()]
+        _decode_records([record for record in records if record], dictionaries)
+        for order_id, record, (_, item_ids, items) in zip(batch, records, _fetch_order_items(r_client, batch)):
+            user_id = record['user_id'] if record else None
+            refs.append((order_id, user_id, item_ids, [item.get('StockCode') for item in items], record))
+    return refs
+
+def _flush_pending_pushes(pipe, pending_pushes):
+    """
+    把缓存的写入按 key 合并发送：列表为 LPUSH 的值 (多值 LPUSH 与逐个 LPUSH 得到的列表顺序一致)，
+    字典为 ZADD 的 {成员: 分数}。
+    """
+    for key, values in pending_pushes.items():
+        if isinstance(values, dict):
+            pipe.zadd(key, values)
+        else:
+            pipe.lpush(key, *values)
+    pending_pushes.clear()
+
+def _write_batched(r_client, rows, queue_func, batch_size, pending_pushes=None, skip=0, checkpoint=None, progress=None):
+    """
+    使用非事务 pipeline 分批写入。每累积 batch_size 个实体就 execute 一次，
+    既避免 MULTI/EXEC 长时间阻塞 Redis，又限制客户端缓冲的命令数量。
+    skip 跳过前 skip 个实体 (断点续传时已提交的部分)，批次边界与未跳过时保持一致。
+    checkpoint(pipe, count) 把检查点追加在每批命令的末尾：同一连接上的命令按顺序执行，
+    检查点写入时该批数据必然已全部生效。progress(count) 在每批提交后调用。
+    返回已处理的实体数量 (包括跳过的部分)。
+    """
+    pipe = r_client.pipeline(transaction=False)
+    count = skip
+
+    def commit():
+        if pending_pushes:
+            _flush_pending_pushes(pipe, pending_pushes)
+        if checkpoint:
+            checkpoint(pipe, count)
+        pipe.execute()
+        if progress:
+            progress(count)
+
+    for row in itertools.islice(rows, skip, None):
+        queue_func(pipe, row)
+        count += 1
+        if count % batch_size == 0:
+            commit()
+    if len(pipe) or pending_pushes:
+        commit()
+    return count
+
+def _store_products(r_client, products_df, batch_size=STORE_BATCH_SIZE, codes=None, buckets=None, **batch_options):
+    """
+    分批写入商品，返回写入数量。batch_options 透传给 _write_batched (skip/checkpoint/progress)。
+    codes 为 None 时按 DICT_ENCODING 从库中的码表分配编码；buckets 为库中声明的商品记录桶数量 (_record_buckets)，
+    hash 布局为 None。
+    """
+    if codes is None:
+        codes = _assign_codes(r_client, 'product', products_df)
+    products_df = _compress_frame(products_df, 'product')
+    pending_pushes = {}
+    return _write_batched(r_client, _frame_to_records(products_df),
+                          lambda pipe, product: _queue_product(pipe, product, codes, pending_pushes, buckets),
+                          batch_size, pending_pushes=pending_pushes, **batch_options)
+
+def _store_users(r_client, users_df, batch_size=STORE_BATCH_SIZE, buckets=None, **batch_options):
+    """分批写入用户，返回写入数量；buckets 含义同 _store_products"""
+    users_df = _compress_frame(users_df, 'user')
+    pending_pushes = {}
+    return _write_batched(r_client, _frame_to_records(users_df), lambda pipe, user: _queue_user(pipe, user, pending_pushes, buckets),
+                          batch_size, pending_pushes=pending_pushes, **batch_options)
+
+def _order_item_rows(orders_df, items_df, chunk_orders=STORE_BATCH_SIZE):
+    """
+    按 orders_df 的订单顺序逐个生成每个订单的订单项映射列表。
+    由 _order_item_offsets 得到每单的偏移量，每次只把 chunk_orders 个订单的明细按列转换为字符串映射，
+    写入过程中同时存在的 Python 对象与批次大小成正比，而不是与订单项总数成正比。
+    """
+    items_df, offsets = _order_item_offsets(orders_df, items_df)
+    for start in range(0, len(orders_df), chunk_orders):
+        stop = min(start + chunk_orders, len(orders_df))
+        base = offsets[start]
+        item_records = _frame_to_records(items_df.iloc[base:offsets[stop]], exclude=('order_id',))
+        for i in range(start, stop):
+            yield item_records[offsets[i] - base:offsets[i + 1] - base]
+
+def _store_orders(r_client, orders_df, items_df=None, batch_size=STORE_BATCH_SIZE, codes=None, **batch_options):
+    """
+    分批写入订单及订单项，返回写入数量。
+    订单项可以是扁平的 items_df，也可以是 orders_df 中每行一个列表的 items 列。
+    codes 含义同 _store_products，由 _queue_order 逐条替换，搜索索引仍按原值分词。
+    """
+    if orders_df.empty:
+        return 0
+    if codes is None:
+        codes = _assign_codes(r_client, 'order', orders_df)
+    if items_df is not None:
+        order_items = _order_item_rows(orders_df, items_df)
+    elif 'items' in orders_df.columns:
+        order_items = orders_df['items'].tolist()
+    else:
+        order_items = [[] for _ in range(len(orders_df))]
+    order_rows = zip(_frame_to_records(orders_df, exclude=('items',)), order_items)
+    pending_pushes = {}
+    return _write_batched(r_client, order_rows, lambda pipe, row: _queue_order(pipe, *row, pending_pushes=pending_pushes, codes=codes),
+                          batch_size, pending_pushes=pending_pushes, **batch_options)
+
+# --- 导入进度与断点续传 ---
+
+INGEST_CHECKPOINT_KEY = "ingest:checkpoint" # Hash：导入检查点与最新进度，追加在每个批次同一 pipeline 的末尾 (非事务)
+INGEST_STAGES = ('products', 'users', 'orders')
+INGEST_STAGE_NAMES = {'products': '商品', 'users': '用户', 'orders': '订单', 'stream': '流式导入'}
+
+def _dataset_fingerprint(*frames):
+    """数据集指纹：用于判断检查点是否属于同一份数据"""
+    digest = hashlib.blake2b(digest_size=16)
+    for df in frames:
+        if df is None:
+            continue
+        digest.update(repr(df.shape).encode('utf-8'))
+        if not df.empty:
+            digest.update(_hash_rows(df).tobytes())
+    return digest.hexdigest()
+
+def _progress_info(stage, rows_done, total_rows, start_time, resumed_rows=0):
+    """
+    计算导入进度：已完成行数、本次运行的吞吐量和预计剩余时间。
+    total_rows 未知时为 None，ETA 同样为 None。返回的字典包含一条可直接显示的 message。
+    """
+    elapsed = time.perf_counter() - start_time
+    rows_per_sec = (rows_done - resumed_rows) / elapsed if elapsed > 0 else 0.0
+    eta_seconds = None
+    if total_rows and rows_per_sec > 0:
+        eta_seconds = max(total_rows - rows_done, 0) / rows_per_sec
+    message = f"{INGEST_STAGE_NAMES.get(stage, stage)}: 已完成 {rows_done:,}"
+    if total_rows:
+        message += f" / {total_rows:,} ({rows_done / total_rows:.0%})"
+    message += f"，{rows_per_sec:,.0f} 行/秒"
+    if eta_seconds is not None:
+        message += f"，预计剩余 {eta_seconds:.0f} 秒"
+    return {'stage': stage, 'rows_done': rows_done, 'total_rows': total_rows,
+            'rows_per_sec': round(rows_per_sec, 1), 'eta_seconds': None if eta_seconds is None else round(eta_seconds, 1),
+            'message': message}
+
+def _load_checkpoint(r_client, fingerprint):
+    """读取与 fingerprint 匹配的检查点，返回 (阶段序号, 该阶段已提交的实体数, 总已完成行数)；不匹配时返回 None"""
+    checkpoint = r_client.hgetall(INGEST_CHECKPOINT_KEY)
+    if not checkpoint or checkpoint.get('fingerprint') != fingerprint:
+        return None
+    return INGEST_STAGES.index(checkpoint['stage']), int(checkpoint['stage_rows']), int(checkpoint['rows_done'])
+
+def get_ingest_progress():
+    """
+    读取正在进行 (或中断后未完成) 的导入进度，供 Web 进度接口和其他进程查询。
+    零停机重载时检查点写在暂存库中，因此先查暂存库。没有导入时返回 None。
+    """
+    for staging in (True, False):
+        r_client = get_redis_client(staging=staging)
+        if not r_client:
+            continue
+        checkpoint = r_client.hgetall(INGEST_CHECKPOINT_KEY)
+        if checkpoint:
+            checkpoint.pop('fingerprint', None)
+            checkpoint['staging'] = staging
+            return checkpoint
+    return None
+
+def store_data_in_redis(products_df, users_df, orders_df, items_df=None, flush_db=True, batch_size=STORE_BATCH_SIZE, staging=False,
+                        progress_callback=None, resume=True):
+    """
+    将清洗后的数据存储到 Redis。items_df 为以 order_id 为键的扁平订单项表 (可选)。
+    每个实体只发送一条 HSET key mapping=...，按 batch_size 个实体一个编号批次提交，
+    每批末尾在同一 pipeline 中更新检查点 (INGEST_CHECKPOINT_KEY)。
+    resume=True 且检查点属于同一份数据时，跳过已提交的批次继续导入 (此时不清空数据库)；
+    检查点之后的一批可能只写入了一部分，商品和用户的写入是幂等的，订单则先按 _queue_order_delete 清理再重写。
+    progress_callback(info) 在每批提交后调用，info 包含 stage/rows_done/total_rows/rows_per_sec/eta_seconds/message。
+    staging=True 时先写入暂存库 REDIS_STAGING_DB，校验后 SWAPDB 切换，导入期间旧数据始终可读
+    (此时忽略 flush_db；导入期间对活动库的修改会随旧数据一起被换出)。
+    """
+    r_client = get_redis_client(staging=staging)
+    if not r_client:
+        return "Redis 连接失败，无法存储数据。", False
+
+    fingerprint = _dataset_fingerprint(products_df, users_df, orders_df, items_df)
+    resume_point = _load_checkpoint(r_client, fingerprint) if resume else None
+    flushed = resume_point is None and (staging or flush_db)
+    if flushed and staging:
+        conflict = _staging_conflict(r_client)
+        if conflict:
+            return conflict, False
+    if flushed:
+        r_client.flushdb()
+        _queue_search_declaration(r_client)
+    _queue_cache_epoch(r_client) # 全量导入会覆盖大量记录，不逐条递增版本号
+    _prepare_record_layout(r_client, flushed, {'product': len(products_df), 'user': len(users_df)})
+    buckets = {entity: _record_buckets(r_client, entity) for entity in RECORD_ENTITIES}
+    resume_stage, resume_rows, resumed_rows = resume_point or (0, 0, 0)
+    if resume_point and INGEST_STAGES[resume_stage] == 'orders':
+        partial_ids = orders_df['order_id'].astype(str).iloc[resume_rows:resume_rows + batch_size].tolist()
+        refs = [ref for ref in _fetch_order_refs(r_client, partial_ids, batch_size) if ref[1] is not None or ref[2]]
+        _write_batched(r_client, refs, lambda pipe, ref: _queue_order_delete(pipe, *ref), batch_size)
+
+    stage_sizes = {'products': len(products_df), 'users': len(users_df), 'orders': len(orders_df)}
+    stage_writers = {
+        'products': lambda **options: _store_products(r_client, products_df, batch_size, buckets=buckets['product'], **options),
+        'users': lambda **options: _store_users(r_client, users_df, batch_size, buckets=buckets['user'], **options),
+        'orders': lambda **options: _store_orders(r_client, orders_df, items_df, batch_size, **options),
+    }
+    total_rows = sum(stage_sizes.values())
+    start_time = time.perf_counter()
+    counts = {}
+    rows_before_stage = 0
+
+    for stage_idx, stage in enumerate(INGEST_STAGES):
+        if stage_idx < resume_stage:
+            counts[stage] = stage_sizes[stage]
+            rows_before_stage += stage_sizes[stage]
+            continue
+
+        def checkpoint(pipe, count, stage=stage, offset=rows_before_stage):
+            info = _progress_info(stage, offset + count, total_rows, start_time, resumed_rows)
+            pipe.hset(INGEST_CHECKPOINT_KEY, mapping={
+                'fingerprint': fingerprint, 'stage': stage, 'stage_rows': count,
+                'chunk': math.ceil(count / batch_size), 'rows_done': info['rows_done'], 'total_rows': total_rows,
+                'rows_per_sec': info['rows_per_sec'], 'eta_seconds': info['eta_seconds'] if info['eta_seconds'] is not None else '',
+                'message': info['message'], 'updated_at': datetime.now().isoformat(timespec='seconds'),
+            })
+
+        def progress(count, stage=stage, offset=rows_before_stage):
+            if progress_callback:
+                progress_callback(_progress_info(stage, offset + count, total_rows, start_time, resumed_rows))
+
+        skip = resume_rows if stage_idx == resume_stage else 0
+        counts[stage] = stage_writers[stage](skip=skip, checkpoint=checkpoint, progress=progress)
+        rows_before_stage += stage_sizes[stage]
+
+    r_client.delete(INGEST_CHECKPOINT_KEY)
+
+    elapsed = time.perf_counter() - start_time
+    written_rows = total_rows - resumed_rows
+    rows_per_sec = written_rows / elapsed if elapsed > 0 else float(written_rows)
+    message = (f"数据存储完成：商品 {counts['products']} 条，用户 {counts['users']} 条，订单 {counts['orders']} 条，"
+               f"耗时 {elapsed:.2f} 秒 ({rows_per_sec:,.0f} 行/秒)。")
+    if resumed_rows:
+        message += f" 从检查点继续，跳过已提交的 {resumed_rows} 条。"
+    message += _bucket_encoding_warning(r_client, {'product': products_df, 'user': users_df})
+    if not staging:
+        return message, True
+    swap_message, success = _promote_staging(_expected_counts(products_df, users_df, orders_df))
+    return f"{message}\n{swap_message}", success
+
+def _partition_codes(ids, partitions):
+    """按 ID 的稳定哈希把实体分配到 0..partitions-1 号分区"""
+    return pd.util.hash_pandas_object(ids.astype(str), index=False).to_numpy() % partitions
+
+# 运行时可被应用或基准脚本修改、决定写入格式的配置；并行导入时显式传给子进程，
+# 使 spawn/forkserver 启动的子进程与父进程按相同的布局写入
+INGEST_WORKER_SETTINGS = ('RECORD_LAYOUT', 'RECORD_BUCKET_COUNT', 'ORDER_ITEMS_LAYOUT', 'DICT_ENCODING', 'COMPRESSION', 'SEARCH_FIELDS')
+
+def _ingest_partition(worker_idx, products_df, users_df, orders_df, items_df, batch_size, connection_kwargs, settings):
+    """
+    并行导入的子进程入口：先应用父进程的写入配置 settings ({INGEST_WORKER_SETTINGS 中的名称: 值})，
+    再使用独立的 Redis 连接和 pipeline 写入一个分区，返回该分区的写入数量、耗时和错误信息。
+    """
+    globals().update(settings)
+    stats = {'worker': worker_idx, 'products': 0, 'users': 0, 'orders': 0, 'seconds': 0.0, 'errors': []}
+    start_time = time.perf_counter()
+    try:
+        r_client = redis.StrictRedis(decode_responses=True, **connection_kwargs)
+        # 桶数量以父进程在库中声明的为准
+        stats['products'] = _store_products(r_client, products_df, batch_size, buckets=_record_buckets(r_client, 'product'))
+        stats['users'] = _store_users(r_client, users_df, batch_size, buckets=_record_buckets(r_client, 'user'))
+        stats['orders'] = _store_orders(r_client, orders_df, items_df, batch_size)
+    except Exception as e:
+        stats['errors'].append(f"分区 {worker_idx}: {e}")
+    stats['seconds'] = time.perf_counter() - start_time
+    return stats
+
+def store_data_in_redis_parallel(products_df, users_df, orders_df, items_df=None, flush_db=True,
+                                 workers=None, batch_size=STORE_BATCH_SIZE, staging=False):
+    """
+    多进程并行导入。商品和用户按各自 ID 的哈希分区，订单 (连同其订单项) 按所属用户 ID 分区，
+    使同一用户的订单列表只由一个进程按原顺序写入。每个工作进程持有自己的 Redis 连接，
+    客户端序列化因此分摊到多个 CPU 核心。返回的消息包含每个进程的吞吐量，并汇总所有错误。
+    staging=True 时所有进程写入暂存库，全部成功并校验通过后才 SWAPDB 切换。
+    """
+    r_client, error = _target_client(staging, flush_db, {'product': len(products_df), 'user': len(users_df)})
+    if not r_client:
+        return error, False
+
+    workers = workers or os.cpu_count() or 1
+    product_parts = _partition_codes(products_df['product_id'], workers)
+    user_parts = _partition_codes(users_df['user_id'], workers)
+    order_parts = _partition_codes(orders_df['user_id'], workers) if not orders_df.empty else np.zeros(0, dtype=int)
+    if items_df is not None:
+        order_part_by_id = pd.Series(order_parts, index=orders_df['order_id'].values)
+        item_parts = items_df['order_id'].map(order_part_by_id).to_numpy()
+    connection_kwargs = {'host': REDIS_HOST, 'port': REDIS_PORT, 'db': REDIS_STAGING_DB if staging else REDIS_DB}
+    settings = {name: globals()[name] for name in INGEST_WORKER_SETTINGS}
+
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_ingest_partition, idx,
+                            products_df[product_parts == idx],
+                            users_df[user_parts == idx],
+                            orders_df[order_parts == idx],
+                            items_df[item_parts == idx] if items_df is not None else None,
+                            batch_size, connection_kwargs, settings)
+            for idx in range(workers)
+        ]
+        worker_stats = []
+        errors = []
+        for future in futures:
+            try:
+                worker_stats.append(future.result())
+            except Exception as e:
+                errors.append(f"工作进程异常: {e}")
+    elapsed = time.perf_counter() - start_time
+
+    lines = []
+    total_rows = 0
+    for stats in sorted(worker_stats, key=lambda s: s['worker']):
+        rows = stats['products'] + stats['users'] + stats['orders']
+        total_rows += rows
+        rows_per_sec = rows / stats['seconds'] if stats['seconds'] > 0 else float(rows)
+        lines.append(f"  进程 {stats['worker']}: {rows} 条，耗时 {stats['seconds']:.2f} 秒 ({rows_per_sec:,.0f} 行/秒)")
+        errors.extend(stats['errors'])
+
+    rows_per_sec = total_rows / elapsed if elapsed > 0 else float(total_rows)
+    message = f"并行导入完成：{workers} 个进程共写入 {total_rows} 条记录，耗时 {elapsed:.2f} 秒 ({rows_per_sec:,.0f} 行/秒)。\n" + "\n".join(lines)
+    message += _bucket_encoding_warning(r_client, {'product': products_df, 'user': users_df})
+    if errors:
+        message += "\n错误:\n" + "\n".join(f"  {err}" for err in errors)
+        if staging:
+            r_client.flushdb(asynchronous=True)
+            message += "\n存在错误，未切换暂存库，活动数据未改变。"
+        else:
+            # 搜索索引不完整，撤销声明使搜索退回全量扫描，直到重新导入或 rebuild_search_index
+            r_client.delete(SEARCH_INDEXED_KEY)
+            message += f"\n存在错误，活动库 DB {REDIS_DB} 中的数据不完整，请重新导入。"
+        return message, False
+    if not staging:
+        return message, True
+    swap_message, success = _promote_staging(_expected_counts(products_df, users_df, orders_df))
+    return f"{message}\n{swap_message}", success
+
+# --- 订单项布局迁移 ---
+
+def _used_memory(r_client):
+    """Redis 当前 used_memory (字节)"""
+    return int(r_client.info('memory')['used_memory'])
+
+def migrate_order_items_layout(target='packed', batch_size=STORE_BATCH_SIZE):
+    """
+    把已有订单的订单项转换为 target 布局 ('packed' 或 'hash')，商品销售列表中的订单项 ID 保持不变。
+    之后的写入请同时把 ORDER_ITEMS_LAYOUT 设为相同的值。返回的消息包含迁移前后的 used_memory 对比。
+    """
+    if target not in ORDER_ITEMS_LAYOUTS:
+        return f"未知的订单项布局: {target}", False
+    r_client = get_redis_client()
+    if not r_client:
+        return "Redis 连接失败。", False
+
+    try:
+        memory_before = _used_memory(r_client)
+        order_ids = list(r_client.smembers("order:all_ids"))
+        migrated = 0
+        for start in range(0, len(order_ids), batch_size):
+            batch = order_ids[start:start + batch_size]
+            pipe = r_client.pipeline(transaction=False)
+            for order_id, (layout, item_ids, items) in zip(batch, _fetch_order_items(r_client, batch)):
+                if layout is None or layout == target:
+                    continue
+                if target == 'packed':
+                    pipe.set(f"order:{order_id}:items_packed", _pack_order_items(items))
+                    pipe.delete(f"order:{order_id}:items", *[f"order_item:{item_id}" for item_id in item_ids])
+                else:
+                    for item_id, item in zip(item_ids, items):
+                        pipe.hset(f"order_item:{item_id}", mapping=item)
+                    pipe.rpush(f"order:{order_id}:items", *item_ids)
+                    pipe.delete(f"order:{order_id}:items_packed")
+                migrated += 1
+            pipe.execute()
+        memory_after = _used_memory(r_client)
+    except Exception as e:
+        return f"订单项布局迁移失败: {e}", False
+
+    saved = memory_before - memory_after
+    ratio = saved / memory_before if memory_before else 0.0
+    return (f"已将 {migrated} 个订单的订单项迁移为 {target} 布局；used_memory {memory_before / 1e6:.1f} MB -> "
+            f"{memory_after / 1e6:.1f} MB (变化 {-saved / 1e6:+.1f} MB, {-ratio:+.1%})。"), True
+
+# --- 商品/用户记录布局迁移 ---
+
+def _memory_usage(r_client, keys, batch_size=STORE_BATCH_SIZE):
+    """keys 的 MEMORY USAGE 总和 (字节，SAMPLES 0 表示统计全部元素)"""
+    total = 0
+    for start in range(0, len(keys), batch_size):
+        pipe = r_client.pipeline(transaction=False)
+        for key in keys[start:start + batch_size]:
+            pipe.memory_usage(key, samples=0)
+        total += sum(usage or 0 for usage in pipe.execute())
+    return total
+
+def migrate_record_layout(target='bucketed', bucket_count=RECORD_BUCKET_COUNT, batch_size=STORE_BATCH_SIZE):
+    """
+    把已有的商品和用户记录转换为 target 布局 ('bucketed' 或 'hash')，也可用于修改桶数量；
+    bucket_count 为 None 时按各实体的记录数由 _bucket_count_for 计算。
+    迁移期间请暂停写入；之后的全量导入请同时把 RECORD_LAYOUT (和 RECORD_BUCKET_COUNT) 设为相同的值。
+    返回的消息包含每类记录迁移前后的 MEMORY USAGE 总和、桶的编码，以及整个库的 used_memory 对比；
+    桶编码为 hashtable 时说明记录或桶超出了服务器的 hash-max-ziplist-value / hash-max-ziplist-entries。
+    """
+    if target not in RECORD_LAYOUTS:
+        return f"未知的记录布局: {target}", False
+    r_client = get_redis_client()
+    if not r_client:
+        return "Redis 连接失败。", False
+
+    lines = []
+    try:
+        memory_before = _used_memory(r_client)
+        for entity in RECORD_ENTITIES:
+            old_buckets = _record_buckets(r_client, entity)
+            record_ids = list(r_client.smembers(f"{entity}:all_ids"))
+            new_buckets = (bucket_count or _bucket_count_for(len(record_ids))) if target == 'bucketed' else None
+            usage_before = _memory_usage(r_client, _record_storage_keys(entity, record_ids, old_buckets), batch_size)
+            if old_buckets != new_buckets:
+                for start in range(0, len(record_ids), batch_size):
+                    batch = record_ids[start:start + batch_size]
+                    pipe = r_client.pipeline(transaction=False)
+                    # 先删后写：修改桶数量时新旧桶 key 可能同名
+                    for record_id, record in zip(batch, _read_records(r_client, entity, batch, old_buckets)):
+                        if record:
+                            _queue_record_delete(pipe, entity, record_id, old_buckets)
+                            _queue_record(pipe, entity, record, new_buckets)
+                    pipe.execute()
+                if new_buckets is None:
+                    r_client.hdel(RECORD_LAYOUT_KEY, entity)
+                else:
+                    r_client.hset(RECORD_LAYOUT_KEY, entity, new_buckets)
+
+            storage_keys = _record_storage_keys(entity, record_ids, new_buckets)
+            usage_after = _memory_usage(r_client, storage_keys, batch_size)
+            line = (f"{entity}: {len(record_ids)} 条记录，{len(storage_keys)} 个 key，MEMORY USAGE "
+                    f"{usage_before / 1e6:.2f} MB -> {usage_after / 1e6:.2f} MB")
+            if usage_before:
+                line += f" ({(usage_after - usage_before) / usage_before:+.1%})"
+            if new_buckets is not None and storage_keys:
+                pipe = r_client.pipeline(transaction=False)
+                for key in storage_keys:
+                    pipe.object('encoding', key)
+                encodings = pd.Series(pipe.execute()).value_counts()
+                line += f"，{new_buckets} 个桶，桶编码 " + "/".join(f"{name} {count}" for name, count in encodings.items())
+            lines.append(line)
+        memory_after = _used_memory(r_client)
+    except Exception as e:
+        return f"记录布局迁移失败: {e}", False
+
+    return (f"已将商品和用户记录迁移为 {target} 布局：\n"
+            + "\n".join(f"  {line}" for line in lines)
+            + f"\n  used_memory {memory_before / 1e6:.1f} MB -> {memory_after / 1e6:.1f} MB"), True
+
+# --- RESP 批量导入 ---
+
+RESP_EXPORT_PATH = 'redis_mass_insert.resp' # write_resp_file 的默认输出文件
+RESP_REPLY_TIMEOUT = 60 # store_data_via_resp 发送完毕后等待服务器回复结束标记的最长秒数
+
+def _pack_command(args):
+    """把一条命令编码为 RESP 数组；安装了 hiredis 时使用其 C 实现"""
+    if _hiredis_pack_command is not None:
+        return _hiredis_pack_command(args)
+    encoded = [arg if isinstance(arg, bytes) else str(arg).encode('utf-8') for arg in args]
+    return b''.join([b'*%d\r\n' % len(encoded)] + [b'$%d\r\n%s\r\n' % (len(arg), arg) for arg in encoded])
+
+class _RespWriter:
+    """
+    把 _queue_* 发出的命令直接编码为 RESP 协议写入二进制流，不构造命令对象、不解析回复。
+    实现了 _queue_* 和 _write_batched 用到的 pipeline 接口，pipeline() 返回自身，
+    因此可以代替 Redis 客户端传给 _store_* 函数，得到与 store_data_in_redis 完全相同的 key 和索引。
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = []
+        self.command_count = 0
+
+    def pipeline(self, transaction=False):
+        return self
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def execute_command(self, *args):
+        self.buffer.append(_pack_command(args))
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        args = ['HSET', name]
+        if key is not None:
+            args += [key, value]
+        for field, field_value in (mapping or {}).items():
+            args += [field, field_value]
+        self.execute_command(*args)
+
+    def sadd(self, name, *values):
+        self.execute_command('SADD', name, *values)
+
+    def zadd(self, name, mapping):
+        args = ['ZADD', name]
+        for member, score in mapping.items():
+            args += [repr(float(score)), member]
+        self.execute_command(*args)
+
+    def rpush(self, name, *values):
+        self.execute_command('RPUSH', name, *values)
+
+    def lpush(self, name, *values):
+        self.execute_command('LPUSH', name, *values)
+
+    def set(self, name, value):
+        self.execute_command('SET', name, value)
+
+    def delete(self, *names):
+        self.execute_command('DEL', *names)
+
+    def execute(self):
+        """把缓冲的命令写入流，返回空列表 (没有回复可解析)"""
+        self.stream.write(b''.join(self.buffer))
+        self.command_count += len(self.buffer)
+        self.buffer.clear()
+        return []
+
+def _resp_options_error(flush_db):
+    """RESP 流只写不读，无法读取已有码表：启用 DICT_ENCODING 且不清空数据库时返回错误消息，否则返回 None"""
+    if DICT_ENCODING and not flush_db:
+        return "RESP 流无法读取已有码表，启用 DICT_ENCODING 时必须 flush_db=True。"
+    return None
+
+def _write_resp_dataset(writer, products_df, users_df, orders_df, items_df, db, flush_db, batch_size, buckets=None):
+    """
+    按 store_data_in_redis 的顺序把整个数据集写入 _RespWriter，返回 (商品数, 用户数, 订单数)。
+    flush_db 为 True 时按配置声明记录布局；否则 buckets 须为目标库中已声明的 {实体: 桶数量} (由调用方通过普通客户端读取)。
+    """
+    options_error = _resp_options_error(flush_db)
+    if options_error:
+        raise ValueError(options_error)
+    writer.execute_command('SELECT', db)
+    if flush_db:
+        record_counts = {'product': len(products_df), 'user': len(users_df)}
+        writer.execute_command('FLUSHDB')
+        _queue_record_layout(writer, record_counts)
+        _queue_search_declaration(writer)
+        buckets = {entity: _configured_buckets(record_counts[entity]) for entity in RECORD_ENTITIES}
+    _queue_cache_epoch(writer)
+    product_count = _store_products(writer, products_df, batch_size, codes=_assign_codes(writer, 'product', products_df, fresh=True),
+                                    buckets=buckets['product'])
+    user_count = _store_users(writer, users_df, batch_size, buckets=buckets['user'])
+    order_count = _store_orders(writer, orders_df, items_df, batch_size, codes=_assign_codes(writer, 'order', orders_df, fresh=True))
+    return product_count, user_count, order_count
+
+def write_resp_file(products_df, users_df, orders_df, items_df=None, path=RESP_EXPORT_PATH, flush_db=True,
+                    db=REDIS_DB, batch_size=STORE_BATCH_SIZE):
+    """
+    把清洗后的数据序列化为 RESP 协议文件，覆盖 store_data_in_redis 创建的全部 key 和索引，
+    可用 `redis-cli --pipe < 文件` 批量导入。文件以 SELECT db 开头，随后是 FLUSHDB。
+    生成文件时无法读取目标库的记录布局，因此不支持 flush_db=False (追加写入请使用 store_data_via_resp)。
+    """
+    if not flush_db:
+        return "RESP 文件无法校验目标库的记录布局，flush_db=False 时请使用 store_data_via_resp。", False
+    options_error = _resp_options_error(flush_db)
+    if options_error:
+        return options_error, False
+    start_time = time.perf_counter()
+    try:
+        with open(path, 'wb', buffering=1 << 20) as stream:
+            writer = _RespWriter(stream)
+            counts = _write_resp_dataset(writer, products_df, users_df, orders_df, items_df, db, flush_db, batch_size)
+    except (OSError, ValueError) as e:
+        return f"写入 RESP 文件失败: {e}", False
+    elapsed = time.perf_counter() - start_time
+    return (f"RESP 文件已生成: {path} ({os.path.getsize(path) / 1e6:.1f} MB，{writer.command_count} 条命令)，"
+            f"商品 {counts[0]} 条，用户 {counts[1]} 条，订单 {counts[2]} 条，耗时 {elapsed:.2f} 秒。"
+            f"导入: redis-cli -h {REDIS_HOST} -p {REDIS_PORT} --pipe < {path}"), True
+
+def _drain_replies(sock, marker, result):
+    """
+    读取线程：持续读取并丢弃服务器回复，统计错误回复，读到 ECHO 标记或连接关闭/出错时结束。
+    本模块发出的命令只会得到整数、状态、错误回复和最后的 ECHO，因此可以按行扫描而无需完整解析 RESP。
+    """
+    marker_line = marker.encode('utf-8')
+    pending = b''
+    while True:
+        try:
+            data = sock.recv(1 << 16)
+        except OSError as e: # 例如导入失败后主线程已关闭 socket
+            result['errors'].append(f"读取回复失败: {e}")
+            return
+        if not data:
+            result['errors'].append("连接在收到结束标记前被关闭")
+            return
+        lines = (pending + data).split(b'\r\n')
+        pending = lines.pop()
+        for line in lines:
+            if line.startswith(b'-'):
+                result['error_count'] += 1
+                if len(result['errors']) < 5:
+                    result['errors'].append(line[1:].decode('utf-8', 'replace'))
+            elif line == marker_line:
+                return
+
+def store_data_via_resp(products_df, users_df, orders_df, items_df=None, flush_db=True, batch_size=STORE_BATCH_SIZE, staging=False):
+    """
+    与 redis-cli --pipe 相同的批量导入方式：通过原始 socket 发送 RESP 协议流，
+    另开读取线程消费回复，最后发送 ECHO 随机标记，读到标记即表示所有命令都已执行；
+    发送完毕后 RESP_REPLY_TIMEOUT 秒内没有读到标记时按失败返回。
+    staging=True 时写入暂存库，校验后 SWAPDB 切换 (同 store_data_in_redis)。
+    不清空数据库时先通过普通客户端按 _prepare_record_layout 校验目标库的记录布局，并按库中声明的桶数量写入。
+    """
+    options_error = _resp_options_error(flush_db or staging)
+    if options_error:
+        return options_error, False
+    buckets = None
+    if not (flush_db or staging):
+        r_client = get_redis_client()
+        if not r_client:
+            return "Redis 连接失败，无法存储数据。", False
+        try:
+            _prepare_record_layout(r_client, False)
+        except ValueError as e:
+            return str(e), False
+        buckets = {entity: _record_buckets(r_client, entity) for entity in RECORD_ENTITIES}
+    if staging:
+        staging_client = get_redis_client(staging=True)
+        if not staging_client:
+            return "Redis 连接失败，无法存储数据。", False
+        conflict = _staging_conflict(staging_client)
+        if conflict:
+            return conflict, False
+    marker = uuid.uuid4().hex
+    result = {'error_count': 0, 'errors': []}
+    start_time = time.perf_counter()
+    try:
+        sock = socket.create_connection((REDIS_HOST, REDIS_PORT))
+    except OSError as e:
+        return f"Redis 连接失败，无法存储数据: {e}", False
+
+    reader = threading.Thread(target=_drain_replies, args=(sock, marker, result), daemon=True)
+    reader.start()
+    try:
+        with sock.makefile('wb', buffering=1 << 20) as stream:
+            writer = _RespWriter(stream)
+            counts = _write_resp_dataset(writer, products_df, users_df, orders_df, items_df,
+                                         REDIS_STAGING_DB if staging else REDIS_DB, flush_db or staging, batch_size, buckets)
+            writer.execute_command('ECHO', marker)
+            writer.execute()
+        reader.join(RESP_REPLY_TIMEOUT)
+        if reader.is_alive():
+            return (f"RESP 导入失败: {RESP_REPLY_TIMEOUT} 秒内未收到服务器的结束标记，部分命令可能尚未执行"
+                    + ("，未切换暂存库，活动数据未改变。" if staging else "。")), False
+    except (OSError, ValueError) as e:
+        return f"RESP 导入失败: {e}", False
+    finally:
+        # 先 shutdown 使阻塞在 recv 中的读取线程立即返回，再关闭 socket
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        sock.close()
+    elapsed = time.perf_counter() - start_time
+
+    total_rows = sum(counts)
+    rows_per_sec = total_rows / elapsed if elapsed > 0 else float(total_rows)
+    message = (f"RESP 批量导入完成：商品 {counts[0]} 条，用户 {counts[1]} 条，订单 {counts[2]} 条，"
+               f"{writer.command_count} 条命令，耗时 {elapsed:.2f} 秒 ({rows_per_sec:,.0f} 行/秒)。")
+    target_client = get_redis_client(staging=staging)
+    if target_client:
+        message += _bucket_encoding_warning(target_client, {'product': products_df, 'user': users_df})
+    if result['errors']:
+        message += f"\n{result['error_count']} 条命令执行出错，例如: " + "；".join(result['errors'])
+        if staging:
+            get_redis_client(staging=True).flushdb(asynchronous=True)
+        return message, False
+    if not staging:
+        return message, True
+    swap_message, success = _promote_staging(_expected_counts(products_df, users_df, orders_df))
+    return f"{message}\n{swap_message}", success
+
+# --- 增量同步 ---
+
+SYNC_HASHES_KEY = "sync:hashes:{entity}" # Hash：实体 ID -> 上次同步时的内容摘要
+# 参与摘要计算的源数据列。补全的模拟字段 (描述、分类、库存、用户名、订单状态等) 每次加载都会重新随机生成，
+# 不参与比较，因此源数据未变的记录保留已有的补全字段以及在应用中修改过的订单状态
+SYNC_DIGEST_COLUMNS = {
+    'product': ['product_id', 'name', 'price'],
+    'user': ['user_id'],
+    'order': ['order_id', 'user_id', 'order_date', 'total_amount', 'country', 'items'],
+}
+
+def _hash_rows(df):
+    """
+    按行计算 64 位哈希。直接对各列原生值哈希，避免整表 astype(str) 的开销；
+    字符串列无论是 object 还是 str 类型哈希结果一致。订单中遗留的 items 列表列先转为字符串。
+    """
+    if 'items' in df.columns:
+        df = df.assign(items=df['items'].astype(str))
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def _content_digests(df, entity, id_column):
+    """
+    按 SYNC_DIGEST_COLUMNS 计算每个实体 ID 的内容摘要，返回以 ID 为索引的字符串 Series。
+    同一 ID 出现在多行时 (如同一 StockCode 有多个商品名称)，各行摘要相加作为该 ID 的摘要。
+    """
+    if df.empty:
+        return pd.Series([], dtype=object)
+    row_digests = _hash_rows(df[[col for col in SYNC_DIGEST_COLUMNS[entity] if col in df.columns]])
+    codes, ids = pd.factorize(df[id_column].astype(str).to_numpy())
+    digests = np.zeros(len(ids), dtype=np.uint64)
+    np.add.at(digests, codes, row_digests)
+    return pd.Series(digests.astype(str), index=ids)
+
+def _order_digests(orders_df, items_df=None):
+    """
+    计算订单摘要：订单行本身的摘要与其全部订单项 (含单内顺序) 摘要之和再合并一次，
+    任一订单项的增删改都会改变所属订单的摘要。
+    """
+    if orders_df.empty:
+        return pd.Series([], dtype=object)
+    orders_df = orders_df.drop_duplicates('order_id', keep='last')
+    digests = _hash_rows(orders_df[[col for col in SYNC_DIGEST_COLUMNS['order'] if col in orders_df.columns]])
+    if items_df is not None and not items_df.empty:
+        order_codes = pd.Categorical(items_df['order_id'], categories=orders_df['order_id']).codes
+        keep = order_codes >= 0
+        order_codes = order_codes[keep]
+        items = items_df[keep].drop(columns='order_id')
+        items['_position'] = pd.Series(order_codes).groupby(order_codes).cumcount().to_numpy()
+        item_digests = pd.util.hash_pandas_object(items, index=False).to_numpy()
+        item_sums = np.zeros(len(orders_df), dtype=np.uint64)
+        np.add.at(item_sums, order_codes, item_digests)
+        digests = pd.util.hash_pandas_object(pd.DataFrame({'order': digests, 'items': item_sums}), index=False).to_numpy()
+    return pd.Series(digests.astype(str), index=orders_df['order_id'].astype(str).to_numpy())
+
+def _diff_digests(r_client, entity, digests):
+    """
+    与 Redis 中上次同步的摘要比较，返回 (新增 ID, 变化 ID, 消失 ID)。
+    消失的 ID 按 {entity}:all_ids 与摘要的并集计算：全量导入清空数据库后或首次同步时摘要为空，
+    库中已有但本次数据中没有的记录同样要删除。
+    """
+    stored = pd.Series(r_client.hgetall(SYNC_HASHES_KEY.format(entity=entity)), dtype=object)
+    known = digests.index.isin(stored.index)
+    changed = known & (digests.to_numpy() != stored.reindex(digests.index).to_numpy())
+    existing = pd.Index(list(r_client.smembers(f"{entity}:all_ids"))).union(stored.index)
+    removed = existing[~existing.isin(digests.index)]
+    return digests.index[~known].tolist(), digests.index[changed].tolist(), removed.tolist()
+
+def _save_digests(r_client, entity, digests, removed_ids, batch_size=STORE_BATCH_SIZE):
+    """写入本次同步后的摘要：更新新增/变化的条目，删除消失的条目"""
+    key = SYNC_HASHES_KEY.format(entity=entity)
+    pipe = r_client.pipeline(transaction=False)
+    items = list(digests.items())
+    for start in range(0, len(items), batch_size):
+        pipe.hset(key, mapping=dict(items[start:start + batch_size]))
+    for start in range(0, len(removed_ids), batch_size):
+        pipe.hdel(key, *removed_ids[start:start + batch_size])
     pipe.execute()
-    return "数据存储完成。", True
+
+def _sync_products(r_client, products_df, batch_size):
+    """增量同步商品，返回 (新增, 更新, 删除) 数量"""
+    digests = _content_digests(products_df, 'product', 'product_id')
+    new_ids, changed_ids, removed_ids = _diff_digests(r_client, 'product', digests)
+
+    # 同一 StockCode 的多行可能分属不同分类，商品 Hash 只记录最后一行的分类，
+    # 因此变化或删除的商品要从所有分类集合中移除，再按新数据重新加入
+    upsert_ids = new_ids + changed_ids
+    category_keys = [f"category:{category}:products" for category in _product_categories(r_client)] if upsert_ids or removed_ids else []
+
+    def queue_clear_categories(pipe, product_id):
+        for key in category_keys:
+            pipe.srem(key, product_id)
+
+    upsert_df = products_df[products_df['product_id'].astype(str).isin(upsert_ids)]
+    codes = _assign_codes(r_client, 'product', upsert_df)
+    cleared = set()
+    # 写入和删除的商品按旧记录从搜索索引中移除；"新增"的商品也可能已在库中 (全量导入后摘要为空)
+    old_ids = upsert_ids + removed_ids
+    old_records = dict(zip(old_ids, _fetch_records(r_client, 'product', old_ids)))
+    buckets = _record_buckets(r_client, 'product')
+
+    def queue_upsert(pipe, product):
+        product_id = product['product_id']
+        if product_id not in cleared:
+            cleared.add(product_id)
+            queue_clear_categories(pipe, product_id)
+            _queue_record_delete(pipe, 'product', product_id, buckets)
+            _queue_search_index_delete(pipe, 'product', product_id, old_records.get(product_id))
+            _queue_cache_invalidate(pipe, 'product', product_id)
+        _queue_product(pipe, product, codes, buckets=buckets)
+
+    def queue_remove(pipe, product_id):
+        queue_clear_categories(pipe, product_id)
+        _queue_product_delete(pipe, product_id, None, buckets, old_records.get(product_id))
+
+    _write_batched(r_client, _frame_to_records(_compress_frame(upsert_df, 'product')), queue_upsert, batch_size)
+    _write_batched(r_client, removed_ids, queue_remove, batch_size)
+    _save_digests(r_client, 'product', digests[upsert_ids], removed_ids, batch_size)
+    return len(new_ids), len(changed_ids), len(removed_ids)
+
+def _sync_users(r_client, users_df, batch_size):
+    """增量同步用户，返回 (新增, 更新, 删除) 数量"""
+    digests = _content_digests(users_df, 'user', 'user_id')
+    new_ids, changed_ids, removed_ids = _diff_digests(r_client, 'user', digests)
+
+    upsert_ids = new_ids + changed_ids
+    upsert_df = users_df[users_df['user_id'].astype(str).isin(upsert_ids)]
+    old_ids = upsert_ids + removed_ids # 同 _sync_products，"新增"的用户也按旧记录清理搜索索引
+    old_records = dict(zip(old_ids, _fetch_records(r_client, 'user', old_ids)))
+    buckets = _record_buckets(r_client, 'user')
+
+    def queue_upsert(pipe, user):
+        _queue_record_delete(pipe, 'user', user['user_id'], buckets)
+        _queue_search_index_delete(pipe, 'user', user['user_id'], old_records.get(user['user_id']))
+        _queue_cache_invalidate(pipe, 'user', user['user_id'])
+        _queue_user(pipe, user, buckets=buckets)
+
+    def queue_remove(pipe, user_id):
+        _queue_user_delete(pipe, user_id, buckets, old_records.get(user_id))
+
+    _write_batched(r_client, _frame_to_records(_compress_frame(upsert_df, 'user')), queue_upsert, batch_size)
+    _write_batched(r_client, removed_ids, queue_remove, batch_size)
+    _save_digests(r_client, 'user', digests[upsert_ids], removed_ids, batch_size)
+    return len(new_ids), len(changed_ids), len(removed_ids)
+
+def _sync_orders(r_client, orders_df, items_df, batch_size):
+    """
+    增量同步订单，返回 (新增, 更新, 删除) 数量。
+    变化和消失的订单先按旧数据清理订单项、用户订单列表和商品销售列表中的引用，
+    变化和新增的订单再按新数据整体写入。新增订单同样先清理一次，
+    使上次中断留下的残余或未记录摘要的旧数据不会在列表中重复出现。
+    """
+    digests = _order_digests(orders_df, items_df)
+    new_ids, changed_ids, removed_ids = _diff_digests(r_client, 'order', digests)
+
+    upsert_ids = new_ids + changed_ids
+    refs = _fetch_order_refs(r_client, upsert_ids + removed_ids, batch_size)
+    _write_batched(r_client, [ref for ref in refs if ref[1] is not None or ref[2]],
+                   lambda pipe, ref: _queue_order_delete(pipe, *ref), batch_size)
+
+    upsert_mask = orders_df['order_id'].astype(str).isin(upsert_ids)
+    upsert_items = items_df[items_df['order_id'].astype(str).isin(upsert_ids)] if items_df is not None else None
+    _store_orders(r_client, orders_df[upsert_mask], upsert_items, batch_size)
+    _save_digests(r_client, 'order', digests[upsert_ids], removed_ids, batch_size)
+    return len(new_ids), len(changed_ids), len(removed_ids)
+
+def sync_data_in_redis(products_df, users_df, orders_df, items_df=None, batch_size=STORE_BATCH_SIZE):
+    """
+    增量导入：不清空数据库，只写入新增或源数据变化的商品、用户和订单，并删除本次数据中已消失的记录，
+    同时维护 category:*:products、product:prices、user:*:orders 等索引。
+    是否变化只看 SYNC_DIGEST_COLUMNS 中的源数据列，变化的记录整体重写 (包括重新补全的字段)。
+    每个实体的内容摘要保存在 sync:hashes:{entity} 中；首次同步 (或全量导入清空数据库后) 所有记录都视为新增。
+    已有数据的记录布局必须与 RECORD_LAYOUT 一致。
+    """
+    r_client = get_redis_client()
+    if not r_client:
+        return "Redis 连接失败，无法存储数据。", False
+
+    start_time = time.perf_counter()
+    try:
+        _prepare_record_layout(r_client, False)
+        product_stats = _sync_products(r_client, products_df, batch_size)
+        user_stats = _sync_users(r_client, users_df, batch_size)
+        order_stats = _sync_orders(r_client, orders_df, items_df, batch_size)
+        # 新增的记录不经过 _queue_cache_invalidate，按实体整体换一次写入版本号
+        pipe = r_client.pipeline()
+        for entity, stats in (('product', product_stats), ('user', user_stats), ('order', order_stats)):
+            if any(stats):
+                _queue_write_version(pipe, entity)
+        pipe.execute()
+    except Exception as e:
+        return f"增量同步失败: {e}", False
+    elapsed = time.perf_counter() - start_time
+
+    def describe(name, stats):
+        return f"{name} 新增 {stats[0]} / 更新 {stats[1]} / 删除 {stats[2]}"
+    return (f"增量同步完成：{describe('商品', product_stats)}，{describe('用户', user_stats)}，"
+            f"{describe('订单', order_stats)}，耗时 {elapsed:.2f} 秒。"), True
 
 def flush_redis_db():
     """清空 Redis 数据库"""
@@ -290,25 +2623,320 @@ def flush_redis_db():
         return "Redis 连接失败，无法清空数据库。", False
     try:
         r_client.flushdb()
+        _queue_search_declaration(r_client) # 空库中的索引是完整的，之后写入的记录都会加入索引
+        _queue_cache_epoch(r_client)
         return "Redis 数据库已清空。", True
     except Exception as e:
         return f"清空 Redis 数据库失败: {e}", False
 
-# --- 数据查询 (添加分页和搜索功能) ---
+# --- 进程内记录缓存 ---
+
+CACHE_VERSIONS_KEY = "cache:versions:{entity}" # Hash：记录 ID -> 版本号，每次写入该记录时 HINCRBY
+CACHE_EPOCH_KEY = "cache:epoch" # 清空数据库或全量导入时换成新的随机值，使之前缓存的全部记录失效
 
-def get_all_products(page=1, page_size=20, search_query=""):
+class RecordCache:
+    """
+    进程内的 LRU 记录缓存，按 (实体, ID) 保存 (版本号, 过期时间, 值, 存放该记录的 Redis key)，最多 max_entries 条。
+    版本号由 CACHE_EPOCH_KEY 和 CACHE_VERSIONS_KEY 中该记录的值组成，在读取记录之前读出；
+    条目在 ttl 秒内直接返回，过期后向 Redis 核对版本号，一致则续期，否则重新读取。
+    本进程的写入会立即移除对应条目，其他进程的写入最迟在 ttl 秒后被发现；
+    启用 near-cache (enable_near_cache) 后由服务器推送的失效消息按 Redis key 移除条目，条目不再按 ttl 核对版本。
+    读取期间本进程有任何失效操作时不写入缓存，避免把失效前读到的旧值放回缓存。
+    """
+
+    def __init__(self, max_entries=RECORD_CACHE_MAX_ENTRIES, ttl=RECORD_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_redis_key = {} # Redis key -> 依赖它的条目 key 集合
+        self._lock = threading.Lock()
+        self._generation = 0 # 每次失效递增
+        self.tracked_pid = None # 失效消息监听线程所在的进程；fork 出的子进程没有该线程，不能信任推送
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.pushed_invalidations = 0
+
+    def is_tracked(self):
+        """当前进程是否有监听线程在接收服务器推送的失效消息"""
+        return self.tracked_pid == os.getpid()
+
+    def lookup(self, key):
+        """返回 (值, 是否已过期, 版本号, 当前 generation)；没有条目时值和版本号为 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None, True, None, self._generation
+            self._entries.move_to_end(key)
+            version, expires_at, value, _ = entry
+            return value, time.monotonic() >= expires_at, version, self._generation
+
+    def count(self, outcome):
+        """在锁内把一次读取的结果计数 ('hits'、'revalidated' 或 'misses') 加一，供 stats 统计"""
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def store(self, key, version, value, generation, redis_keys=()):
+        """
+        写入条目；generation 为读取开始时 lookup 返回的值，之后发生过失效时放弃写入。
+        redis_keys 为存放该记录的 Redis key，收到这些 key 的失效消息时移除条目。
+        """
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._remove(key)
+            self._entries[key] = (version, time.monotonic() + self.ttl, value, tuple(redis_keys))
+            for redis_key in redis_keys:
+                self._keys_by_redis_key.setdefault(redis_key, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """在持有锁时移除一个条目及其 Redis key 映射"""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for redis_key in entry[3]:
+            keys = self._keys_by_redis_key.get(redis_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_redis_key[redis_key]
+
+    def invalidate(self, key=None):
+        """移除一个条目，key 为 None 时清空全部条目"""
+        with self._lock:
+            self._generation += 1
+            if key is None:
+                self._entries.clear()
+                self._keys_by_redis_key.clear()
+            else:
+                self._remove(key)
+
+    def invalidate_redis_keys(self, redis_keys):
+        """移除依赖这些 Redis key 的全部条目 (处理服务器推送的失效消息)"""
+        with self._lock:
+            self._generation += 1
+            for redis_key in redis_keys:
+                for key in list(self._keys_by_redis_key.get(redis_key, ())):
+                    self._remove(key)
+                    self.pushed_invalidations += 1
+
+    def memory_bytes(self):
+        """估算缓存条目占用的内存 (字节)：条目 key、版本号和值中的 dict/list/字符串按 sys.getsizeof 递归累加"""
+        def size(value):
+            total = sys.getsizeof(value)
+            if isinstance(value, dict):
+                total += sum(size(k) + size(v) for k, v in value.items())
+            elif isinstance(value, (list, tuple)):
+                total += sum(size(item) for item in value)
+            return total
+
+        with self._lock:
+            return sum(size(key) + size(entry) for key, entry in self._entries.items())
+
+    def stats(self):
+        """返回命中、未命中、核对版本后续期的次数，命中率 (续期计为命中)，当前条目数、估算内存以及推送失效次数"""
+        memory = self.memory_bytes()
+        with self._lock:
+            lookups = self.hits + self.revalidated + self.misses
+            return {
+                'hits': self.hits,
+                'revalidated': self.revalidated,
+                'misses': self.misses,
+                'hit_ratio': (self.hits + self.revalidated) / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'memory_bytes': memory,
+                'tracked': self.is_tracked(),
+                'pushed_invalidations': self.pushed_invalidations,
+            }
+
+RECORD_CACHE = RecordCache()
+
+def _cache_version(r_client, entity, record_id):
+    """读取记录当前的版本号 "epoch:版本"，从未写入过的记录版本为 0"""
+    pipe = r_client.pipeline(transaction=False)
+    pipe.get(CACHE_EPOCH_KEY)
+    pipe.hget(CACHE_VERSIONS_KEY.format(entity=entity), record_id)
+    epoch, version = pipe.execute()
+    return f"{epoch}:{version or 0}"
+
+def _cache_storage_keys(r_client, entity, record_id):
+    """存放一条缓存记录的 Redis key，near-cache 收到这些 key 的失效消息时移除该条目"""
+    if entity == 'order':
+        return [f"order:{record_id}", f"order:{record_id}:items", f"order:{record_id}:items_packed"]
+    return _record_storage_keys(entity, [record_id], _record_buckets(r_client, entity))
+
+def _cached_record(r_client, entity, record_id, loader):
+    """
+    从 RECORD_CACHE 读取记录，未命中或版本已变化时调用 loader() 从 Redis 读取并缓存；loader 返回空值时不缓存。
+    near-cache 启用时条目一直有效，直到收到失效消息。
+    返回值是缓存值的副本 (dict 浅拷贝；tuple 中的 dict/list 也各自复制)，调用方可以修改。
+    """
+    key = (entity, str(record_id))
+    tracked = RECORD_CACHE.is_tracked()
+    value, expired, version, generation = RECORD_CACHE.lookup(key)
+    if value is not None and (tracked or not expired):
+        RECORD_CACHE.count('hits')
+        return _copy_cached(value)
+    current_version = _cache_version(r_client, entity, record_id)
+    if value is not None and version == current_version:
+        RECORD_CACHE.count('revalidated')
+        RECORD_CACHE.store(key, version, value, generation)
+        return _copy_cached(value)
+    RECORD_CACHE.count('misses')
+    redis_keys = _cache_storage_keys(r_client, entity, record_id) if tracked else ()
+    value = loader()
+    if value:
+        RECORD_CACHE.store(key, current_version, value, generation, redis_keys)
+    return _copy_cached(value)
+
+def _copy_cached(value):
+    """复制缓存值，使调用方的修改不影响缓存"""
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, (list, tuple)):
+        return type(value)(_copy_cached(item) for item in value)
+    return value
+
+def _queue_cache_invalidate(pipe, entity, record_id):
+    """把记录版本号和实体写入版本号加一的命令加入写入该记录的 pipeline，并立即移除本进程中的缓存条目"""
+    pipe.hincrby(CACHE_VERSIONS_KEY.format(entity=entity), record_id, 1)
+    _queue_write_version(pipe, entity)
+    RECORD_CACHE.invalidate((entity, str(record_id)))
+
+def _queue_cache_epoch(pipe):
+    """清空数据库或全量导入时调用：换一个新的 epoch，使所有进程缓存的记录失效，并清空本进程的缓存"""
+    pipe.set(CACHE_EPOCH_KEY, uuid.uuid4().hex)
+    RECORD_CACHE.invalidate()
+
+def get_record_cache_report():
+    """返回本进程记录缓存的命中率和内存报告 (消息, 成功标志)"""
+    stats = RECORD_CACHE.stats()
+    mode = f"near-cache ({NEAR_CACHE})，收到失效 {stats['pushed_invalidations']} 条" if stats['tracked'] else "按版本号核对"
+    return (f"记录缓存 [{mode}]：命中 {stats['hits']} 次，核对版本后续期 {stats['revalidated']} 次，未命中 {stats['misses']} 次，"
+            f"命中率 {stats['hit_ratio']:.1%}，当前缓存 {stats['entries']} 条，约 {stats['memory_bytes'] / 1e6:.2f} MB。"), True
+
+# --- near-cache：服务器推送的缓存失效 ---
+
+NEAR_CACHE_PREFIXES = ('product:', 'user:', 'order:', CACHE_EPOCH_KEY) # 收到这些前缀的 key 的失效消息
+_near_cache_listener = None
+
+class _InvalidationListener:
+    """
+    后台线程：在独立连接上接收失效消息，按 Redis key 移除 RECORD_CACHE 中的条目。
+    'tracking' 模式下一个连接 SUBSCRIBE __redis__:invalidate，另一个连接以 REDIRECT + BCAST 开启 CLIENT TRACKING，
+    RESP2 也可使用；'keyspace' 模式 PSUBSCRIBE 对应前缀的 keyspace 通知。
+    FLUSHDB 或 CACHE_EPOCH_KEY 变化时清空全部条目；连接断开时清空缓存并退回按版本号核对。
+    """
+
+    def __init__(self, r_client, mode):
+        self.mode = mode
+        self.pool = r_client.connection_pool
+        self.subscriber = self.pool.make_connection()
+        self.tracker = None
+        self.stopped = False
+        if mode == 'tracking':
+            self.subscriber.send_command('CLIENT', 'ID')
+            client_id = self.subscriber.read_response()
+            self.subscriber.send_command('SUBSCRIBE', '__redis__:invalidate')
+            self.subscriber.read_response()
+            self.tracker = self.pool.make_connection()
+            prefixes = [arg for prefix in NEAR_CACHE_PREFIXES for arg in ('PREFIX', prefix)]
+            self.tracker.send_command('CLIENT', 'TRACKING', 'on', 'REDIRECT', client_id, 'BCAST', *prefixes)
+            self.tracker.read_response()
+        else:
+            self.channel_prefix = f"__keyspace@{self.subscriber.db}__:"
+            patterns = [f"{self.channel_prefix}{prefix}*" for prefix in NEAR_CACHE_PREFIXES]
+            self.subscriber.send_command('PSUBSCRIBE', *patterns)
+            for _ in patterns:
+                self.subscriber.read_response()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        RECORD_CACHE.invalidate() # 之前的条目没有记录 Redis key，无法按失效消息移除
+        RECORD_CACHE.tracked_pid = os.getpid()
+        self.thread.start()
+
+    def _run(self):
+        try:
+            while not self.stopped:
+                self._handle(self.subscriber.read_response())
+        except Exception as e:
+            if not self.stopped:
+                print(f"near-cache 失效连接断开，退回按版本号核对: {e}")
+        finally:
+            RECORD_CACHE.tracked_pid = None
+            RECORD_CACHE.invalidate()
+
+    def _handle(self, message):
+        """处理一条推送；tracking 消息的 key 列表为空 (None) 表示 FLUSHDB/FLUSHALL"""
+        if self.mode == 'tracking':
+            if message[0] != 'message':
+                return
+            keys = message[2]
+        else:
+            if message[0] != 'pmessage':
+                return
+            keys = [message[2][len(self.channel_prefix):]]
+        if keys is None or CACHE_EPOCH_KEY in keys:
+            RECORD_CACHE.invalidate()
+        else:
+            RECORD_CACHE.invalidate_redis_keys(keys)
+
+    def stop(self):
+        self.stopped = True
+        RECORD_CACHE.tracked_pid = None
+        RECORD_CACHE.invalidate()
+        for connection in (self.subscriber, self.tracker):
+            if connection is not None:
+                connection.disconnect()
+
+def enable_near_cache(mode='tracking'):
+    """
+    启用 near-cache，返回 (消息, 成功标志)。mode 为 'tracking' (CLIENT TRACKING，需要 Redis 6+) 或
+    'keyspace' (keyspace 通知，会在服务器的 notify-keyspace-events 中加入 K 和 A)。
+    每个进程各自启用；启用后商品、用户和订单详情在被任何客户端修改前一直从本进程内存读取。
+    """
+    global _near_cache_listener
+    if mode not in ('tracking', 'keyspace'):
+        raise ValueError(f"未知的 near-cache 模式: {mode!r}，可选 'tracking' 或 'keyspace'")
     r_client = get_redis_client()
-    if not r_client: return [], 0 # 返回空列表和总数0
+    if not r_client:
+        return "Redis 连接失败。", False
+    disable_near_cache()
+    try:
+        if mode == 'keyspace':
+            current = r_client.config_get('notify-keyspace-events').get('notify-keyspace-events', '')
+            r_client.config_set('notify-keyspace-events', ''.join(sorted(set(current) | set('KA'))))
+        listener = _InvalidationListener(r_client, mode)
+    except redis.exceptions.RedisError as e:
+        return f"启用 near-cache 失败: {e}", False
+    listener.start()
+    _near_cache_listener = listener
+    return f"near-cache 已启用 ({mode})。", True
+
+def disable_near_cache():
+    """停止失效消息监听，记录缓存退回按版本号核对"""
+    global _near_cache_listener
+    if _near_cache_listener is not None:
+        _near_cache_listener.stop()
+        _near_cache_listener = None
 
+# --- 数据查询 (添加分页和搜索功能) ---
+
+def _scan_products(r_client, page, page_size, search_query, matched_ids=None):
+    """
+    读取全部商品后在 Python 端搜索和分页，返回 (当前页商品, 总数)；用于搜索索引或列表索引尚未建立时。
+    给出 matched_ids 列表时，把全部命中的商品 ID 按结果顺序追加到其中 (用于缓存搜索结果)。
+    """
     all_product_ids = list(r_client.smembers("product:all_ids"))
     
     # 获取所有商品的完整详情，以便在 Python 端进行过滤
     all_products_details = []
     if all_product_ids:
-        pipe = r_client.pipeline()
-        for pid in all_product_ids:
-            pipe.hgetall(f"product:{pid}")
-        fetched_details = pipe.execute()
+        # 描述可能被压缩，先不解压：只在搜索需要时解压单条描述，分页后再解压当前页
+        fetched_details = _fetch_records(r_client, 'product', all_product_ids, decompress=False)
         for details in fetched_details:
             if details:
                 all_products_details.append(details)
@@ -318,43 +2946,53 @@ def get_all_products(page=1, page_size=20, search_query=""):
     if search_query:
         search_query_lower = search_query.lower()
         for p in all_products_details:
-            # 搜索名称、描述、分类
+            # 搜索名称、分类、描述 (描述放在最后，名称或分类已命中时无需解压)
             if (search_query_lower in p.get('name', '').lower() or
-                search_query_lower in p.get('description', '').lower() or
-                search_query_lower in p.get('category', '').lower()):
+                search_query_lower in p.get('category', '').lower() or
+                search_query_lower in _decompress_text(p.get('description', '')).lower()):
                 filtered_products.append(p)
     else:
         filtered_products = all_products_details
 
     total_items = len(filtered_products)
+    if matched_ids is not None:
+        matched_ids.extend(record.get('product_id') for record in filtered_products)
 
     # 根据过滤后的结果进行分页
     start_index = (page - 1) * page_size
     end_index = start_index + page_size
     
-    current_page_products = filtered_products[start_index:end_index]
+    return _decompress_records(filtered_products[start_index:end_index], 'product'), total_items
 
-    products_formatted = []
-    for details in current_page_products:
-        if details:
-            details['price'] = float(details.get('price', 0))
-            details['stock'] = int(details.get('stock', 0))
-            products_formatted.append(details)
-            
-    return products_formatted, total_items # 返回当前页数据和总数
+def get_all_products(page=1, page_size=20, search_query="", fields=LIST_FIELDS['product']):
+    """返回 (当前页商品, 总数)；fields 为每条商品读取的字段，默认只读列表显示的列，None 表示全部字段"""
+    r_client = get_redis_client()
+    if not r_client: return [], 0 # 返回空列表和总数0
+
+    # 无搜索条件时按 product:by_created 索引只读取当前页 (最新创建的在前)，有搜索条件时按搜索索引只读取命中的当前页
+    if search_query:
+        indexed_page = _search_page(r_client, 'product', search_query, page, page_size)
+    else:
+        indexed_page = _index_page(r_client, 'product', page, page_size)
+    if indexed_page is not None:
+        page_ids, total_items = indexed_page
+        return _fetch_list_records(r_client, 'product', page_ids, fields), total_items
+
+    if not search_query:
+        current_page_products, total_items = _scan_products(r_client, page, page_size, search_query)
+        return _format_list_records('product', current_page_products), total_items # 返回当前页数据和总数
+    page_ids, total_items, current_page_products = _scan_search_page(
+        r_client, 'product', search_query, page, page_size,
+        lambda matched_ids: _scan_products(r_client, page, page_size, search_query, matched_ids))
+    if page_ids is not None:
+        return _fetch_list_records(r_client, 'product', page_ids, fields), total_items
+    return _format_list_records('product', current_page_products), total_items
 
 def get_product_details(product_id):
+    """读取单个商品的完整记录，经过进程内 RECORD_CACHE 缓存"""
     r_client = get_redis_client()
     if not r_client: return None
-    cache_key = f"cache:product_details:{product_id}"
-    cached_data = r_client.get(cache_key)
-    if cached_data:
-        return json.loads(cached_data)
-    else:
-        details = r_client.hgetall(f"product:{product_id}")
-        if details:
-            r_client.setex(cache_key, 60, json.dumps(details))
-        return details
+    return _cached_record(r_client, 'product', product_id, lambda: _fetch_records(r_client, 'product', [product_id])[0])
 
 # --- CRUD: 商品 ---
 def add_product(product_data):
@@ -363,12 +3001,15 @@ def add_product(product_data):
     product_id = str(uuid.uuid4())
     try:
         pipe = r_client.pipeline()
-        for key, value in product_data.items():
-            pipe.hset(f"product:{product_id}", key, str(value))
-        pipe.hset(f"product:{product_id}", "product_id", product_id) # 确保ID也存储
+        record = _compress_fields('product', _encode_fields(r_client, 'product', product_data))
+        record["product_id"] = product_id # 确保ID也存储
+        _queue_record(pipe, 'product', record, _record_buckets(r_client, 'product'))
         pipe.sadd("product:all_ids", product_id)
         pipe.sadd(f"category:{product_data['category']}:products", product_id)
-        pipe.zadd("product:prices", {product_id: float(product_data['price'])})
+        pipe.sadd(PRODUCT_CATEGORIES_KEY, product_data['category'])
+        _queue_list_index(pipe, 'product', product_id, product_data)
+        _queue_search_index(pipe, 'product', product_id, product_data)
+        _queue_write_version(pipe, 'product')
         pipe.execute()
         return "商品添加成功。", True
     except Exception as e:
@@ -380,21 +3021,24 @@ def update_product_details(product_id, data):
     try:
         pipe = r_client.pipeline()
         # 获取旧的分类，如果分类改变，需要更新 category:*:products set
-        old_category = r_client.hget(f"product:{product_id}", "category")
+        old_record = _fetch_records(r_client, 'product', [product_id])[0]
+        old_category = old_record.get("category")
 
-        for key, value in data.items():
-            pipe.hset(f"product:{product_id}", key, str(value))
+        _save_record(r_client, 'product', product_id, _compress_fields('product', _encode_fields(r_client, 'product', data)))
         
-        if 'price' in data:
-            pipe.zadd("product:prices", {product_id: float(data['price'])})
+        # 价格、库存或创建时间变化时更新对应的排序索引
+        _queue_list_index(pipe, 'product', product_id, data)
+        # 按合并前后的完整记录更新搜索索引
+        _queue_search_index_delete(pipe, 'product', product_id, old_record)
+        _queue_search_index(pipe, 'product', product_id, {**old_record, **data})
         
         if 'category' in data and old_category and old_category != data['category']:
             pipe.srem(f"category:{old_category}:products", product_id)
             pipe.sadd(f"category:{data['category']}:products", product_id)
+            pipe.sadd(PRODUCT_CATEGORIES_KEY, data['category'])
 
+        _queue_cache_invalidate(pipe, 'product', product_id)
         pipe.execute()
-        # 清除缓存
-        r_client.delete(f"cache:product_details:{product_id}")
         return "商品更新成功。", True
     except Exception as e:
         return f"更新商品失败: {e}", False
@@ -404,24 +3048,15 @@ def delete_product(product_id):
     if not r_client: return "Redis 连接失败。", False
     try:
         # 获取商品信息以便清理相关数据
-        product_details = r_client.hgetall(f"product:{product_id}")
+        product_details = _fetch_records(r_client, 'product', [product_id])[0]
         if not product_details:
             return "商品不存在。", False
         
-        category = product_details.get('category')
-
         pipe = r_client.pipeline()
-        pipe.delete(f"product:{product_id}") # 删除商品详情Hash
-        pipe.srem("product:all_ids", product_id) # 从所有商品ID集合中移除
-        pipe.zrem("product:prices", product_id) # 从价格Sorted Set中移除
-        if category:
-            pipe.srem(f"category:{category}:products", product_id) # 从分类Set中移除
-
         # 还需要清理与该商品相关的订单项和销售记录
         # 这是一个复杂的操作，因为 product:{pid}:sales 存储的是 order_item_id
         # 简化处理：删除该商品的销售记录列表
-        pipe.delete(f"product:{product_id}:sales")
-
+        _queue_product_delete(pipe, product_id, product_details.get('category'), _record_buckets(r_client, 'product'), product_details)
         pipe.execute()
         return "商品删除成功。", True
     except Exception as e:
@@ -429,32 +3064,133 @@ def delete_product(product_id):
 
 
 def get_product_categories():
-    """获取所有商品分类列表"""
+    """获取所有商品分类列表 (只读 PRODUCT_CATEGORIES_KEY，不统计数量)，用于没有筛选条件的列表页的分类选项"""
     r_client = get_redis_client()
     if not r_client: return []
+    return _product_categories(r_client)
 
-    # 获取所有以 "category:" 开头且以 ":products" 结尾的 key
-    category_keys = r_client.keys("category:*:products")
-    categories = []
-    for key in category_keys:
-        category_name = key.split(':')[1]
-        categories.append(category_name)
-    return sorted(list(set(categories)))  # 返回去重并排序后的分类列表
+# --- 分类 + 价格区间筛选浏览 ---
 
+PRODUCT_CATEGORIES_KEY = "product:categories" # Set：商品分类名，随写入商品时 SADD 维护，代替按 category:*:products 模式查找 key
 
-# --- CRUD: 用户 ---
-def get_all_users(page=1, page_size=20, search_query=""):
+def _product_categories(r_client):
+    """
+    返回按名称排序的商品分类列表。分类下的商品全部删除后名称仍留在集合中 (并发写入时无法安全地移除)，
+    计数时按 SCARD 过滤；rebuild_list_indexes 会按现有分类集合重建。
+    库中数据早于该集合 (集合为空但已有商品) 时用 SCAN 补建一次。
+    """
+    categories = r_client.smembers(PRODUCT_CATEGORIES_KEY)
+    if not categories and r_client.exists("product:all_ids"):
+        categories = {key.split(':')[1] for key in r_client.scan_iter("category:*:products", count=10000)}
+        if categories:
+            r_client.sadd(PRODUCT_CATEGORIES_KEY, *categories)
+    return sorted(categories)
+
+BROWSE_TEMP_TTL = 30 # 筛选临时结果的过期秒数；临时 key 正常在同一事务中删除，过期只用于兜底
+
+def _price_bounds(min_price, max_price):
+    """把价格区间换算为 ZRANGEBYSCORE 的上下界，未指定的一端为无穷"""
+    low = '-inf' if min_price in (None, '') else float(min_price)
+    high = '+inf' if max_price in (None, '') else float(max_price)
+    return low, high
+
+def _queue_browse_filter(pipe, dest, category, low, high, in_stock_only):
+    """
+    把 分类 ∩ 价格区间 ∩ 有货 的商品写入临时有序集合 dest：先用 ZINTERSTORE 把分类集合与 product:prices 求交集
+    (分类集合权重为 0，分数即价格)，ZREMRANGEBYSCORE 去掉区间外的商品，有货条件再与 product:by_stock 求交集后去掉库存 <= 0 的商品。
+    """
+    if category:
+        pipe.zinterstore(dest, {f"category:{category}:products": 0, "product:prices": 1})
+    else:
+        pipe.zunionstore(dest, ["product:prices"])
+    if low != '-inf':
+        pipe.zremrangebyscore(dest, '-inf', f"({low}")
+    if high != '+inf':
+        pipe.zremrangebyscore(dest, f"({high}", '+inf')
+    if in_stock_only:
+        pipe.zinterstore(dest, {dest: 0, "product:by_stock": 1})
+        pipe.zremrangebyscore(dest, '-inf', 0)
+    pipe.expire(dest, BROWSE_TEMP_TTL)
+
+def _category_facets(r_client, low, high, in_stock_only):
+    """
+    返回 [(分类, 在价格区间和有货条件下的商品数)]，按分类名排序；没有价格和有货条件时直接 SCARD，
+    并略去已没有商品的分类
+    """
+    categories = _product_categories(r_client)
+    pipe = r_client.pipeline()
+    if low == '-inf' and high == '+inf' and not in_stock_only:
+        for category in categories:
+            pipe.scard(f"category:{category}:products")
+        return [(category, count) for category, count in zip(categories, pipe.execute()) if count]
+
+    temp_key = f"browse:tmp:{uuid.uuid4().hex}"
+    positions = []
+    for category in categories:
+        _queue_browse_filter(pipe, temp_key, category, low, high, in_stock_only)
+        positions.append(len(pipe))
+        pipe.zcard(temp_key)
+    pipe.delete(temp_key)
+    results = pipe.execute()
+    return [(category, results[position]) for category, position in zip(categories, positions)]
+
+def get_category_facets(min_price=None, max_price=None, in_stock_only=False):
+    """返回各分类在价格区间和有货条件下的商品数 [(分类, 数量)]，用于筛选界面的分类选项"""
     r_client = get_redis_client()
-    if not r_client: return [], 0
+    if not r_client: return []
+    return _category_facets(r_client, *_price_bounds(min_price, max_price), in_stock_only)
+
+def browse_products(category=None, min_price=None, max_price=None, in_stock_only=False,
+                    sort_by='price', descending=False, page=1, page_size=20, fields=LIST_FIELDS['product']):
+    """
+    按分类、价格区间 (含两端) 和是否有货筛选商品，按 SORT_INDEXES 中的 sort_by 排序分页，
+    返回 (当前页商品, 浏览信息)。浏览信息包含 page、total、total_pages，以及 facets：
+    价格区间和有货条件下每个分类的商品数 (不受 category 限制，界面可据此显示各分类的可选数量)。
+    筛选在 Redis 端按 _queue_browse_filter 求交集，再与排序索引 ZINTERSTORE 换算为排序分数后只读取当前页，
+    临时 key 在同一事务中创建和删除；不按分类和有货筛选且按价格排序时直接在 product:prices 上
+    ZCOUNT / ZRANGEBYSCORE，不创建临时 key。fields 含义同 get_all_products。
+    """
+    r_client = get_redis_client()
+    if not r_client: return [], {'page': 1, 'total': 0, 'total_pages': 1, 'facets': []}
+
+    sort_key = _sort_index_key('product', sort_by)
+    low, high = _price_bounds(min_price, max_price)
+    start = max(page - 1, 0) * page_size
+    if not category and not in_stock_only and sort_key == "product:prices":
+        pipe = r_client.pipeline(transaction=False)
+        pipe.zcount(sort_key, low, high)
+        if descending:
+            pipe.zrevrangebyscore(sort_key, high, low, start=start, num=page_size)
+        else:
+            pipe.zrangebyscore(sort_key, low, high, start=start, num=page_size)
+        total, page_ids = pipe.execute()
+    else:
+        temp_key = f"browse:tmp:{uuid.uuid4().hex}"
+        pipe = r_client.pipeline()
+        _queue_browse_filter(pipe, temp_key, category, low, high, in_stock_only)
+        pipe.zinterstore(temp_key, {temp_key: 0, sort_key: 1})
+        pipe.zcard(temp_key)
+        (pipe.zrevrange if descending else pipe.zrange)(temp_key, start, start + page_size - 1)
+        pipe.delete(temp_key)
+        total, page_ids = pipe.execute()[-3:-1]
+
+    products = _fetch_list_records(r_client, 'product', page_ids, fields)
+    return products, {
+        'page': start // page_size + 1,
+        'total': total,
+        'total_pages': math.ceil(total / page_size) if total > 0 else 1,
+        'facets': _category_facets(r_client, low, high, in_stock_only),
+    }
+
 
+# --- CRUD: 用户 ---
+def _scan_users(r_client, page, page_size, search_query, matched_ids=None):
+    """读取全部用户后在 Python 端搜索和分页，返回 (当前页用户, 总数)；matched_ids 含义同 _scan_products"""
     all_user_ids = list(r_client.smembers("user:all_ids"))
     
     all_users_details = []
     if all_user_ids:
-        pipe = r_client.pipeline()
-        for uid in all_user_ids:
-            pipe.hgetall(f"user:{uid}")
-        fetched_details = pipe.execute()
+        fetched_details = _fetch_records(r_client, 'user', all_user_ids)
         for details in fetched_details:
             if details:
                 all_users_details.append(details)
@@ -471,11 +3207,35 @@ def get_all_users(page=1, page_size=20, search_query=""):
         filtered_users = all_users_details
 
     total_items = len(filtered_users)
+    if matched_ids is not None:
+        matched_ids.extend(record.get('user_id') for record in filtered_users)
 
     start_index = (page - 1) * page_size
     end_index = start_index + page_size
     
-    current_page_users = filtered_users[start_index:end_index]
+    return filtered_users[start_index:end_index], total_items
+
+def get_all_users(page=1, page_size=20, search_query="", fields=LIST_FIELDS['user']):
+    """返回 (当前页用户, 总数)；fields 含义同 get_all_products"""
+    r_client = get_redis_client()
+    if not r_client: return [], 0
+
+    # 无搜索条件时按 user:by_registered 索引只读取当前页 (最新注册的在前)，有搜索条件时按搜索索引只读取命中的当前页
+    if search_query:
+        indexed_page = _search_page(r_client, 'user', search_query, page, page_size)
+    else:
+        indexed_page = _index_page(r_client, 'user', page, page_size)
+    if indexed_page is not None:
+        page_ids, total_items = indexed_page
+        current_page_users = _fetch_list_records(r_client, 'user', page_ids, fields)
+    elif not search_query:
+        current_page_users, total_items = _scan_users(r_client, page, page_size, search_query)
+    else:
+        page_ids, total_items, current_page_users = _scan_search_page(
+            r_client, 'user', search_query, page, page_size,
+            lambda matched_ids: _scan_users(r_client, page, page_size, search_query, matched_ids))
+        if page_ids is not None:
+            current_page_users = _fetch_list_records(r_client, 'user', page_ids, fields)
 
     users_formatted = []
     for details in current_page_users:
@@ -486,7 +3246,7 @@ def get_all_users(page=1, page_size=20, search_query=""):
 def get_user_details(user_id):
     r_client = get_redis_client()
     if not r_client: return None, []
-    user = r_client.hgetall(f"user:{user_id}")
+    user = _cached_record(r_client, 'user', user_id, lambda: _fetch_records(r_client, 'user', [user_id])[0])
     user_orders = r_client.lrange(f"user:{user_id}:orders", 0, -1)
     return user, user_orders
 
@@ -496,10 +3256,13 @@ def add_user(user_data):
     user_id = str(uuid.uuid4())
     try:
         pipe = r_client.pipeline()
-        for key, value in user_data.items():
-            pipe.hset(f"user:{user_id}", key, str(value))
-        pipe.hset(f"user:{user_id}", "user_id", user_id) # 确保ID也存储
+        record = {key: str(value) for key, value in user_data.items()}
+        record["user_id"] = user_id # 确保ID也存储
+        _queue_record(pipe, 'user', record, _record_buckets(r_client, 'user'))
         pipe.sadd("user:all_ids", user_id)
+        _queue_list_index(pipe, 'user', user_id, user_data)
+        _queue_search_index(pipe, 'user', user_id, user_data)
+        _queue_write_version(pipe, 'user')
         pipe.execute()
         return "用户添加成功。", True
     except Exception as e:
@@ -509,9 +3272,13 @@ def update_user_details(user_id, data):
     r_client = get_redis_client()
     if not r_client: return "Redis 连接失败。", False
     try:
+        old_record = _fetch_records(r_client, 'user', [user_id])[0]
+        _save_record(r_client, 'user', user_id, data)
         pipe = r_client.pipeline()
-        for key, value in data.items():
-            pipe.hset(f"user:{user_id}", key, str(value))
+        _queue_list_index(pipe, 'user', user_id, data)
+        _queue_search_index_delete(pipe, 'user', user_id, old_record)
+        _queue_search_index(pipe, 'user', user_id, {**old_record, **data})
+        _queue_cache_invalidate(pipe, 'user', user_id)
         pipe.execute()
         return "用户更新成功。", True
     except Exception as e:
@@ -522,20 +3289,16 @@ def delete_user(user_id):
     if not r_client: return "Redis 连接失败。", False
     try:
         pipe = r_client.pipeline()
-        pipe.delete(f"user:{user_id}") # 删除用户详情Hash
-        pipe.srem("user:all_ids", user_id) # 从所有用户ID集合中移除
-        pipe.delete(f"user:{user_id}:orders") # 删除用户订单历史List
         # 注意：这里没有删除用户创建的订单本身，这通常需要更复杂的业务逻辑来处理级联删除或标记
+        _queue_user_delete(pipe, user_id, _record_buckets(r_client, 'user'), _fetch_records(r_client, 'user', [user_id])[0])
         pipe.execute()
         return "用户删除成功。", True
     except Exception as e:
         return f"用户删除失败: {e}", False
 
 # --- CRUD: 订单 ---
-def get_all_orders(page=1, page_size=20, search_query=""):
-    r_client = get_redis_client()
-    if not r_client: return [], 0
-
+def _scan_orders(r_client, page, page_size, search_query, dictionaries, matched_ids=None):
+    """读取全部订单后在 Python 端搜索和分页，返回 (当前页订单, 总数)，编码字段尚未解码；matched_ids 含义同 _scan_products"""
     all_order_ids = list(r_client.smembers("order:all_ids"))
     
     all_orders_details = []
@@ -551,43 +3314,186 @@ def get_all_orders(page=1, page_size=20, search_query=""):
     filtered_orders = []
     if search_query:
         search_query_lower = search_query.lower()
+        # 国家和状态先在码表中匹配，记录只需比较编码；未编码的旧值仍按子串匹配
+        matching_codes = {field: {code for code, value in table.items() if search_query_lower in value.lower()}
+                          for field, table in dictionaries.items()}
+
+        def field_matches(o, field):
+            value = o.get(field, '')
+            if field in dictionaries and value in dictionaries[field]:
+                return value in matching_codes[field]
+            return search_query_lower in value.lower()
+
         for o in all_orders_details:
             # 搜索订单ID、用户ID、国家、状态
             if (search_query_lower in o.get('order_id', '').lower() or
                 search_query_lower in o.get('user_id', '').lower() or
-                search_query_lower in o.get('country', '').lower() or
-                search_query_lower in o.get('status', '').lower()):
+                field_matches(o, 'country') or
+                field_matches(o, 'status')):
                 filtered_orders.append(o)
     else:
         filtered_orders = all_orders_details
 
     total_items = len(filtered_orders)
+    if matched_ids is not None:
+        matched_ids.extend(record.get('order_id') for record in filtered_orders)
 
     start_index = (page - 1) * page_size
     end_index = start_index + page_size
     
-    current_page_orders = filtered_orders[start_index:end_index]
+    return filtered_orders[start_index:end_index], total_items
+
+def get_all_orders(page=1, page_size=20, search_query="", fields=LIST_FIELDS['order']):
+    """返回 (当前页订单, 总数)；fields 含义同 get_all_products"""
+    r_client = get_redis_client()
+    if not r_client: return [], 0
+
+    dictionaries = _load_dictionaries(r_client, 'order')
+    # 无搜索条件时按 order:by_date 索引只读取当前页 (最新的订单在前)，有搜索条件时按搜索索引只读取命中的当前页
+    if search_query:
+        indexed_page = _search_page(r_client, 'order', search_query, page, page_size)
+    else:
+        indexed_page = _index_page(r_client, 'order', page, page_size)
+    if indexed_page is not None:
+        page_ids, total_items = indexed_page
+        return _fetch_list_records(r_client, 'order', page_ids, fields), total_items
+
+    if search_query:
+        page_ids, total_items, current_page_orders = _scan_search_page(
+            r_client, 'order', search_query, page, page_size,
+            lambda matched_ids: _scan_orders(r_client, page, page_size, search_query, dictionaries, matched_ids))
+        if page_ids is not None:
+            return _fetch_list_records(r_client, 'order', page_ids, fields), total_items
+    else:
+        current_page_orders, total_items = _scan_orders(r_client, page, page_size, search_query, dictionaries)
+    current_page_orders = _decode_records([details for details in current_page_orders if details], dictionaries)
+    return _format_list_records('order', current_page_orders), total_items
+
+def _order_date_bounds(start_date=None, end_date=None):
+    """把 [start_date, end_date) 换算为 order_date 分数的 ZRANGEBYSCORE 上下界，未指定的一端为无穷，日期格式不正确时抛出 ValueError"""
+    low = '-inf' if start_date in (None, '') else datetime.fromisoformat(str(start_date)).timestamp()
+    high = '+inf' if end_date in (None, '') else f"({datetime.fromisoformat(str(end_date)).timestamp()}"
+    return low, high
+
+def get_orders_by(status=None, country=None, user_id=None, start_date=None, end_date=None,
+                  page=1, page_size=20, descending=True, fields=LIST_FIELDS['order']):
+    """
+    按状态、国家、用户和下单日期区间 [start_date, end_date) 筛选订单，按 order_date 排序分页 (默认最新的在前)，
+    返回 (当前页订单, 总数)。只给一个筛选字段时直接在 ORDER_FILTER_INDEXES 的有序集合上 ZCOUNT / ZRANGEBYSCORE，
+    多个字段时先 ZINTERSTORE 到临时 key (同一事务中删除)；都不给时使用 order:by_date。开销与命中的订单数相关，不扫描全部订单。
+    fields 含义同 get_all_orders。
+    """
+    r_client = get_redis_client()
+    if not r_client: return [], 0
 
-    orders_formatted = []
-    for details in current_page_orders:
+    low, high = _order_date_bounds(start_date, end_date)
+    filters = {'status': status, 'country': country, 'user_id': user_id}
+    keys = [ORDER_FILTER_INDEXES[field].format(value=value) for field, value in filters.items() if value not in (None, '')]
+    start = max(page - 1, 0) * page_size
+    pipe = r_client.pipeline()
+    temp_key = None
+    if not keys:
+        key = SORT_INDEXES['order']['order_date'][0]
+    elif len(keys) == 1:
+        key = keys[0]
+    else:
+        key = temp_key = f"browse:tmp:{uuid.uuid4().hex}"
+        pipe.zinterstore(temp_key, keys, aggregate='MAX') # 各有序集合的分数都是 order_date
+        pipe.expire(temp_key, BROWSE_TEMP_TTL)
+    pipe.zcount(key, low, high)
+    if descending:
+        pipe.zrevrangebyscore(key, high, low, start=start, num=page_size)
+    else:
+        pipe.zrangebyscore(key, low, high, start=start, num=page_size)
+    if temp_key:
+        pipe.delete(temp_key)
+    results = pipe.execute()
+    total, page_ids = results[-3:-1] if temp_key else results[-2:]
+    return _fetch_list_records(r_client, 'order', page_ids, fields), total
+
+def get_order_status_counts(start_date=None, end_date=None, country=None):
+    """返回下单日期在 [start_date, end_date) 内各 ORDER_STATUSES 状态的订单数 [(状态, 数量)]，只在国家为 country 的订单中统计时先求交集"""
+    r_client = get_redis_client()
+    if not r_client: return []
+
+    low, high = _order_date_bounds(start_date, end_date)
+    pipe = r_client.pipeline()
+    if country in (None, ''):
+        for status in ORDER_STATUSES:
+            pipe.zcount(ORDER_FILTER_INDEXES['status'].format(value=status), low, high)
+        return list(zip(ORDER_STATUSES, pipe.execute()))
+
+    temp_key = f"browse:tmp:{uuid.uuid4().hex}"
+    positions = []
+    for status in ORDER_STATUSES:
+        pipe.zinterstore(temp_key, [ORDER_FILTER_INDEXES['status'].format(value=status),
+                                    ORDER_FILTER_INDEXES['country'].format(value=country)], aggregate='MAX')
+        positions.append(len(pipe))
+        pipe.zcount(temp_key, low, high)
+    pipe.delete(temp_key)
+    results = pipe.execute()
+    return [(status, results[position]) for status, position in zip(ORDER_STATUSES, positions)]
+
+def _fetch_list_records(r_client, entity, record_ids, fields):
+    """按 ID 读取列表页的记录并转换数值字段，只读取 fields 中的字段 (None 表示全部)，不存在的记录被去掉"""
+    if entity != 'order':
+        return _format_list_records(entity, _fetch_records(r_client, entity, record_ids, fields=fields))
+    pipe = r_client.pipeline(transaction=False)
+    for oid in record_ids:
+        if fields is None:
+            pipe.hgetall(f"order:{oid}")
+        else:
+            pipe.hmget(f"order:{oid}", fields)
+    records = pipe.execute()
+    if fields is not None:
+        records = [{field: value for field, value in zip(fields, values) if value is not None} for values in records]
+    return _format_list_records('order', _decode_records([details for details in records if details], _load_dictionaries(r_client, 'order')))
+
+def _format_list_records(entity, records):
+    """去掉不存在的记录，并把列表页中的数值字段转换为数字"""
+    formatted = []
+    for details in records:
         if details:
-            details['total_amount'] = float(details.get('total_amount', 0))
-            orders_formatted.append(details)
-    return orders_formatted, total_items
+            if entity == 'product':
+                details['price'] = float(details.get('price', 0))
+                details['stock'] = int(details.get('stock', 0))
+            elif entity == 'order':
+                details['total_amount'] = float(details.get('total_amount', 0))
+            formatted.append(details)
+    return formatted
+
+def get_sorted_page(entity, sort_by=None, descending=True, page_size=20, cursor=None, page=1, fields=None):
+    """
+    按 SORT_INDEXES 中的排序字段分页读取商品、用户或订单 (entity 为 'product'、'user' 或 'order')，
+    返回 (当前页记录, 分页信息)，分页信息的字段见 _sorted_page_ids。
+    传入上一次返回的 next_cursor / prev_cursor 可向后或向前翻页，否则按 page 页码定位；
+    两种方式都只在有序集合上做 O(log N) 的排名查找，深分页与第一页开销相同。
+    分数相同的记录按 ID 排列，翻页过程中有记录增删时不会重复或遗漏游标之后的记录。
+    fields 为每条记录读取的字段，默认为 LIST_FIELDS[entity]。
+    """
+    r_client = get_redis_client()
+    if not r_client: return [], {'page': 1, 'total': 0, 'total_pages': 1, 'next_cursor': None, 'prev_cursor': None, 'indexed': False}
+
+    page_ids, page_info = _sorted_page_ids(r_client, entity, sort_by, descending, page_size, cursor, page)
+    return _fetch_list_records(r_client, entity, page_ids, fields or LIST_FIELDS[entity]), page_info
 
 def get_order_details_with_items(order_id):
+    """返回 (订单概要, 订单项列表)，订单不存在时为 (None, None)；结果经过进程内 RECORD_CACHE 缓存"""
     r_client = get_redis_client()
     if not r_client: return None, None
+    details = _cached_record(r_client, 'order', order_id, lambda: _load_order_details(r_client, order_id))
+    return details or (None, None)
+
+def _load_order_details(r_client, order_id):
+    """从 Redis 读取 (订单概要, 订单项列表)，订单不存在时返回 None"""
     order_overview = r_client.hgetall(f"order:{order_id}")
-    if not order_overview: return None, None
+    if not order_overview: return None
+    _decode_records([order_overview], _load_dictionaries(r_client, 'order'))
 
-    item_ids = r_client.lrange(f"order:{order_id}:items", 0, -1)
+    # 订单项可能是每项一个 Hash，也可能打包存放在一个字符串中，由 _fetch_order_items 统一读取
+    _, _, item_details_list = _fetch_order_items(r_client, [order_id])[0]
     order_items = []
-    if item_ids:
-        pipe = r_client.pipeline()
-        for item_id in item_ids:
-            pipe.hgetall(f"order_item:{item_id}")
-        item_details_list = pipe.execute()
+    if item_details_list:
         for item_detail in item_details_list:
             if item_detail:
                 item_detail['Quantity'] = int(item_detail.get('Quantity', 0))
@@ -601,7 +3507,17 @@ def update_order_status(order_id, new_status):
     r_client = get_redis_client()
     if not r_client: return "Redis 连接失败。", False
     try:
-        r_client.hset(f"order:{order_id}", "status", new_status)
+        old_record = _fetch_order_refs(r_client, [order_id])[0][4]
+        pipe = r_client.pipeline()
+        pipe.hset(f"order:{order_id}", "status", _encode_value(r_client, 'order', 'status', new_status))
+        if old_record:
+            # 状态筛选索引和搜索索引与订单 Hash 在同一事务中更新
+            pipe.zrem(ORDER_FILTER_INDEXES['status'].format(value=old_record['status']), order_id)
+            _queue_order_filter_index(pipe, order_id, {'order_date': old_record['order_date'], 'status': new_status})
+            _queue_search_index_delete(pipe, 'order', order_id, old_record)
+            _queue_search_index(pipe, 'order', order_id, {**old_record, 'status': new_status})
+        _queue_cache_invalidate(pipe, 'order', order_id)
+        pipe.execute()
         return "订单状态更新成功。", True
     except Exception as e:
         return f"订单状态更新失败: {e}", False
@@ -610,30 +3526,12 @@ def delete_order(order_id):
     r_client = get_redis_client()
     if not r_client: return "Redis 连接失败。", False
     try:
-        # 获取订单信息以便清理相关数据
-        order_details = r_client.hgetall(f"order:{order_id}")
-        if not order_details:
+        if not r_client.exists(f"order:{order_id}"):
             return "订单不存在。", False
-        
-        user_id = order_details.get('user_id')
-        item_ids = r_client.lrange(f"order:{order_id}:items", 0, -1)
 
+        # 读取用户ID、订单项ID及其 StockCode，以便同时清理用户订单列表和商品销售列表
         pipe = r_client.pipeline()
-        pipe.delete(f"order:{order_id}") # 删除订单详情Hash
-        pipe.srem("order:all_ids", order_id) # 从所有订单ID集合中移除
-        if user_id:
-            pipe.lrem(f"user:{user_id}:orders", 0, order_id) # 从用户订单历史中移除
-
-        # 删除所有订单项
-        if item_ids:
-            for item_id in item_ids:
-                pipe.delete(f"order_item:{item_id}")
-                # 还需要从 product:{StockCode}:sales 列表中移除对应的 item_id
-                # 这个操作比较复杂，因为需要知道 item_id 对应的 StockCode
-                # 简化处理：不从 product:{StockCode}:sales 中移除，因为LLEN只用于统计
-                # 实际生产中，可能需要维护一个 set 记录每个商品包含哪些订单项，以便快速移除
-            pipe.delete(f"order:{order_id}:items") # 删除订单项列表
-
+        _queue_order_delete(pipe, *_fetch_order_refs(r_client, [order_id])[0])
         pipe.execute()
         return "订单删除成功。", True
     except Exception as e:
@@ -654,25 +3552,14 @@ def analyze_data_from_redis():
     all_product_ids = list(r_client.smembers("product:all_ids"))
     results['total_products'] = len(all_product_ids)
 
-    all_categories = set()
-    for key in r_client.keys("category:*:products"):
-        category_name = key.split(':')[1]
-        all_categories.add(category_name)
-    results['total_categories'] = len(all_categories)
-
-    # 热门分类 (商品数量)
-    category_product_counts = {}
-    for category in all_categories:
-        count = r_client.scard(f"category:{category}:products")
-        category_product_counts[category] = count
+    # 热门分类 (商品数量)；已没有商品的分类不计入
+    category_product_counts = dict(_category_facets(r_client, '-inf', '+inf', False))
+    results['total_categories'] = len(category_product_counts)
     results['top_categories'] = sorted(category_product_counts.items(), key=lambda item: item[1], reverse=True)[:5]
 
     # 价格最高的 N 个商品
     top_price_product_ids = r_client.zrevrange("product:prices", 0, 4)
-    pipe = r_client.pipeline()
-    for pid in top_price_product_ids:
-        pipe.hgetall(f"product:{pid}")
-    top_products_details = pipe.execute()
+    top_products_details = _fetch_records(r_client, 'product', top_price_product_ids)
     results['top_priced_products'] = []
     for details in top_products_details:
         if details:
@@ -683,16 +3570,14 @@ def analyze_data_from_redis():
 
     # 低库存预警
     low_stock_products = []
-    pipe = r_client.pipeline()
-    for pid in all_product_ids:
-        pipe.hget(f"product:{pid}", "stock")
-    stocks = pipe.execute()
+    all_products_details = _fetch_records(r_client, 'product', all_product_ids)
 
-    for i, stock_str in enumerate(stocks):
+    for i, details in enumerate(all_products_details):
+        stock_str = details.get("stock")
         stock = int(stock_str) if stock_str else 0
         if stock < 10:
             product_id = all_product_ids[i]
-            product_name = r_client.hget(f"product:{product_id}", "name")
+            product_name = details.get("name")
             low_stock_products.append({'id': product_id, 'name': product_name, 'stock': stock})
     results['low_stock_products'] = low_stock_products
 
@@ -700,10 +3585,7 @@ def analyze_data_from_redis():
     all_user_ids = list(r_client.smembers("user:all_ids"))
     results['total_users'] = len(all_user_ids)
     user_logins = []
-    pipe = r_client.pipeline()
-    for uid in all_user_ids:
-        pipe.hgetall(f"user:{uid}")
-    user_details_list = pipe.execute()
+    user_details_list = _fetch_records(r_client, 'user', all_user_ids)
 
     for details in user_details_list:
         if details and 'last_login' in details and 'username' in details:
@@ -724,8 +3606,9 @@ def analyze_data_from_redis():
 
     sorted_sales = sorted(product_sales_counts.items(), key=lambda item: item[1], reverse=True)[:5]
     results['top_selling_products'] = []
+    product_names = {pid: details.get("name") for pid, details in zip(all_product_ids, all_products_details)}
     for pid, count in sorted_sales:
-        product_name = r_client.hget(f"product:{pid}", "name")
+        product_name = product_names.get(pid)
         results['top_selling_products'].append({'name': product_name, 'sales_count': count})
 
     # 月销售额趋势
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, g
+from flask import Flask, render_template, request, redirect, url_for, flash, g, jsonify
 import redis_core as rc # 导入核心逻辑模块
 import json
 import pandas as pd
@@ -19,16 +19,59 @@ def before_request():
         flash("无法连接到 Redis 服务器，请检查配置和服务器状态。", "danger")
 
 # --- 辅助函数：处理分页和搜索参数 ---
-def get_pagination_params(request):
+def get_pagination_params(request, entity):
     page = request.args.get('page', 1, type=int)
     page_size = request.args.get('page_size', 20, type=int)
     search_query = request.args.get('search_query', '', type=str)
+    cursor = request.args.get('cursor', '', type=str)
+    sort_by = request.args.get('sort', rc.LIST_SORT_FIELDS[entity], type=str)
+    descending = request.args.get('order', 'desc', type=str) != 'asc'
     
     # 确保 page_size 在合理范围内
     if not (10 <= page_size <= 100): # 限制每页大小
         page_size = 20
+    if page < 1:
+        page = 1
+    if sort_by not in rc.SORT_INDEXES[entity]:
+        sort_by = rc.LIST_SORT_FIELDS[entity]
     
-    return page, page_size, search_query
+    return page, page_size, search_query, cursor, sort_by, descending
+
+def get_list_page(request, entity, search_func):
+    """
+    读取列表页数据，返回 (当前页记录, 模板分页参数)。
+    无搜索条件时用 rc.get_sorted_page 按排序索引游标分页，深分页与第一页开销相同；
+    有搜索条件或排序索引尚未覆盖全部记录时交给 search_func (get_all_*)，由它按搜索索引或全量扫描分页。
+    """
+    page, page_size, search_query, cursor, sort_by, descending = get_pagination_params(request, entity)
+    records, page_info = None, None
+    if not search_query:
+        try:
+            records, page_info = rc.get_sorted_page(entity, sort_by, descending, page_size, cursor or None, page)
+        except ValueError: # 游标无效 (例如被手动修改)，按页码重新定位
+            records, page_info = rc.get_sorted_page(entity, sort_by, descending, page_size, None, page)
+        if not page_info['indexed']:
+            records = None
+    if records is None:
+        records, total_items = search_func(page, page_size, search_query)
+        page_info = {
+            'page': page,
+            'total_pages': math.ceil(total_items / page_size) if total_items > 0 else 1,
+            'next_cursor': None,
+            'prev_cursor': None,
+        }
+
+    return records, {
+        'current_page': page_info['page'],
+        'total_pages': page_info['total_pages'],
+        'page_size': page_size,
+        'search_query': search_query,
+        'sort_by': sort_by,
+        'sort_order': 'desc' if descending else 'asc',
+        'sort_fields': [(field, rc.SORT_FIELD_LABELS.get(field, field)) for field in rc.SORT_INDEXES[entity]],
+        'next_cursor': page_info['next_cursor'],
+        'prev_cursor': page_info['prev_cursor'],
+    }
 
 # --- 路由定义 ---
 
@@ -47,11 +90,14 @@ def data_management():
         message = ""
         success = False
 
+        # 零停机重载：先写入暂存库，校验后 SWAPDB 切换，导入期间页面仍显示旧数据
+        staging = request.form.get('staged_reload') == 'true'
+
         if action == 'generate_and_store_faker':
             try:
-                products_df, users_df, orders_df = rc.collect_and_clean_faker_data()
+                products_df, users_df, orders_df, items_df = rc.collect_and_clean_faker_data()
                 if not products_df.empty and not users_df.empty and not orders_df.empty:
-                    message, success = rc.store_data_in_redis(products_df, users_df, orders_df, flush_db=True)
+                    message, success = rc.store_data_in_redis(products_df, users_df, orders_df, items_df, flush_db=True, staging=staging)
                 else:
                     message = "Faker 数据生成或清洗后为空，未存储到 Redis。"
                     success = False
@@ -61,12 +107,19 @@ def data_management():
         elif action == 'load_and_store_online_retail':
             try:
                 fake_fill_missing = request.form.get('fake_fill_missing') == 'true'
-                products_df, users_df, orders_df = rc.load_and_clean_online_retail_data(fake_fill_missing=fake_fill_missing)
-                if not products_df.empty and not users_df.empty and not orders_df.empty:
-                    message, success = rc.store_data_in_redis(products_df, users_df, orders_df, flush_db=True)
+                if request.form.get('stream_import') == 'true':
+                    # 流式导入：分块读取并直接写入 Redis，适合大文件
+                    message, success = rc.stream_online_retail_to_redis(fake_fill_missing=fake_fill_missing, flush_db=True, staging=staging)
                 else:
-                    message = "Online Retail 数据加载或清洗后为空，未存储到 Redis。"
-                    success = False
+                    products_df, users_df, orders_df, items_df = rc.load_and_clean_online_retail_data(fake_fill_missing=fake_fill_missing)
+                    if products_df.empty or users_df.empty or orders_df.empty:
+                        message = "Online Retail 数据加载或清洗后为空，未存储到 Redis。"
+                        success = False
+                    elif request.form.get('incremental_import') == 'true':
+                        # 增量导入：只写入新增或变化的记录，删除已消失的记录
+                        message, success = rc.sync_data_in_redis(products_df, users_df, orders_df, items_df)
+                    else:
+                        message, success = rc.store_data_in_redis(products_df, users_df, orders_df, items_df, flush_db=True, staging=staging)
             except FileNotFoundError as e:
                 message = f"错误：{e} 请确保 data.csv 文件存在。"
                 success = False
@@ -84,22 +137,52 @@ def data_management():
 
     return render_template('data_management.html')
 
+@app.route('/data_management/progress')
+def ingest_progress():
+    """返回当前导入进度 (JSON)，数据管理页面在导入期间轮询此接口"""
+    progress = rc.get_ingest_progress() if g.redis_db else None
+    if not progress:
+        return jsonify({'running': False})
+    progress['running'] = True
+    return jsonify(progress)
+
 @app.route('/products')
 def list_products():
     if not g.redis_db:
         return render_template('products.html', products=[], error="无法连接到 Redis。")
     
-    page, page_size, search_query = get_pagination_params(request)
-    products, total_items = rc.get_all_products(page, page_size, search_query)
-    
-    total_pages = math.ceil(total_items / page_size) if total_items > 0 else 1
-
-    return render_template('products.html', 
-                           products=products, 
-                           current_page=page, 
-                           total_pages=total_pages, 
-                           page_size=page_size, 
-                           search_query=search_query)
+    # 分类、价格区间或有货条件任一存在 (且没有搜索条件) 时，按筛选浏览并按页码分页
+    browse = {
+        'category': request.args.get('category', '', type=str),
+        'min_price': request.args.get('min_price', None, type=float),
+        'max_price': request.args.get('max_price', None, type=float),
+        'in_stock': request.args.get('in_stock', '', type=str) == 'true',
+    }
+    filter_args = {key: value for key, value in browse.items() if value not in ('', None) and value is not False}
+    if filter_args and not request.args.get('search_query'):
+        page, page_size, _, _, sort_by, descending = get_pagination_params(request, 'product')
+        products, page_info = rc.browse_products(browse['category'] or None, browse['min_price'], browse['max_price'],
+                                                 browse['in_stock'], sort_by, descending, page, page_size)
+        pagination = {
+            'current_page': page_info['page'],
+            'total_pages': page_info['total_pages'],
+            'page_size': page_size,
+            'search_query': '',
+            'sort_by': sort_by,
+            'sort_order': 'desc' if descending else 'asc',
+            'sort_fields': [(field, rc.SORT_FIELD_LABELS.get(field, field)) for field in rc.SORT_INDEXES['product']],
+            'next_cursor': None,
+            'prev_cursor': None,
+        }
+        facets = page_info['facets']
+    else:
+        products, pagination = get_list_page(request, 'product', rc.get_all_products)
+        # 没有筛选条件时分类下拉框只需要分类名，不统计各分类的数量
+        facets = [(category, None) for category in rc.get_product_categories()]
+    if browse['in_stock']:
+        filter_args['in_stock'] = 'true' # 分页链接中的查询参数
+    return render_template('products.html', products=products, browse=browse, facets=facets,
+                           filter_args=filter_args, **pagination)
 
 @app.route('/product/<product_id>')
 def product_detail(product_id):
@@ -195,17 +278,8 @@ def list_users():
     if not g.redis_db:
         return render_template('users.html', users=[], error="无法连接到 Redis。")
     
-    page, page_size, search_query = get_pagination_params(request)
-    users, total_items = rc.get_all_users(page, page_size, search_query)
-
-    total_pages = math.ceil(total_items / page_size) if total_items > 0 else 1
-
-    return render_template('users.html', 
-                           users=users, 
-                           current_page=page, 
-                           total_pages=total_pages, 
-                           page_size=page_size, 
-                           search_query=search_query)
+    users, pagination = get_list_page(request, 'user', rc.get_all_users)
+    return render_template('users.html', users=users, **pagination)
 
 @app.route('/user/<user_id>')
 def user_detail(user_id):
@@ -290,17 +364,8 @@ def list_orders():
     if not g.redis_db:
         return render_template('orders.html', orders=[], error="无法连接到 Redis。")
     
-    page, page_size, search_query = get_pagination_params(request)
-    orders, total_items = rc.get_all_orders(page, page_size, search_query)
-
-    total_pages = math.ceil(total_items / page_size) if total_items > 0 else 1
-
-    return render_template('orders.html', 
-                           orders=orders, 
-                           current_page=page, 
-                           total_pages=total_pages, 
-                           page_size=page_size, 
-                           search_query=search_query)
+    orders, pagination = get_list_page(request, 'order', rc.get_all_orders)
+    return render_template('orders.html', orders=orders, **pagination)
 
 @app.route('/order/<order_id>')
 def order_detail(order_id):
@@ -312,7 +377,7 @@ def order_detail(order_id):
     if order:
         order['total_amount'] = float(order.get('total_amount', 0))
         user_id = order.get('user_id')
-        username = g.redis_db.hget(f"user:{user_id}", "username") if user_id else "N/A"
+        username = rc.get_user_details(user_id)[0].get("username") if user_id else "N/A"
 
         for item in order_items:
             item['Quantity'] = int(item.get('Quantity', 0))